@@ -1,10 +1,21 @@
+import sys
+
+import numpy as np
 import pandas as pd
 import pulp
 import openpyxl
 
+from data_cache import read_excel_cached
+from encoding import build_encoding, encode_planting, solution_to_array
+from horizon import set_horizon, planning_years
+from param_store import build_param_store
+from solver import solve_pulp, format_solve_stats
+from sparse_model import (area_variable_layout, fixed_zero_mask, build_sparse_model, build_model_template,
+                          update_model_template, solve_sparse_model)
+
 # 读取数据
 def read_data():
-    sheet1 = pd.read_excel('datas/附件2.xlsx', sheet_name='2023年统计的相关数据')  # 土地类型上的亩产量数据
+    sheet1 = read_excel_cached('datas/附件2.xlsx', sheet_name='2023年统计的相关数据')  # 土地类型上的亩产量数据
     sheet1 = sheet1.dropna(subset=['地块类型']) # 删除底部说明
     sheet1['地块类型'] = sheet1['地块类型'].str.strip() # 去空格
     sheet1['作物名称'] = sheet1['作物名称'].str.strip() # 去空格
@@ -15,11 +26,11 @@ def read_data():
     smart_greenhouse['地块类型'] = '智慧大棚'
     sheet1 = pd.concat([sheet1, smart_greenhouse], ignore_index=True)
 
-    sheet2 = pd.read_excel('datas/附件2.xlsx', sheet_name='2023年的农作物种植情况')
+    sheet2 = read_excel_cached('datas/附件2.xlsx', sheet_name='2023年的农作物种植情况')
     sheet2 = sheet2.fillna(method='ffill')
     sheet2['作物名称'] = sheet2['作物名称'].str.strip() # 去空格
 
-    sheet3 = pd.read_excel('datas/附件1.xlsx', sheet_name='乡村的现有耕地')
+    sheet3 = read_excel_cached('datas/附件1.xlsx', sheet_name='乡村的现有耕地')
     sheet3['地块类型'] = sheet3['地块类型'].str.strip() # 去空格
 
     # 将 sheet2 和 sheet3 合并，得到每个地块的土地类型
@@ -66,23 +77,31 @@ def prepare_data(sheet_yield_and_price_2023, sheet_crop_planting_2023):
 
     return crops, fields
 
+# 某年的模型系数，PuLP 模型与稀疏矩阵模型共用
+def get_year_coefficients(params, enc, year):
+    coef = dict(params)
+    coef['beyond_price_ratio'] = 0.5  # 超过预期销售量的部分按半价售出
+    return coef
+
 # 创建单年模型
-def define_model(solved_decision_vars,sheet_crop_planting_2023,sheet_fields_name_and_area, fields, expected_sales_volume, year):
-    # 创建地块编号到地块类型的映射
-    field_type_mapping = sheet_fields_name_and_area.set_index('地块名称')['地块类型'].to_dict()
-    # 决策变量
+# solved_decision_vars: {年份: [地块, 作物, 季次] 面积数组}；planting_2023: 2023年种植面积数组
+def define_model(solved_decision_vars, planting_2023, enc, coef, year):
+    field_type_index = enc['field_type_index']
+    plots_of_type = enc['plots_of_type']
+    crops_of_type = enc['crops_of_type']
+    single, first, second = (enc['season_index'][name] for name in ['单季', '第一季', '第二季'])
+    smart_greenhouse = field_type_index['智慧大棚']
+    irrigated = field_type_index['水浇地']
+    # 决策变量：键为 (地块, 作物, 季次) 编码
+    # 剪枝：轮作历史（规则1.2、1.3）固定为 0 的组合不创建变量，地块类型不能种植的作物本来就不在 fields 中
+    fixed = fixed_zero_mask(enc, coef, solved_decision_vars, planting_2023, year)
+
     decision_vars = {}
-    for _, row in fields.iterrows():
-        field_type = row['地块类型']
-        crop_name = row['作物名称']
-        season = row['种植季次']
-        # 迭代所有地块编号，并检查是否匹配
-        for field_num, mapped_field_type in field_type_mapping.items():
-            if mapped_field_type == field_type:
-                    decision_vars[(field_num, field_type, crop_name, season, year)] = pulp.LpVariable(
-                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year}",
-                        lowBound=0, cat='Continuous'
-                    )
+    for f, c, s in enc['field_rows']:
+        for p in plots_of_type[f]:
+            if fixed[p, c, s]:
+                continue
+            decision_vars[(p, c, s)] = pulp.LpVariable(f"area_{p}_{c}_{s}_{year}", lowBound=0, cat='Continuous')
 
     model = pulp.LpProblem(f"Maximize_Revenue_{year}", pulp.LpMaximize)
 
@@ -90,55 +109,44 @@ def define_model(solved_decision_vars,sheet_crop_planting_2023,sheet_fields_name
     # 某种种植季次的产量和
 
     total_production = {}  # 分季总产量
-
-    for crop_name in fields['作物名称'].unique():
-        for season in fields[fields['作物名称'] == crop_name]['种植季次']:
-                total_production[(crop_name, season, year)] = pulp.lpSum(
-                    decision_vars.get((field_num, field_type, crop_name, season, year), 0)
-                        * fields[(fields['地块类型'] == field_type) &
-                                (fields['作物名称'] == crop_name) &
-                                (fields['种植季次'] == season)]['亩产量/斤'].values[0]
-                    for field_type in fields[(fields['作物名称']==crop_name) & (fields['种植季次'] == season)]['地块类型']
-                    for field_num,field_type_value in field_type_mapping.items()
-                    if field_type_mapping.get(field_num) == field_type
-                )
+    for c, s in enc['crop_season_pairs']:
+        total_production[(c, s)] = pulp.lpSum(
+            decision_vars.get((p, c, s), 0) * coef['yield'][f, c, s]
+            for f in np.flatnonzero(coef['valid'][:, c, s])
+            for p in plots_of_type[f]
+        )
 
     # 总种植成本
     total_cost = pulp.lpSum([
-        decision_vars[(field_num, row['地块类型'], row['作物名称'], row['种植季次'], year)] * row['种植成本/(元/亩)']
-        for _, row in fields.iterrows()
-        for field_num, mapped_field_type in field_type_mapping.items()
-        if mapped_field_type == row['地块类型']
+        decision_vars.get((p, c, s), 0) * coef['cost'][f, c, s]
+        for f, c, s in enc['field_rows']
+        for p in plots_of_type[f]
     ])
 
     # 新的一堆决策变量
     under_exp_sv = {}
     beyond_exp_sv = {}
-    for crop_name in fields['作物名称'].unique():
-        for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-            # 创建新的决策变量
-            under_exp_sv[(crop_name,season)] = pulp.LpVariable(f'under_exp_sv_{crop_name}_{season}', lowBound=0, cat='Continuous')
-            beyond_exp_sv[(crop_name,season)] = pulp.LpVariable(f'beyond_exp_sv_{crop_name}_{season}', lowBound=0, cat='Continuous')
-            exp_sv = expected_sales_volume[(expected_sales_volume['种植季次'] == season)&(expected_sales_volume['作物名称'] == crop_name)]['当季预期销售量'].values[0]
-
-            # 添加约束：对每个季节的每种作物都要添加
-            # TODO:未达预期销售量时，beyond为负数。对1.1无影响
-            model += under_exp_sv[(crop_name,season)] + beyond_exp_sv[(crop_name,season)] == total_production[(crop_name, season, year)]
-            model += under_exp_sv[(crop_name,season)] <= exp_sv
-            model += beyond_exp_sv[(crop_name,season)] >= 0
+    for c, s in enc['crop_season_pairs']:
+        # 创建新的决策变量
+        under_exp_sv[(c, s)] = pulp.LpVariable(f'under_exp_sv_{c}_{s}', lowBound=0, cat='Continuous')
+        beyond_exp_sv[(c, s)] = pulp.LpVariable(f'beyond_exp_sv_{c}_{s}', lowBound=0, cat='Continuous')
+        exp_sv = coef['expected_sales'][c, s]
+
+        # 添加约束：对每个季节的每种作物都要添加
+        # TODO:未达预期销售量时，beyond为负数。对1.1无影响
+        model += under_exp_sv[(c, s)] + beyond_exp_sv[(c, s)] == total_production[(c, s)]
+        model += under_exp_sv[(c, s)] <= exp_sv
+        model += beyond_exp_sv[(c, s)] >= 0
 
     # 总销售收益
     # 超过预期销售量的部分无法售出
     # TODO: 1.2修改处
+    # 与原写法一致：(作物, 季次) 在 fields 中每出现一行就累加一次
     total_revenue = pulp.lpSum([
-        (under_exp_sv[(crop_name, season)] +
-         beyond_exp_sv[(crop_name, season)] * 0.5)
-        * fields[
-            (fields['种植季次'] == season) &
-            (fields['作物名称'] == crop_name)
-            ]['销售单价/(元/斤)'].values[0]
-        for crop_name in fields['作物名称'].unique()
-        for season in fields[fields['作物名称'] == crop_name]['种植季次']
+        (under_exp_sv[(c, s)] +
+         beyond_exp_sv[(c, s)] * 0.5)
+        * coef['sale_price'][c, s]
+        for _, c, s in enc['field_rows']
     ]) - total_cost
 
     model += total_revenue, f"Total_Revenue_{year}"
@@ -146,136 +154,103 @@ def define_model(solved_decision_vars,sheet_crop_planting_2023,sheet_fields_name
     # 约束条件
     # 1. 每种作物在同一地块（含大棚）都不能连续重茬种植
     # 1.1 同一年的第一季、第二季。仅限于智慧大棚中全部作物。
-    smart_greenhouse_field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == '智慧大棚']['地块名称']
-    for field_num in smart_greenhouse_field_nums:
-        for crop_name in fields[fields['地块类型'] == '智慧大棚']['作物名称'].unique():
-            area_first_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第一季', year), 0)
-            area_second_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第二季', year), 0)
-            # 添加约束：保证至少有一个季节的种植面积为0
-            model += (area_first_season == 0 or area_second_season == 0)
+    # 0-1 变量 z=1 时只能种第一季，z=0 时只能种第二季，big-M 取地块面积
+    for p in plots_of_type[smart_greenhouse]:
+        area = enc['plot_area'][p]
+        for c in crops_of_type[smart_greenhouse]:
+            area_first_season = decision_vars.get((p, c, first))
+            area_second_season = decision_vars.get((p, c, second))
+            if area_first_season is None or area_second_season is None:
+                continue
+            first_season_only = pulp.LpVariable(f"first_season_only_{p}_{c}_{year}", cat='Binary')
+            model += area_first_season <= area * first_season_only
+            model += area_second_season <= area * (1 - first_season_only)
 
     # 1.2 单季作物的连续两年。仅限单季作物
-    for field_type in ['平旱地', '梯田', '山坡地', '水浇地']:
-        field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == field_type]['地块名称']
-        for field_num in field_nums:
-            for crop_name in fields[(fields['地块类型'] == field_type) & (fields['种植季次'] == '单季')]['作物名称'].unique():
-                if year == 2024:
-                    area_this_year = decision_vars.get((field_num, field_type, crop_name, '单季', year), 0)  # 水浇地中的非水稻作物这里返回0
-                    # 查找2023年对应地块对应作物的种植量
-                    filtered_data = sheet_crop_planting_2023[
-                        (sheet_crop_planting_2023['作物名称'] == crop_name) &
-                        (sheet_crop_planting_2023['种植地块'] == field_num)
-                        ]['种植面积/亩']
-
-                    if not filtered_data.empty:
-                        model += (area_this_year == 0)
-                else:
-                    area_last_year = solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_单季_{year - 1}")
-                    if area_last_year is not None and area_last_year > 0:
-                        area_this_year = decision_vars.get((field_num, field_type, crop_name, '单季', year), 0)
-                        model += (area_this_year == 0)
-
     # 1.3 上一年的第二季与下一年的第一季不能连续种植。仅需考虑智慧大棚中的作物
+    # 以上两条固定为 0 的组合已在创建决策变量时剪掉
 
-    for field_num in smart_greenhouse_field_nums:
-        for crop_name in fields[fields['地块类型'] == '智慧大棚']['作物名称'].unique():
-            if year == 2024:
-                area_this_first_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第一季', year), 0)
-                # 查找2023年对应地块对应作物的种植量
-                filtered_data = sheet_crop_planting_2023[
-                    (sheet_crop_planting_2023['作物名称'] == crop_name) &
-                    (sheet_crop_planting_2023['种植地块'] == field_num)
-                    ]['种植面积/亩']
-
-                if not filtered_data.empty:
-                    model += (area_this_first_season == 0)
-
-            else:
-                area_last_second_season = solved_decision_vars.get(f"area_{field_num}_智慧大棚_{crop_name}_第二季_{year - 1}")
-                if area_last_second_season is not None and area_last_second_season > 0:
-                    area_this_first_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第一季', year), 0)
-                    model += (area_this_first_season == 0)
-
-
-    # 2. 每个地块（含大棚）的所有土地三年内至少种植一次豆类作物
-    if year != 2024:
+    # 2. 每个地块（含大棚）的所有土地三年内至少种植一次豆类作物（起始年只知道一年历史，不添加）
+    if year - 1 in solved_decision_vars:
         bean_crops = ['黄豆', '黑豆','红豆','绿豆','爬豆','豇豆','刀豆','芸豆']  # 豆类作物名称
-        for field_type in['平旱地', '梯田', '山坡地', '水浇地','普通大棚','智慧大棚']:
-                field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == field_type]['地块名称']
-                for field_num in field_nums:
-                    # 前两年该地块上的豆类产量
-                    bean_volume_in_last_2year = 0
-                    if year == 2025:
-                        for crop_name in bean_crops:
-                            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-                                if solved_decision_vars.get(
-                                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}") is not None:
-                                    bean_volume_in_last_2year += solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}")
-
-                                filtered_data = sheet_crop_planting_2023[
-                                    (sheet_crop_planting_2023['作物名称'] == crop_name) &
-                                    (sheet_crop_planting_2023['种植地块'] == field_num)
-                                    ]['种植面积/亩']
-                                if not filtered_data.empty:
-                                    bean_volume_in_last_2year += filtered_data.values[0]
-
-                    elif year > 2025:
-                        for crop_name in bean_crops:
-                            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-                                if solved_decision_vars.get(
-                                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}") is not None:
-                                    bean_volume_in_last_2year += solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}")
-                                if solved_decision_vars.get(
-                                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 2}") is not None:
-                                    bean_volume_in_last_2year += solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 2}")
-                    if bean_volume_in_last_2year == 0:
-                        model += pulp.lpSum([
-                            decision_vars.get((field_num,field_type, crop_name, season ,year), 0)
-                            for crop_name in bean_crops
-                            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique()
-                        ]) >= 0.06
+        bean_codes = [enc['crop_index'][crop_name] for crop_name in bean_crops if crop_name in enc['crop_index']]
+        for f in [field_type_index[name] for name in ['平旱地', '梯田', '山坡地', '水浇地', '普通大棚', '智慧大棚']]:
+            for p in plots_of_type[f]:
+                # 前两年该地块上的豆类种植面积
+                bean_volume_in_last_2year = solved_decision_vars[year - 1][p, bean_codes].sum()
+                bean_volume_in_last_2year += solved_decision_vars.get(year - 2, planting_2023)[p, bean_codes].sum()
+                if bean_volume_in_last_2year == 0:
+                    model += pulp.lpSum([
+                        decision_vars.get((p, c, s), 0)
+                        for c in bean_codes
+                        for s in enc['crop_seasons'][c]
+                    ]) >= 0.06
 
     # 4. 某地块某季节的种植总面积小于该地块面积
-    for season in ['第一季', '第二季','单季']:
-        for field_type in fields['地块类型'].unique():
-            field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == field_type]['地块名称']
-            for field_num in field_nums:
-                    area_of_this_fields = sheet_fields_name_and_area[sheet_fields_name_and_area['地块名称']==field_num]['地块面积/亩']
-                    model += (pulp.lpSum([
-                                decision_vars.get((field_num, field_type, crop_name, season, year), 0)
-                                for crop_name in fields[fields['地块类型'] == field_type]['作物名称'].unique()
-                            ]) <= area_of_this_fields)
+    for s in [first, second, single]:
+        for f in range(len(enc['field_types'])):
+            for p in plots_of_type[f]:
+                model += (pulp.lpSum([
+                    decision_vars.get((p, c, s), 0)
+                    for c in crops_of_type[f]
+                ]) <= enc['plot_area'][p])
 
     # 5. 水浇地单季（只有水稻）与双季不能共存
-    field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == '水浇地']['地块名称']
-    for field_num in field_nums:
-        sjd_single_area = decision_vars.get((field_num, '水浇地', '水稻', '单季', year), 0)
-        for crop_name in fields[(fields['地块类型'] == '水浇地')&(fields['种植季次'] != '单季')]['作物名称'].unique():
-            sjd_first_area = decision_vars.get((field_num,'水浇地', crop_name, '第一季', year),0)
-            sjd_second_area = decision_vars.get((field_num,'水浇地', crop_name, '第二季', year),0)
-            model += (sjd_single_area == 0 or (sjd_first_area == 0 and sjd_second_area == 0))
+    # 0-1 变量 w=1 时只能种单季水稻，w=0 时只能种双季作物，big-M 取地块面积
+    rice = enc['crop_index']['水稻']
+    for p in plots_of_type[irrigated]:
+        sjd_single_area = decision_vars.get((p, rice, single))
+        if sjd_single_area is None:
+            continue
+        area = enc['plot_area'][p]
+        single_season_only = pulp.LpVariable(f"single_season_only_{p}_{year}", cat='Binary')
+        model += sjd_single_area <= area * single_season_only
+        for s in [first, second]:
+            model += pulp.lpSum([
+                decision_vars.get((p, c, s), 0)
+                for c in crops_of_type[irrigated]
+            ]) <= area * (1 - single_season_only)
 
     return model, decision_vars
 
 
-# 求解模型
-def solve_model(model):
-    model.solve()
+# 求解模型（CBC），solver_options 见 solver.solve_pulp：time_limit、mip_gap、threads、verbose
+def solve_model(model, **solver_options):
+    solve_pulp(model, **solver_options)
     return model
 
 
-# 保存结果到Excel
-def save_results(decision_vars,results,year):
-    for var in decision_vars.values():
+# 求解单年模型，backend 为 'pulp'（参考实现）、'sparse'（稀疏矩阵 + 进程内 HiGHS）
+# 或 'template'（复用只建一次的模型模板，仅更新系数、上下界与右端项）
+# solver_options 为每次求解的 time_limit、mip_gap、threads、verbose
+# 返回 [地块, 作物, 季次] 面积数组、面积变量键列表与年利润
+def solve_year(solved_decision_vars, planting_2023, enc, coef, year, backend='pulp', template=None, **solver_options):
+    if backend in ('sparse', 'template'):
+        if backend == 'template':
+            sparse_model = update_model_template(template or build_model_template(enc), enc, coef,
+                                                 solved_decision_vars, planting_2023, year)
+        else:
+            sparse_model = build_sparse_model(enc, coef, solved_decision_vars, planting_2023, year)
+        solution, objective_value = solve_sparse_model(sparse_model, enc, **solver_options)
+        return solution, sparse_model['area_keys'], objective_value
+    model, decision_vars = define_model(solved_decision_vars, planting_2023, enc, coef, year)
+    solve_model(model, **solver_options)
+    # 面积变量键列表包含剪掉的组合，输出结果中这些组合的面积为 0
+    return solution_to_array(enc, decision_vars), area_variable_layout(enc)[0], pulp.value(model.objective)
+
+
+# 保存结果到Excel（仅在此处把编码解码为名称）
+def save_results(solution, area_keys, results, year, enc):
+    for p, c, s in area_keys:
         results.append({
-            '地块名称': var.name.split('_')[1],
-            '地块类型': var.name.split('_')[2],
-            '作物名称': var.name.split('_')[3],
-            '季次': var.name.split('_')[4],
-            '年份': var.name.split('_')[5],
-            '种植面积': var.varValue
+            '地块名称': enc['plots'][p],
+            '地块类型': enc['field_types'][enc['plot_type'][p]],
+            '作物名称': enc['crops'][c],
+            '季次': enc['seasons'][s],
+            '年份': str(year),
+            '种植面积': solution[p, c, s]
         })
-    if year == 2030:
+    if year == planning_years()[-1]:
         result_df = pd.DataFrame(results)
         result_df.to_excel("my_result1_2.xlsx", index=False)
 
@@ -390,36 +365,45 @@ def process_file(my_result_file, cache_files, attachment_file):
 
 
 
-# 主流程
-def main():
+# 读取并编码输入数据
+def load_inputs():
     sheet_yield_and_price_2023, sheet_crop_planting_2023, sheet_fields_name_and_area, expected_sales_volume = read_data()
     crops, fields = prepare_data(sheet_yield_and_price_2023, sheet_crop_planting_2023)
-    print(crops, fields)
-    expected_sales_volume_1 = pd.read_excel('datas/预期每季销售量（补充版）.xlsx')
+    expected_sales_volume_1 = read_excel_cached('datas/预期每季销售量（补充版）.xlsx')
     expected_sales_volume_1['作物名称'] = expected_sales_volume_1['作物名称'].str.strip() # 去空格
+    enc = build_encoding(sheet_fields_name_and_area, fields)  # 编码
+    params = build_param_store(enc, fields, expected_sales_volume_1)  # 参数仓库
+    planting_2023 = encode_planting(enc, sheet_crop_planting_2023)  # 2023年种植情况
+    return enc, params, planting_2023
+
 
-    models = {}
-    solved_decision_vars = {}   #已求解的decision_vars
+# 主流程：规划自 start_year（默认基准年 base_year 的下一年）起的 num_years 年
+def main(backend='template', base_year=2023, start_year=None, num_years=7, **solver_options):
+    set_horizon(base_year, start_year, num_years)
+    enc, params, planting_2023 = load_inputs()
+    template = build_model_template(enc)   # 模型结构只建一次，各年只更新系数
+
+    solved_decision_vars = {}   #已求解的种植面积 {年份: [地块, 作物, 季次]}
     results = []
-    for year in range(2024,2031):
-        model, decision_vars = define_model(solved_decision_vars,sheet_crop_planting_2023, sheet_fields_name_and_area, fields, expected_sales_volume_1,year)
-        models[year] = solve_model(model)   #求解
-        save_results(decision_vars,results,year)
-
-        # 遍历决策变量并存储它们的值
-        for key, var in decision_vars.items():
-            field_num, field_type, crop_name, season, _ = key
-            var_name = f"area_{field_num}_{field_type}_{crop_name}_{season}_{year}"
-            solved_decision_vars[var_name] = pulp.value(var)
-            # 示例调用，每组文件逐个处理
+    for year in planning_years():
+        coef = get_year_coefficients(params, enc, year)
+        solution, area_keys, objective_value = solve_year(solved_decision_vars, planting_2023, enc, coef, year, backend, template, **solver_options)   #求解
+        save_results(solution, area_keys, results, year, enc)
+
+        # 存储本年的种植面积
+        solved_decision_vars[year] = solution
         # 输出年利润
-        objective_value = pulp.value(models[year].objective)
         print(f"{year}年利润: {objective_value}")
+        if backend == 'template':
+            print(f"{year}年求解: {format_solve_stats(template['warm_start']['log'][-1])}")
 
     process_file('my_result1_2.xlsx', ('datas/缓存-result1_2（空白）.xlsx', 'datas/缓存-result1_2.xlsx'),
                          'datas/附件3-result1_2.xlsx')
 
 
 
+# 用法: python Q_1_2.py [规划年数，默认 7] [起始年，默认基准年的下一年] [基准年，默认 2023]
 if __name__ == "__main__":
-    main()
+    main(num_years=int(sys.argv[1]) if len(sys.argv) > 1 else 7,
+         start_year=int(sys.argv[2]) if len(sys.argv) > 2 else None,
+         base_year=int(sys.argv[3]) if len(sys.argv) > 3 else 2023)
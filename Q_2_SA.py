@@ -1,7 +1,9 @@
 import numpy as np
 
+from random_streams import stream_rng, search_stream
 
-def simulated_annealing(initial_solution, initial_temperature, alpha, min_temperature, max_iterations):
+
+def simulated_annealing(initial_solution, initial_temperature, alpha, min_temperature, max_iterations, rng):
     current_solution = initial_solution
     current_value = objective_function(current_solution)
     best_solution = current_solution
@@ -11,7 +13,7 @@ def simulated_annealing(initial_solution, initial_temperature, alpha, min_temper
 
     for iteration in range(max_iterations):
         # Generate a neighboring solution
-        neighbor_solution = generate_neighbor(current_solution)
+        neighbor_solution = generate_neighbor(current_solution, rng)
         neighbor_value = objective_function(neighbor_solution)
 
         # Determine if we should accept the neighbor solution
@@ -20,7 +22,7 @@ def simulated_annealing(initial_solution, initial_temperature, alpha, min_temper
             current_value = neighbor_value
         else:
             probability = np.exp((neighbor_value - current_value) / T)
-            if np.random.rand() < probability:
+            if rng.random() < probability:
                 current_solution = neighbor_solution
                 current_value = neighbor_value
 
@@ -45,21 +47,24 @@ def objective_function(solution):
     return np.sum(solution)  # Placeholder
 
 
-def generate_neighbor(solution):
+def generate_neighbor(solution, rng):
     # Define your neighbor generation strategy here
     new_solution = solution.copy()
-    index = np.random.randint(len(solution))
-    new_solution[index] += np.random.uniform(-1, 1)  # Perturb the solution
+    index = rng.integers(len(solution))
+    new_solution[index] += rng.uniform(-1, 1)  # Perturb the solution
     return new_solution
 
 
-initial_solution = np.random.uniform(0.9, 1.1, size=10)
+master_seed = 0  # Master seed of the random streams (same seed, same result)
+rng = stream_rng(master_seed, search_stream)
+initial_solution = rng.uniform(0.9, 1.1, size=10)
 best_solution, best_value = simulated_annealing(
     initial_solution,
     initial_temperature=100,
     alpha=0.95,
     min_temperature=1e-5,
-    max_iterations=1000
+    max_iterations=1000,
+    rng=rng
 )
 
 print(f"Best solution: {best_solution}")
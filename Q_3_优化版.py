@@ -1,17 +1,40 @@
+import heapq
+import os
+import sys
+import time
+
 import numpy as np
 import pandas as pd
 import pulp
 import openpyxl
 
-sales_volume_fluctuation = {}   # 销售量波动
-yield_fluctuation = {}  # 亩产量波动
-cost_fluctuation = {}   # 成本波动
-price_fluctuation = {}  # 价格波动
+from data_cache import read_excel_cached
+from encoding import build_encoding, encode_planting, solution_to_array
+from experiment_runner import (iter_experiments, resolve_experiment, worker_state, profit_stat_columns,
+                               adaptive_stop_reason, design_block_sizes)
+from horizon import set_horizon, planning_years
+from online_stats import new_aggregator, merge_aggregators, aggregator_summary
+from param_store import build_param_store
+from random_streams import set_stream, current_rng, stream_rng, inputs_stream, scenario_set_stream
+from plan_evaluator import plan_from_solutions
+from result_stream import open_stream, stream_write, close_stream, read_stream, profit_columns, plan_columns
+from robustness import experiment_robustness_matrix, summarize_plans, select_plan
+from rolling_horizon import rolling_horizon, format_window_log
+from saa_model import (build_saa_model, solve_saa_model, scenario_arrays, evaluate_first_stage, add_cvar,
+                       set_risk_weight, weighted_cvar, risk_sweep)
+from scenario_engine import draw_scenarios, market_effect_matrices, apply_market_effects, apply_year_rates
+from scenario_reduction import reduce_scenarios
+from solver import solve_pulp, format_solve_stats
+from sparse_model import (area_variable_layout, fixed_zero_mask, build_sparse_model, build_model_template,
+                          update_model_template, solve_sparse_model)
+
+excel_max_rows = 1048576   # Excel 工作表行数上限（含表头）
+scenario = {}    # 当前情景：施加市场效应后各年的销售量、亩产量、价格变化率 [年份, 作物季次对] 与成本变化率 [年份]
 elasticity_coefficient_demand = {'粮食':0.25,'粮食（豆类）':0.25,'蔬菜':0.5,'蔬菜（豆类）':0.5,'食用菌':0.9} # 需求弹性系数
 crop_complementarity_coefficient = {'粮食':0.67,'蔬菜':0.4,'食用菌':0.2} # 与豆类的作物互补性系数
 crop_substitutability_coefficient = {'粮食':0.76,'粮食（豆类）':0.25,'蔬菜':0.55,'蔬菜（豆类）':0.35,'食用菌':0.6} # 同种类型作物之间替代性系数
 bean_crops = ['黄豆', '黑豆', '红豆', '绿豆', '爬豆', '豇豆', '刀豆', '芸豆']  # 豆类作物名称
-sheet_crops = pd.read_excel('datas/附件1.xlsx', sheet_name='乡村种植的农作物')
+sheet_crops = read_excel_cached('datas/附件1.xlsx', sheet_name='乡村种植的农作物')
 sheet_crops['作物名称'] = sheet_crops['作物名称'].str.strip()  # 去空格
 sheet_crops['作物类型'] = sheet_crops['作物类型'].str.strip()  # 去空格
 
@@ -20,97 +43,35 @@ def get_crop_type(crop_name):
     crop_type = sheet_crops[(sheet_crops['作物名称'] == crop_name)]['作物类型'].values[0]
     return crop_type
 #不确定性处理
-# 销售量变化率（相对2023）
-def generate_sales_volume_rate(season, crop_name, year):
-    power = year - 2023
-    sales_volume_fluctuation[(season, crop_name, year)] = 1
-    while power > 0:
-        power -= 1
-        if crop_name == '玉米' or crop_name == '小麦':   #玉米或小麦
-            growth_rate = np.random.uniform(0.05,0.1)
-        else:
-            growth_rate = np.random.uniform(-0.05, 0.05)
-        sales_volume_fluctuation[(season,crop_name,year)] *= (1 + growth_rate)
-    return sales_volume_fluctuation[(season,crop_name,year)]
-
-# 亩产量变化率
-def generate_yield_rate(season,crop_name,year):
-    power = year - 2023
-    yield_fluctuation[(season, crop_name, year)] = 1
-    while power > 0:
-        yield_fluctuation[(season,crop_name,year)] *= np.random.uniform(0.9, 1.1)
-        power -= 1
-    return yield_fluctuation[(season,crop_name,year)]
-
-# 种植成本变化率
-def generate_cost_rate(year):
-    cost_fluctuation[year] = 1 + 0.05*(year - 2023)
-    return cost_fluctuation[year]
-
-# 销售价格变化率
-def generate_price_rate(season,crop_name,year):
-    power = year - 2023
-    price_fluctuation[(season, crop_name, year)] = 1
-    crop_type = get_crop_type(crop_name)
-
-    if crop_type == '蔬菜' or crop_type == '蔬菜（豆类）':
-        price_fluctuation[(season, crop_name, year)] = ((1 + 0.05) ** power)
-    elif crop_name == '羊肚菌':
-        price_fluctuation[(season, crop_name, year)] = ((1 - 0.05) ** power)
-    elif crop_type == '食用菌':
-        while power > 0 :
-            price_fluctuation[(season, crop_name, year)] *= (1 - np.random.uniform(0.01, 0.05))
-            power -= 1
-    return price_fluctuation[(season, crop_name, year)]
-
-# 生成上述四个变化率
-def generate_all_rates(season,crop_name,year):
-    generate_sales_volume_rate(season, crop_name, year)
-    generate_yield_rate(season, crop_name, year)
-    generate_cost_rate(year)
-    generate_price_rate(season, crop_name, year)
-
-# 获取最终的销售量
-# 需要考虑本作物的价格波动，TODO:替代性
-def get_final_sales_volume(sales_volume_2023,season, crop_name, year):
-    final_sales_volume = sales_volume_fluctuation[(season, crop_name, year)] * sales_volume_2023
-    crop_type = get_crop_type(crop_name)
-    # 本作物价格波动影响
-    final_sales_volume *= (1 + price_fluctuation[(season, crop_name, year)]
-                           * elasticity_coefficient_demand[crop_type])
-    # 同种类型的其他作物价格波动影响（替代性）
-    for crop in sheet_crops[sheet_crops['作物类型'] == crop_type]['作物名称']:
-        if crop!= crop_name and price_fluctuation.get((season, crop, year)) is not None:
-            final_sales_volume *= (1 + price_fluctuation[(season, crop, year)]
-                                * crop_substitutability_coefficient[crop_type])
-
-    return final_sales_volume
-
-# 获取最终的亩产量
-# TODO: 考虑与豆类的互补性
-def get_final_yield(yield_2023, season, crop_name, year):
-    final_yield = yield_fluctuation[(season, crop_name, year)] * yield_2023
-    crop_type = get_crop_type(crop_name)
-    if crop_type == '粮食' or crop_type == '蔬菜' or crop_type == '食用菌':
-        for bean_name in bean_crops:
-            if yield_fluctuation.get((season, bean_name, year)) is not None:
-                final_yield *= (1 + crop_complementarity_coefficient[crop_type]
-                                * yield_fluctuation[(season, bean_name, year)])
-    return final_yield
-
-# 获取最终的种植成本
-def get_final_cost(cost_2023, year):
-    final_cost = cost_fluctuation[year] * cost_2023
-    return final_cost
-
-# 获取最终的销售价格
-def get_final_price(price_2023,season, crop_name, year):
-    final_price = price_fluctuation[(season, crop_name, year)] * price_2023
-    return final_price
+# 作物类型与市场效应矩阵（需求弹性、替代性、互补性），第一次调用时建立
+def get_market_effects(enc):
+    if 'effects' not in scenario:
+        scenario['crop_types'] = [get_crop_type(crop_name) for crop_name in enc['crops']]
+        scenario['effects'] = market_effect_matrices(enc, scenario['crop_types'], elasticity_coefficient_demand,
+                                                     crop_substitutability_coefficient,
+                                                     crop_complementarity_coefficient, bean_crops)
+    return scenario['crop_types'], scenario['effects']
+
+# 一次生成 num_scenarios 个情景：由情景引擎向量化抽样（sampling 见 scenario_engine），再对整个情景张量施加市场效应（矩阵运算）
+# 返回 {'years', 'sales', 'yield', 'price': [情景, 年份, 作物季次对], 'cost': [年份]}
+def draw_market_scenarios(enc, num_scenarios, rng, sampling='random'):
+    crop_types, effects = get_market_effects(enc)
+    drawn = draw_scenarios(enc, crop_types, num_scenarios, rng, dtype=np.float64, sampling=sampling)
+    drawn['sales'], drawn['yield'] = apply_market_effects(effects, drawn['sales'], drawn['yield'], drawn['price'])
+    return drawn
+
+# 把 draw_market_scenarios 生成的第 k 个情景作为当前情景
+def set_scenario(drawn, k):
+    scenario.update({'years': drawn['years'], 'sales': drawn['sales'][k], 'yield': drawn['yield'][k],
+                     'price': drawn['price'][k], 'cost': drawn['cost']})
+
+# 按实验生成一个情景，作为当前情景
+def draw_scenario(enc, rng):
+    set_scenario(draw_market_scenarios(enc, 1, rng), 0)
 
 # 读取数据
 def read_data():
-    sheet1 = pd.read_excel('datas/附件2.xlsx', sheet_name='2023年统计的相关数据')  # 土地类型上的亩产量数据
+    sheet1 = read_excel_cached('datas/附件2.xlsx', sheet_name='2023年统计的相关数据')  # 土地类型上的亩产量数据
     sheet1 = sheet1.dropna(subset=['地块类型']) # 删除底部说明
     sheet1['地块类型'] = sheet1['地块类型'].str.strip() # 去空格
     sheet1['作物名称'] = sheet1['作物名称'].str.strip() # 去空格
@@ -121,11 +82,11 @@ def read_data():
     smart_greenhouse['地块类型'] = '智慧大棚'
     sheet1 = pd.concat([sheet1, smart_greenhouse], ignore_index=True)
 
-    sheet2 = pd.read_excel('datas/附件2.xlsx', sheet_name='2023年的农作物种植情况')
+    sheet2 = read_excel_cached('datas/附件2.xlsx', sheet_name='2023年的农作物种植情况')
     sheet2 = sheet2.fillna(method='ffill')
     sheet2['作物名称'] = sheet2['作物名称'].str.strip() # 去空格
 
-    sheet3 = pd.read_excel('datas/附件1.xlsx', sheet_name='乡村的现有耕地')
+    sheet3 = read_excel_cached('datas/附件1.xlsx', sheet_name='乡村的现有耕地')
     sheet3['地块类型'] = sheet3['地块类型'].str.strip() # 去空格
 
     # 将 sheet2 和 sheet3 合并，得到每个地块的土地类型
@@ -170,87 +131,84 @@ def prepare_data(sheet_yield_and_price_2023, sheet_crop_planting_2023):
     fields = sheet_yield_and_price_2023[['地块类型', '作物名称', '种植季次', '亩产量/斤', '种植成本/(元/亩)', '销售单价/(元/斤)']]
     fields.to_excel('平均销售单价.xlsx', index=False)
 
-    #生成波动率
-    for year in range(2024,2031):
-        for crop_name in fields['作物名称'].unique():
-            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-                generate_all_rates(season, crop_name, year)
-
     return crops, fields
 
+# 某年的模型系数（亩产量、成本、预期销售量、销售价格均加入当前情景的波动），PuLP 模型与稀疏矩阵模型共用
+def get_year_coefficients(params, enc, year):
+    y = scenario['years'].index(year)
+    coef = apply_year_rates(params, enc, scenario['sales'][y], scenario['yield'][y], scenario['price'][y], scenario['cost'][y])
+    coef['beyond_price_ratio'] = 0.5  # 超过预期销售量的部分按半价售出
+    return coef
+
+# 第 k 个情景某年的模型系数（SAA 模式用）
+def get_scenario_coefficients(params, enc, scenarios, k, year):
+    y = scenarios['years'].index(year)
+    coef = apply_year_rates(params, enc, scenarios['sales'][k, y], scenarios['yield'][k, y],
+                            scenarios['price'][k, y], scenarios['cost'][y])
+    coef['beyond_price_ratio'] = 0.5  # 超过预期销售量的部分按半价售出
+    return coef
+
 # 创建单年模型
-def define_model(solved_decision_vars,sheet_crop_planting_2023,sheet_fields_name_and_area, fields, expected_sales_volume, year):
-    # 创建地块编号到地块类型的映射
-    field_type_mapping = sheet_fields_name_and_area.set_index('地块名称')['地块类型'].to_dict()
-    # 决策变量：地块上某种作物在某年某季度的种植面积
+# solved_decision_vars: {年份: [地块, 作物, 季次] 面积数组}；planting_2023: 2023年种植面积数组
+def define_model(solved_decision_vars, planting_2023, enc, coef, year):
+    field_type_index = enc['field_type_index']
+    plots_of_type = enc['plots_of_type']
+    crops_of_type = enc['crops_of_type']
+    single, first, second = (enc['season_index'][name] for name in ['单季', '第一季', '第二季'])
+    smart_greenhouse = field_type_index['智慧大棚']
+    irrigated = field_type_index['水浇地']
+    # 决策变量：地块上某种作物在某年某季度的种植面积，键为 (地块, 作物, 季次) 编码
+    # 剪枝：轮作历史（规则1.2、1.3）固定为 0 的组合不创建变量，地块类型不能种植的作物本来就不在 fields 中
+    fixed = fixed_zero_mask(enc, coef, solved_decision_vars, planting_2023, year)
+
     decision_vars = {}
-    for _, row in fields.iterrows():
-        field_type = row['地块类型']
-        crop_name = row['作物名称']
-        season = row['种植季次']
-        # 迭代所有地块编号，并检查是否匹配
-        for field_num, mapped_field_type in field_type_mapping.items():
-            if mapped_field_type == field_type:
-                    decision_vars[(field_num, field_type, crop_name, season, year)] = pulp.LpVariable(
-                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year}",
-                        lowBound=0, cat='Continuous'
-                    )
+    for f, c, s in enc['field_rows']:
+        for p in plots_of_type[f]:
+            if fixed[p, c, s]:
+                continue
+            decision_vars[(p, c, s)] = pulp.LpVariable(f"area_{p}_{c}_{s}_{year}", lowBound=0, cat='Continuous')
 
     model = pulp.LpProblem(f"Maximize_Revenue_{year}", pulp.LpMaximize)
 
     # 目标函数：最大化该年的收益
     # 某种作物在一个种植季次的产量和
     total_production = {}  # 分季总产量
-    for crop_name in fields['作物名称'].unique():
-        for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-                total_production[(crop_name, season, year)] = pulp.lpSum(
-                    decision_vars.get((field_num, field_type, crop_name, season, year), 0)
-                        * get_final_yield(fields[(fields['地块类型'] == field_type) &
-                                (fields['作物名称'] == crop_name) &
-                                (fields['种植季次'] == season)]['亩产量/斤'].values[0],season,crop_name,year)
-                    for field_type in fields[(fields['作物名称']==crop_name) & (fields['种植季次'] == season)]['地块类型']
-                    for field_num,field_type_value in field_type_mapping.items()
-                    if field_type_mapping.get(field_num) == field_type
-                ) # 种植面积 * 亩产量
+    for c, s in enc['crop_season_pairs']:
+        total_production[(c, s)] = pulp.lpSum(
+            decision_vars.get((p, c, s), 0) * coef['yield'][f, c, s]
+            for f in np.flatnonzero(coef['valid'][:, c, s])
+            for p in plots_of_type[f]
+        ) # 种植面积 * 亩产量
 
     # 总种植成本
     total_cost = pulp.lpSum([
-        decision_vars[(field_num, row['地块类型'], row['作物名称'], row['种植季次'], year)]
-        * get_final_cost(row['种植成本/(元/亩)'],year)
-        for _, row in fields.iterrows()
-        for field_num, mapped_field_type in field_type_mapping.items()
-        if mapped_field_type == row['地块类型']
+        decision_vars.get((p, c, s), 0) * coef['cost'][f, c, s]
+        for f, c, s in enc['field_rows']
+        for p in plots_of_type[f]
     ]) # 种植面积 * 单位成本
 
     # 决策变量：超出预期销售量与未超出的部分
     under_exp_sv = {}
     beyond_exp_sv = {}
-    for crop_name in fields['作物名称'].unique():
-        for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-            # 创建新的决策变量
-            under_exp_sv[(crop_name,season)] = pulp.LpVariable(f'under_exp_sv_{crop_name}_{season}', lowBound=0, cat='Continuous')
-            beyond_exp_sv[(crop_name,season)] = pulp.LpVariable(f'beyond_exp_sv_{crop_name}_{season}', lowBound=0, cat='Continuous')
-            exp_sv = get_final_sales_volume(expected_sales_volume[
-                                                (expected_sales_volume['种植季次'] == season)
-                                                &(expected_sales_volume['作物名称'] == crop_name)]['当季预期销售量'].values[0],
-                                            season,crop_name,year)
-
-            # 添加约束，以满足超出/未超出的定义
-            model += under_exp_sv[(crop_name,season)] + beyond_exp_sv[(crop_name,season)] == total_production[(crop_name, season, year)]
-            model += under_exp_sv[(crop_name,season)] <= exp_sv
-            model += beyond_exp_sv[(crop_name,season)] >= 0
+    for c, s in enc['crop_season_pairs']:
+        # 创建新的决策变量
+        under_exp_sv[(c, s)] = pulp.LpVariable(f'under_exp_sv_{c}_{s}', lowBound=0, cat='Continuous')
+        beyond_exp_sv[(c, s)] = pulp.LpVariable(f'beyond_exp_sv_{c}_{s}', lowBound=0, cat='Continuous')
+        exp_sv = coef['expected_sales'][c, s]
+
+        # 添加约束，以满足超出/未超出的定义
+        model += under_exp_sv[(c, s)] + beyond_exp_sv[(c, s)] == total_production[(c, s)]
+        model += under_exp_sv[(c, s)] <= exp_sv
+        model += beyond_exp_sv[(c, s)] >= 0
 
     # 总销售收益
     # 超过预期销售量的部分无法售出
+    # 与原写法一致：(作物, 季次) 在 fields 中每出现一行就累加一次
     total_revenue = pulp.lpSum([
-        (under_exp_sv[(crop_name, season)] +
-         beyond_exp_sv[(crop_name, season)] * 0.5)
-        * get_final_price(fields[
-            (fields['种植季次'] == season) &
-            (fields['作物名称'] == crop_name)
-            ]['销售单价/(元/斤)'].values[0],season,crop_name,year)
-        for crop_name in fields['作物名称'].unique()
-        for season in fields[fields['作物名称'] == crop_name]['种植季次']
+        (under_exp_sv[(c, s)] +
+         beyond_exp_sv[(c, s)] * 0.5)
+        * coef['sale_price'][c, s]
+        for _, c, s in enc['field_rows']
     ]) - total_cost     # 销售额 - 总成本
 
     model += total_revenue, f"Total_Revenue_{year}"     # 设置总销售利润为目标函数
@@ -258,134 +216,102 @@ def define_model(solved_decision_vars,sheet_crop_planting_2023,sheet_fields_name
     # 约束条件
     # 1. 每种作物在同一地块（含大棚）都不能连续重茬种植
     # 1.1 同一年的第一季、第二季。仅限于智慧大棚中全部作物。
-    smart_greenhouse_field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == '智慧大棚']['地块名称']
-    for field_num in smart_greenhouse_field_nums:
-        for crop_name in fields[fields['地块类型'] == '智慧大棚']['作物名称'].unique():
-            area_first_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第一季', year), 0)
-            area_second_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第二季', year), 0)
-            # 添加约束：保证至少有一个季节的种植面积为0
-            model += (area_first_season == 0 or area_second_season == 0)
+    # 0-1 变量 z=1 时只能种第一季，z=0 时只能种第二季，big-M 取地块面积
+    for p in plots_of_type[smart_greenhouse]:
+        area = enc['plot_area'][p]
+        for c in crops_of_type[smart_greenhouse]:
+            area_first_season = decision_vars.get((p, c, first))
+            area_second_season = decision_vars.get((p, c, second))
+            if area_first_season is None or area_second_season is None:
+                continue
+            first_season_only = pulp.LpVariable(f"first_season_only_{p}_{c}_{year}", cat='Binary')
+            model += area_first_season <= area * first_season_only
+            model += area_second_season <= area * (1 - first_season_only)
 
     # 1.2 单季作物的连续两年。仅限单季作物
-    for field_type in ['平旱地', '梯田', '山坡地', '水浇地']:
-        field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == field_type]['地块名称']
-        for field_num in field_nums:
-            for crop_name in fields[(fields['地块类型'] == field_type) & (fields['种植季次'] == '单季')]['作物名称'].unique():
-                if year == 2024:
-                    area_this_year = decision_vars.get((field_num, field_type, crop_name, '单季', year), 0)  # 本年度的种植面积
-                    filtered_data = sheet_crop_planting_2023[
-                        (sheet_crop_planting_2023['作物名称'] == crop_name) &
-                        (sheet_crop_planting_2023['种植地块'] == field_num)
-                        ]['种植面积/亩']     # 2023年对应地块对应作物的种植面积
-
-                    if not filtered_data.empty:
-                        model += (area_this_year == 0)
-                else:
-                    area_last_year = solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_单季_{year - 1}")
-                    if area_last_year is not None and area_last_year > 0:   # 若上一年有种植
-                        area_this_year = decision_vars.get((field_num, field_type, crop_name, '单季', year), 0)
-                        model += (area_this_year == 0)  # 则添加约束：本年度无法种植
-
     # 1.3 上一年的第二季与下一年的第一季不能连续种植。仅需考虑智慧大棚中的作物
-    for field_num in smart_greenhouse_field_nums:
-        for crop_name in fields[fields['地块类型'] == '智慧大棚']['作物名称'].unique():
-            if year == 2024:
-                area_this_first_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第一季', year), 0)
-                # 查找2023年对应地块对应作物的种植量
-                filtered_data = sheet_crop_planting_2023[
-                    (sheet_crop_planting_2023['作物名称'] == crop_name) &
-                    (sheet_crop_planting_2023['种植地块'] == field_num)
-                    ]['种植面积/亩']
-
-                if not filtered_data.empty:
-                    model += (area_this_first_season == 0)
-
-            else:
-                area_last_second_season = solved_decision_vars.get(f"area_{field_num}_智慧大棚_{crop_name}_第二季_{year - 1}")
-                if area_last_second_season is not None and area_last_second_season > 0:
-                    area_this_first_season = decision_vars.get((field_num, '智慧大棚', crop_name, '第一季', year), 0)
-                    model += (area_this_first_season == 0)
-
-
-    # 2. 每个地块（含大棚）的所有土地三年内至少种植一次豆类作物
-    if year != 2024:
-        for field_type in['平旱地', '梯田', '山坡地', '水浇地','普通大棚','智慧大棚']:
-                field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == field_type]['地块名称']
-                for field_num in field_nums:
-                    # 前两年该地块上的豆类产量
-                    bean_volume_in_last_2year = 0
-                    if year == 2025:
-                        for crop_name in bean_crops:
-                            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-                                if solved_decision_vars.get(
-                                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}") is not None:
-                                    bean_volume_in_last_2year += solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}")
-
-                                filtered_data = sheet_crop_planting_2023[
-                                    (sheet_crop_planting_2023['作物名称'] == crop_name) &
-                                    (sheet_crop_planting_2023['种植地块'] == field_num)
-                                    ]['种植面积/亩']
-                                if not filtered_data.empty:
-                                    bean_volume_in_last_2year += filtered_data.values[0]
-
-                    elif year > 2025:
-                        for crop_name in bean_crops:
-                            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique():
-                                if solved_decision_vars.get(
-                                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}") is not None:
-                                    bean_volume_in_last_2year += solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 1}")
-                                if solved_decision_vars.get(
-                                        f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 2}") is not None:
-                                    bean_volume_in_last_2year += solved_decision_vars.get(f"area_{field_num}_{field_type}_{crop_name}_{season}_{year - 2}")
-                    if bean_volume_in_last_2year == 0:
-                        model += pulp.lpSum([
-                            decision_vars.get((field_num,field_type, crop_name, season ,year), 0)
-                            for crop_name in bean_crops
-                            for season in fields[fields['作物名称'] == crop_name]['种植季次'].unique()
-                        ]) >= 0.06
+    # 以上两条固定为 0 的组合已在创建决策变量时剪掉
+
+    # 2. 每个地块（含大棚）的所有土地三年内至少种植一次豆类作物（起始年只知道一年历史，不添加）
+    if year - 1 in solved_decision_vars:
+        bean_codes = [enc['crop_index'][crop_name] for crop_name in bean_crops if crop_name in enc['crop_index']]
+        for f in [field_type_index[name] for name in ['平旱地', '梯田', '山坡地', '水浇地', '普通大棚', '智慧大棚']]:
+            for p in plots_of_type[f]:
+                # 前两年该地块上的豆类种植面积
+                bean_volume_in_last_2year = solved_decision_vars[year - 1][p, bean_codes].sum()
+                bean_volume_in_last_2year += solved_decision_vars.get(year - 2, planting_2023)[p, bean_codes].sum()
+                if bean_volume_in_last_2year == 0:
+                    model += pulp.lpSum([
+                        decision_vars.get((p, c, s), 0)
+                        for c in bean_codes
+                        for s in enc['crop_seasons'][c]
+                    ]) >= 0.06
 
     # 4. 某地块某季节的种植总面积小于该地块面积
-    for season in ['第一季', '第二季','单季']:
-        for field_type in fields['地块类型'].unique():
-            field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == field_type]['地块名称']
-            for field_num in field_nums:
-                    area_of_this_fields = sheet_fields_name_and_area[sheet_fields_name_and_area['地块名称']==field_num]['地块面积/亩']
-                    model += (pulp.lpSum([
-                                decision_vars.get((field_num, field_type, crop_name, season, year), 0)
-                                for crop_name in fields[fields['地块类型'] == field_type]['作物名称'].unique()
-                            ]) <= area_of_this_fields)
+    for s in [first, second, single]:
+        for f in range(len(enc['field_types'])):
+            for p in plots_of_type[f]:
+                model += (pulp.lpSum([
+                    decision_vars.get((p, c, s), 0)
+                    for c in crops_of_type[f]
+                ]) <= enc['plot_area'][p])
 
     # 5. 水浇地单季（只有水稻）与双季不能共存
-    field_nums = sheet_fields_name_and_area[sheet_fields_name_and_area['地块类型'] == '水浇地']['地块名称']
-    for field_num in field_nums:
-        sjd_single_area = decision_vars.get((field_num, '水浇地', '水稻', '单季', year), 0)
-        for crop_name in fields[(fields['地块类型'] == '水浇地')&(fields['种植季次'] != '单季')]['作物名称'].unique():
-            sjd_first_area = decision_vars.get((field_num,'水浇地', crop_name, '第一季', year),0)
-            sjd_second_area = decision_vars.get((field_num,'水浇地', crop_name, '第二季', year),0)
-            model += (sjd_single_area == 0 or (sjd_first_area == 0 and sjd_second_area == 0))
+    # 0-1 变量 w=1 时只能种单季水稻，w=0 时只能种双季作物，big-M 取地块面积
+    rice = enc['crop_index']['水稻']
+    for p in plots_of_type[irrigated]:
+        sjd_single_area = decision_vars.get((p, rice, single))
+        if sjd_single_area is None:
+            continue
+        area = enc['plot_area'][p]
+        single_season_only = pulp.LpVariable(f"single_season_only_{p}_{year}", cat='Binary')
+        model += sjd_single_area <= area * single_season_only
+        for s in [first, second]:
+            model += pulp.lpSum([
+                decision_vars.get((p, c, s), 0)
+                for c in crops_of_type[irrigated]
+            ]) <= area * (1 - single_season_only)
 
     return model, decision_vars
 
 
-# 求解模型
-def solve_model(model):
-    model.solve()
+# 求解模型（CBC），solver_options 见 solver.solve_pulp：time_limit、mip_gap、threads、verbose
+def solve_model(model, **solver_options):
+    solve_pulp(model, **solver_options)
     return model
 
-# 保存结果到Excel
-def save_results(decision_vars,results,year):
-    for var in decision_vars.values():
+
+# 求解单年模型，backend 为 'pulp'（参考实现）、'sparse'（稀疏矩阵 + 进程内 HiGHS）
+# 或 'template'（复用只建一次的模型模板，仅更新系数、上下界与右端项）
+# solver_options 为每次求解的 time_limit、mip_gap、threads、verbose
+# 返回 [地块, 作物, 季次] 面积数组、面积变量键列表与年利润
+def solve_year(solved_decision_vars, planting_2023, enc, coef, year, backend='pulp', template=None, **solver_options):
+    if backend in ('sparse', 'template'):
+        if backend == 'template':
+            sparse_model = update_model_template(template or build_model_template(enc), enc, coef,
+                                                 solved_decision_vars, planting_2023, year)
+        else:
+            sparse_model = build_sparse_model(enc, coef, solved_decision_vars, planting_2023, year)
+        solution, objective_value = solve_sparse_model(sparse_model, enc, **solver_options)
+        return solution, sparse_model['area_keys'], objective_value
+    model, decision_vars = define_model(solved_decision_vars, planting_2023, enc, coef, year)
+    solve_model(model, **solver_options)
+    # 面积变量键列表包含剪掉的组合，输出结果中这些组合的面积为 0
+    return solution_to_array(enc, decision_vars), area_variable_layout(enc)[0], pulp.value(model.objective)
+
+
+# 把一年的结果追加到 results（仅在此处把编码解码为名称），由调用方在全部年份求解后写入 Excel
+def save_results(solution, area_keys, results, year, enc):
+    for p, c, s in area_keys:
         results.append({
-            '地块名称': var.name.split('_')[1],
-            '地块类型': var.name.split('_')[2],
-            '作物名称': var.name.split('_')[3],
-            '季次': var.name.split('_')[4],
-            '年份': var.name.split('_')[5],
-            '种植面积': var.varValue
+            '地块名称': enc['plots'][p],
+            '地块类型': enc['field_types'][enc['plot_type'][p]],
+            '作物名称': enc['crops'][c],
+            '季次': enc['seasons'][s],
+            '年份': str(year),
+            '种植面积': solution[p, c, s]
         })
-    if year == 2030:
-        result_df = pd.DataFrame(results)
-        result_df.to_excel("my_result3.xlsx", index=False)
+
 
 def process_file(my_result_file, cache_files, attachment_file):
     # 解包 cache_files
@@ -495,82 +421,268 @@ def process_file(my_result_file, cache_files, attachment_file):
     print(
         f"Data successfully copied from {cache_file_final} to {attachment_file}, preserving all formatting and merged cells.")
 
-# 添加实验次数逻辑
-def main():
+# 读取并编码输入数据
+def load_inputs():
     sheet_yield_and_price_2023, sheet_crop_planting_2023, sheet_fields_name_and_area, expected_sales_volume = read_data()
     crops, fields = prepare_data(sheet_yield_and_price_2023, sheet_crop_planting_2023)
-    expected_sales_volume_1 = pd.read_excel('datas/预期每季销售量（补充版）.xlsx')
+    expected_sales_volume_1 = read_excel_cached('datas/预期每季销售量（补充版）.xlsx')
     expected_sales_volume_1['作物名称'] = expected_sales_volume_1['作物名称'].str.strip()  # 去空格
+    enc = build_encoding(sheet_fields_name_and_area, fields)  # 编码
+    draw_scenario(enc, current_rng())  # 生成波动率（取自当前随机数流）
+    params = build_param_store(enc, fields, expected_sales_volume_1)  # 参数仓库
+    planting_2023 = encode_planting(enc, sheet_crop_planting_2023)  # 2023年种植情况
+    return enc, params, planting_2023
+
+
+# 两阶段随机规划（SAA）模式：每年的种植方案对 num_scenarios 个抽样情景同时优化（各情景的销售分配为第二阶段），
+# 以平均利润为目标，代替从多次确定性求解中挑选实际利润最高的一次
+# num_reduced 不为 None 时先用快速前向选择把情景削减为 num_reduced 个带权重的代表情景，只对代表情景建模，
+# 再把求得的方案放回全部情景评估，报告削减后的最优值与全集评估的偏差
+# risk_weight > 0 时为风险规避模式，目标为 (1 - risk_weight) × 期望利润 + risk_weight × CVaR_cvar_alpha
+# 规划时域：自 start_year（默认基准年 base_year 的下一年）起的 num_years 年（见 horizon），下同
+def saa_main(num_scenarios=200, base_seed=0, num_reduced=None, risk_weight=0.0, cvar_alpha=0.1, base_year=2023,
+             start_year=None, num_years=7, **solver_options):
+    set_horizon(base_year, start_year, num_years)
+    enc, params, planting_2023 = load_inputs()
+    scenarios = draw_market_scenarios(enc, num_scenarios, stream_rng(base_seed, scenario_set_stream))
+    model_scenarios, weights = scenarios, None
+    if num_reduced is not None:
+        start = time.perf_counter()
+        model_scenarios = reduce_scenarios(scenarios, num_reduced)
+        weights = model_scenarios['weights']
+        print(f"情景削减: {num_scenarios} 个情景 -> {len(weights)} 个代表情景，用时 {time.perf_counter() - start:.2f} s，"
+              f"Kantorovich 距离 {model_scenarios['distance']:.4f}")
+    num_model_scenarios = len(model_scenarios['sales'])
+    template = build_model_template(enc)
+    solved_decision_vars = {}
+    results, summary = [], []
+    for year in planning_years():
+        coefs = [get_scenario_coefficients(params, enc, model_scenarios, k, year) for k in range(num_model_scenarios)]
+        start = time.perf_counter()
+        model = build_saa_model(template, enc, coefs, solved_decision_vars, planting_2023, year, weights)
+        if risk_weight > 0:
+            model = set_risk_weight(add_cvar(model, cvar_alpha), risk_weight)
+        build_time = time.perf_counter() - start
+        solution, objective_value, model_profits, info = solve_saa_model(model, enc, **solver_options)
+        # 建模情景上的期望利润（风险权重大于 0 时最优值是期望利润与 CVaR 的加权组合，不能直接与平均利润比较）
+        model_value = model['weights'] @ model_profits
+        # 方案在全部情景上的利润（第二阶段闭式求解）
+        full_coefs = coefs if weights is None else \
+            [get_scenario_coefficients(params, enc, scenarios, k, year) for k in range(num_scenarios)]
+        scenario_profits = evaluate_first_stage(template, enc, scenario_arrays(template, full_coefs), solution)
+        full_value = scenario_profits.mean()
+        full_weights = np.full(num_scenarios, 1 / num_scenarios)
+        gap = (model_value - full_value) / abs(full_value)
+        solved_decision_vars[year] = solution
+        save_results(solution, model['area_keys'], results, year, enc)
+        size = info['size']
+        print(f"{year}年 SAA: {info['scenarios']} 个情景，{size['variables']} 变量（{size['binaries']} 个 0-1）"
+              f"/ {size['constraints']} 约束 / {size['nonzeros']} 非零，建模 {build_time:.2f} s，求解 {info['time']:.2f} s，"
+              f"最优值 {objective_value:.2f}，建模情景上平均利润 {model_value:.2f}，全部 {num_scenarios} 个情景上平均利润 {full_value:.2f}（偏差 {gap:.3%}，"
+              f"CVaR{cvar_alpha:.0%} {weighted_cvar(scenario_profits, full_weights, cvar_alpha):.2f}，"
+              f"情景利润 {scenario_profits.min():.2f} ~ {scenario_profits.max():.2f}）")
+        summary.append([year, num_scenarios, info['scenarios'], size['variables'], size['constraints'], build_time,
+                        info['time'], objective_value, model_value, full_value, gap, scenario_profits.std(),
+                        scenario_profits.min(), scenario_profits.max()])
+
+    columns = ['年份', '情景数', '建模情景数', '变量数', '约束数', '建模用时/秒', '求解用时/秒', '最优值',
+               '建模情景平均利润', '全集平均利润', '偏差', '利润标准差', '最低利润', '最高利润']
+    pd.DataFrame(summary, columns=columns).to_excel('Q3_saa_results.xlsx', index=False)
+    print("SAA summary saved to Q3_saa_results.xlsx.")
+    pd.DataFrame(results).to_excel('saa_result_Q3.xlsx', index=False)
+    print("SAA result saved to saa_result_Q3.xlsx")
+    process_file('saa_result_Q3.xlsx', ('datas/缓存-result3（空白）.xlsx', 'datas/缓存-result3.xlsx'),
+                 'datas/附件3-result3.xlsx')
+
+
+# 风险权重扫描：对当前时域的起始年（以基准年为种植历史）的 SAA 模型加入 CVaR，依次改变风险权重求解，
+# 模型只建一次，每个权重以上一个权重的解与基热启动，输出期望利润与 CVaR 的权衡
+def risk_sweep_main(num_scenarios=200, risk_weights=(0, 0.1, 0.25, 0.5, 0.75, 1), cvar_alpha=0.1, base_seed=0,
+                    base_year=2023, start_year=None, num_years=7, **solver_options):
+    set_horizon(base_year, start_year, num_years)
+    enc, params, planting_2023 = load_inputs()
+    scenarios = draw_market_scenarios(enc, num_scenarios, stream_rng(base_seed, scenario_set_stream))
+    year = planning_years()[0]
+    coefs = [get_scenario_coefficients(params, enc, scenarios, k, year) for k in range(num_scenarios)]
+    template = build_model_template(enc)
+    model = add_cvar(build_saa_model(template, enc, coefs, {}, planting_2023, year), cvar_alpha)
+    for risk_weight, _, mean_profit, cvar, info in risk_sweep(model, enc, risk_weights, **solver_options):
+        print(f"风险权重 {risk_weight:.2f}: 期望利润 {mean_profit:.2f}  CVaR{cvar_alpha:.0%} {cvar:.2f}"
+              f"  {format_solve_stats(info['stats'])}")
+
+
+# 滚动时域模式：当前情景下每 window 年联合求解（跨年轮作与三年豆类约束在窗口内为真实约束），
+# 每个窗口确定前 window - overlap 年后向后滚动，输出每个窗口的模型规模与求解用时，并与逐年求解（window = 1）比较；
+# solver_options 为每个窗口的 time_limit、mip_gap、threads、verbose
+def rolling_main(window=3, overlap=1, base_seed=0, base_year=2023, start_year=None, num_years=7, **solver_options):
+    set_horizon(base_year, start_year, num_years)
+    set_stream(base_seed, inputs_stream)
+    enc, params, planting_2023 = load_inputs()
+    template = build_model_template(enc)
+    greedy_profits = rolling_horizon(sys.modules[__name__], template, enc, params, planting_2023, 1, 0,
+                                     **solver_options)[1]
+    solved_decision_vars, profits, log = rolling_horizon(sys.modules[__name__], template, enc, params, planting_2023,
+                                                         window, overlap, **solver_options)
+    for entry in log:
+        print(format_window_log(entry))
+    results = []
+    for year, solution in solved_decision_vars.items():
+        save_results(solution, template['area_keys'], results, year, enc)
+        print(f"{year}年利润: {profits[year]:.2f}（逐年求解 {greedy_profits[year]:.2f}）")
+    total, greedy_total = sum(profits.values()), sum(greedy_profits.values())
+    print(f"窗口 {window} 年、重叠 {overlap} 年: 总利润 {total:.2f}，逐年求解 {greedy_total:.2f}"
+          f"（提高 {(total - greedy_total) / abs(greedy_total):.3%}），"
+          f"求解共 {sum(entry['solve_time'] for entry in log):.2f} s，单个窗口最长 {max(entry['solve_time'] for entry in log):.2f} s")
+
+    summary = [[f"{entry['years'][0]}-{entry['years'][-1]}", f"{entry['committed'][0]}-{entry['committed'][-1]}",
+                entry['size']['variables'], entry['size']['binaries'], entry['size']['constraints'],
+                entry['build_time'], entry['solve_time'], entry['objective'], entry['status']] for entry in log]
+    columns = ['窗口年份', '确定年份', '变量数', '0-1变量数', '约束数', '建模用时/秒', '求解用时/秒', '窗口目标值', '求解状态']
+    pd.DataFrame(summary, columns=columns).to_excel('Q3_rolling_windows.xlsx', index=False)
+    print("Rolling horizon summary saved to Q3_rolling_windows.xlsx.")
+    pd.DataFrame(results).to_excel('rolling_result_Q3.xlsx', index=False)
+    print("Rolling horizon result saved to rolling_result_Q3.xlsx")
+    process_file('rolling_result_Q3.xlsx', ('datas/缓存-result3（空白）.xlsx', 'datas/缓存-result3.xlsx'),
+                 'datas/附件3-result3.xlsx')
+
+
+# 添加实验次数逻辑
+# top_k > 0 时把样本内总利润最高的 top_k 次实验的方案放到全部实验的情景下评估，按 criterion
+# （'mean'、'worst'、'q05'、'median'、'cvar05'，见 robustness.criteria）选择最终方案；top_k = 0 时取样本内最高的一次
+# 每次实验的利润（及 save_plans 为真时面积非零的种植方案行）逐块追加到 Q3_experiments_profits / Q3_experiments_plans
+# （.parquet 或 .csv，见 result_stream），主进程只保留样本内最好的 top_k 次实验与各年、总利润的在线统计
+# （均值、方差、t-digest 分位数，见 online_stats），Excel 汇总在全部实验结束后生成一次
+# 自适应模式（给定 ci_tolerance、quantile_tolerance 或 time_budget 时）：实验按块运行，直到总利润均值
+# （及 stop_quantile 分位数）的 95% 置信区间半宽不超过估计值的给定比例，或时间预算（秒）用尽，
+# num_experiments 为实验次数上限，之后的评估与输出只用实际完成的实验；非独立抽样时每块实验数取设计块大小的整数倍，
+# 只在完整的对偶对、拉丁超立方或 Sobol 设计块之后判断是否停止
+# sampling 为情景抽样方式（'random'、'antithetic'、'lhs'、'sobol'，见 scenario_engine 与 experiment_runner.design_block_sizes）；
+# 同一 base_seed 与抽样方式下每次实验的情景与求解后端、求解参数无关，比较不同配置时使用公共随机数
+def main(backend='template', num_experiments=500, workers=None, chunk_size=None, base_seed=0,
+         top_k=10, criterion='mean', save_plans=True, ci_tolerance=None, stop_quantile=0.05, quantile_tolerance=None,
+         time_budget=None, min_experiments=30, sampling='random', base_year=2023, start_year=None, num_years=7,
+         **solver_options):
+    set_horizon(base_year, start_year, num_years)
+    module_name = os.path.splitext(os.path.basename(__file__))[0]
+    adaptive = ci_tolerance is not None or quantile_tolerance is not None or time_budget is not None
+    if adaptive and chunk_size is None:
+        chunk_size = 25
+    if adaptive and sampling != 'random':
+        block = design_block_sizes[sampling]
+        chunk_size = -(-chunk_size // block) * block
+    started = time.perf_counter()
+    chunks_done = 0
+    stop_reason = None
+    years = planning_years()
+    profit_stream = open_stream('Q3_experiments_profits', profit_columns(years))
+    plan_stream = open_stream('Q3_experiments_plans', plan_columns) if save_plans else None
 
-    num_experiments = 500  # 设置实验次数
     best_revenue = float('-inf')  # 保存最佳实验的总收益
     best_results = None  # 保存最佳实验的结果
     best_yearly_profits = []  # 保存最佳实验的每年利润
     best_experiment_number = -1  # 保存最佳实验编号
-    all_experiments_results = []  # 用于存储所有实验的每年利润和总利润
-
-    for experiment in range(num_experiments):
-        print(f"Running experiment {experiment + 1}/{num_experiments}...")
-
-        models = {}
-        solved_decision_vars = {}  # 已求解的决策变量
-        results = []
-        total_revenue_experiment = 0  # 用于记录当前实验的总收益
-        yearly_profits = []  # 用于记录每年的利润
-
-        # 对每一年进行模型求解
-        for year in range(2024, 2031):
-            model, decision_vars = define_model(solved_decision_vars, sheet_crop_planting_2023,
-                                                sheet_fields_name_and_area, fields, expected_sales_volume_1, year)
-            models[year] = solve_model(model)  # 求解模型
-            save_results(decision_vars, results, year)
-
-            # 保存每年结果
-            for key, var in decision_vars.items():
-                field_num, field_type, crop_name, season, _ = key
-                var_name = f"area_{field_num}_{field_type}_{crop_name}_{season}_{year}"
-                solved_decision_vars[var_name] = pulp.value(var)
-
-            # 输出当年的利润并累加
-            objective_value = pulp.value(models[year].objective)
-            print(f"{year}年利润: {objective_value}")
-            total_revenue_experiment += objective_value
-            yearly_profits.append(objective_value)  # 保存每年的利润
-
-        # 将实验结果存储到 all_experiments_results 中
-        all_experiments_results.append({
-            '实验编号': experiment + 1,
-            '每年利润': yearly_profits,
-            '总利润': total_revenue_experiment
-        })
-
-        # 比较并记录最佳方案
-        if total_revenue_experiment > best_revenue:
-            print(f"New best result found in experiment {experiment + 1} with total revenue: {total_revenue_experiment}")
-            best_revenue = total_revenue_experiment
-            best_results = results.copy()  # 保存最优结果
-            best_yearly_profits = yearly_profits.copy()  # 保存每年的利润
-            best_experiment_number = experiment + 1  # 记录最佳模拟的次数
-        else:
-            print(f"Experiment {experiment + 1} did not exceed the best revenue: {best_revenue}")
+    leaders = []  # 样本内总利润最高的 top_k 次实验（小顶堆，元素为 (总利润, -实验编号, 每年利润)）
+    profit_stats = new_aggregator(profit_stat_columns())  # 各年与总利润的在线统计（合并各块的汇总）
+
+    # 实验交给进程池运行（workers=1 为串行），每次实验的随机种子由 base_seed 与实验编号确定
+    experiment_chunks = iter_experiments(module_name, num_experiments, base_seed, workers, chunk_size, backend,
+                                         save_plans, sampling, **solver_options)
+    for experiments, chunk_profits, plan_rows, chunk_stats in experiment_chunks:
+        for experiment, yearly_profits in zip(experiments, chunk_profits.tolist()):
+            total_revenue_experiment = sum(yearly_profits)  # 当前实验的总收益
+            print(f"Experiment {experiment + 1}/{num_experiments} yearly profits: {yearly_profits}")
+
+            # 比较并记录最佳方案
+            if total_revenue_experiment > best_revenue:
+                print(f"New best result found in experiment {experiment + 1} with total revenue: {total_revenue_experiment}")
+                best_revenue = total_revenue_experiment
+                best_yearly_profits = yearly_profits  # 保存每年的利润
+                best_experiment_number = experiment + 1  # 记录最佳模拟的次数
+            else:
+                print(f"Experiment {experiment + 1} did not exceed the best revenue: {best_revenue}")
+            heapq.heappush(leaders, (total_revenue_experiment, -experiment, yearly_profits))
+            if len(leaders) > top_k:
+                heapq.heappop(leaders)
+
+        # 将本块实验结果追加到结果文件
+        stream_write(profit_stream, {'实验编号': np.asarray(experiments) + 1,
+                                     **{f"{year}年利润": chunk_profits[:, y] for y, year in enumerate(years)},
+                                     '总利润': chunk_profits.sum(axis=1)})
+        if plan_rows is not None:
+            stream_write(plan_stream, plan_rows)
+        profit_stats = merge_aggregators(profit_stats, chunk_stats)
+        total = aggregator_summary(profit_stats)[-1]
+        print(f"已完成 {total['样本数']}/{num_experiments} 次实验: 总利润均值 {total['均值']:.2f} ± {total['95%置信区间半宽']:.2f}"
+              f"  5% 分位 {total['5%分位']:.2f}  中位数 {total['50%分位']:.2f}  95% 分位 {total['95%分位']:.2f}")
+        chunks_done += 1
+        if adaptive:
+            stop_reason = adaptive_stop_reason(profit_stats, time.perf_counter() - started, chunks_done, ci_tolerance,
+                                               stop_quantile, quantile_tolerance, time_budget, min_experiments)
+            if stop_reason is not None:
+                break
+    experiment_chunks.close()
+    if adaptive:
+        print(f"自适应停止: 实际使用 {profit_stats['moments']['count']}/{num_experiments} 次实验，"
+              f"用时 {time.perf_counter() - started:.1f} s，{stop_reason or '达到实验次数上限'}")
+    num_experiments = profit_stats['moments']['count']
+    profit_path = close_stream(profit_stream)
+    if plan_stream is not None:
+        print(f"Sparse plans of all experiments saved to {close_stream(plan_stream)}.")
+
+    # 稳健性评估：候选方案 × 情景总利润矩阵，情景分块生成、并行评估
+    if top_k > 0:
+        leaders.sort(key=lambda leader: (-leader[0], -leader[1]))
+        candidates = [-leader[1] for leader in leaders]
+        plans = []
+        for experiment in candidates:
+            _, solved_decision_vars, _ = resolve_experiment(module_name, experiment, base_seed, backend, sampling,
+                                                            **solver_options)
+            plans.append(plan_from_solutions(solved_decision_vars))
+        module, enc, params = worker_state['module'], worker_state['enc'], worker_state['params']
+        beyond_price_ratio = module.get_year_coefficients(params, enc, years[0])['beyond_price_ratio']
+        start = time.perf_counter()
+        matrix = experiment_robustness_matrix(module, plans, params, enc, num_experiments, base_seed,
+                                              beyond_price_ratio, workers, sampling=sampling)
+        print(f"稳健性评估: {len(plans)} 个候选方案 × {num_experiments} 个情景，用时 {time.perf_counter() - start:.2f} s")
+        stats = summarize_plans(matrix)
+        selected = select_plan(stats, criterion)
+        robustness_data = []
+        for k, (leader, plan_stats) in enumerate(zip(leaders, stats)):
+            experiment = candidates[k]
+            print(f"  实验 {experiment + 1}: 样本内 {leader[0]:.2f}  平均 {plan_stats['mean']:.2f}"
+                  f"  5% 分位 {plan_stats['q05']:.2f}  最差 {plan_stats['worst']:.2f}{'  <- 选中' if k == selected else ''}")
+            robustness_data.append([experiment + 1, leader[0], plan_stats['mean'],
+                                    plan_stats['std'], plan_stats['q05'], plan_stats['q25'], plan_stats['q50'],
+                                    plan_stats['worst'], plan_stats['cvar05'], k == selected])
+        columns = ['实验编号', '样本内总利润', '平均总利润', '标准差', '5%分位', '25%分位', '中位数', '最差', 'CVaR5%', '选中']
+        pd.DataFrame(robustness_data, columns=columns).to_excel('Q3_robustness_results.xlsx', index=False)
+        print(f"按准则 {criterion} 选中实验 {candidates[selected] + 1}，稳健性评估结果保存到 Q3_robustness_results.xlsx")
+        best_experiment_number = candidates[selected] + 1
+        best_yearly_profits = leaders[selected][2]
+        best_revenue = sum(best_yearly_profits)
+
+    # 最佳实验在主进程中按同一种子重新求解，得到完整的种植方案
+    if best_experiment_number > 0:
+        best_results = []
+        _, solved_decision_vars, area_keys = resolve_experiment(module_name, best_experiment_number - 1, base_seed,
+                                                                backend, sampling, **solver_options)
+        for year in years:
+            save_results(solved_decision_vars[year], area_keys, best_results, year, worker_state['enc'])
 
     # 输出最佳方案的总收益、最佳模拟次数及每年的利润
     print(f"最佳方案的总收益为: {best_revenue}")
     print(f"最佳模拟次数: {best_experiment_number}")
     print(f"最佳每年的利润: {best_yearly_profits}")
 
-    # 保存每次实验的每年利润和总利润到 Excel 文件
-    experiment_data = []
-    for experiment_result in all_experiments_results:
-        experiment_num = experiment_result['实验编号']
-        yearly_profits = experiment_result['每年利润']
-        total_revenue = experiment_result['总利润']
-        experiment_data.append([experiment_num] + yearly_profits + [total_revenue])
-
-    columns = ['实验编号'] + [f"{year}年利润" for year in range(2024, 2031)] + ['总利润']
-    df_experiments = pd.DataFrame(experiment_data, columns=columns)
-    df_experiments.to_excel('Q3_experiments_results.xlsx', index=False)
-    print("All experiment results saved to Q3_experiments_results.xlsx.")
+    # 全部实验结束后从结果文件生成每次实验的每年利润和总利润的 Excel 汇总（超出 Excel 行数上限时只保留结果文件）
+    if num_experiments < excel_max_rows:
+        df_experiments = pd.concat(read_stream(profit_path), ignore_index=True)
+        df_experiments.to_excel('Q3_experiments_results.xlsx', index=False)
+        print("All experiment results saved to Q3_experiments_results.xlsx.")
+    else:
+        print(f"All experiment results saved to {profit_path}.")
+    pd.DataFrame(aggregator_summary(profit_stats)).to_excel('Q3_profit_summary.xlsx', index=False)
+    print("Profit distribution summary saved to Q3_profit_summary.xlsx.")
 
     # 保存最佳结果到Excel文件
     if best_results:
@@ -583,5 +695,33 @@ def main():
                  'datas/附件3-result3.xlsx')
 
 
+# 用法: python Q_3_优化版.py            多次实验模式
+#       python Q_3_优化版.py saa [情景数] [代表情景数|-] [风险权重]  两阶段随机规划（SAA）模式，默认 200 个情景、不削减、风险中性
+#       python Q_3_优化版.py cvar [情景数]  起始年风险权重扫描（期望利润与 CVaR 的权衡）
+#       python Q_3_优化版.py adaptive [相对半宽，默认 0.005] [时间预算秒|-] [实验次数上限，默认 100000] [抽样方式]  自适应实验次数
+#       python Q_3_优化版.py sampling 抽样方式 [实验次数，默认 500]  用对偶、拉丁超立方或 Sobol 抽样运行多次实验
+#       python Q_3_优化版.py rolling [窗口年数，默认 3] [重叠年数，默认 1] [每个窗口时间上限/秒]  滚动时域多年联合求解（窗口年数等于规划年数时为完整联合模型）
+#       python Q_3_优化版.py horizon 规划年数 [起始年|-] [基准年，默认 2023] [实验次数，默认 500]  指定规划时域运行多次实验
 if __name__ == "__main__":
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == 'saa':
+        saa_main(int(sys.argv[2]) if len(sys.argv) > 2 else 200,
+                 num_reduced=int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] != '-' else None,
+                 risk_weight=float(sys.argv[4]) if len(sys.argv) > 4 else 0.0)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'cvar':
+        risk_sweep_main(int(sys.argv[2]) if len(sys.argv) > 2 else 200)
+    elif len(sys.argv) > 1 and sys.argv[1] == 'adaptive':
+        main(num_experiments=int(sys.argv[4]) if len(sys.argv) > 4 else 100000,
+             ci_tolerance=float(sys.argv[2]) if len(sys.argv) > 2 else 0.005,
+             time_budget=float(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] != '-' else None,
+             sampling=sys.argv[5] if len(sys.argv) > 5 else 'random')
+    elif len(sys.argv) > 1 and sys.argv[1] == 'sampling':
+        main(num_experiments=int(sys.argv[3]) if len(sys.argv) > 3 else 500, sampling=sys.argv[2])
+    elif len(sys.argv) > 1 and sys.argv[1] == 'rolling':
+        rolling_main(int(sys.argv[2]) if len(sys.argv) > 2 else 3, int(sys.argv[3]) if len(sys.argv) > 3 else 1,
+                     **({'time_limit': float(sys.argv[4])} if len(sys.argv) > 4 else {}))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'horizon':
+        main(num_years=int(sys.argv[2]), start_year=int(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] != '-' else None,
+             base_year=int(sys.argv[4]) if len(sys.argv) > 4 else 2023,
+             num_experiments=int(sys.argv[5]) if len(sys.argv) > 5 else 500)
+    else:
+        main()
@@ -0,0 +1,288 @@
+import importlib
+import multiprocessing
+import sys
+import time
+
+import numpy as np
+
+from experiment_runner import run_experiments, resolve_experiment, worker_state, iter_experiments
+from horizon import set_horizon, planning_years
+from plan_evaluator import evaluate_plan, plan_from_solutions
+from random_streams import set_stream, experiment_stream
+from rolling_horizon import rolling_horizon, format_window_log
+from saa_model import build_saa_model, solve_saa_model, scenario_arrays, evaluate_first_stage
+from scenario_engine import draw_scenarios, sampling_schemes
+from scenario_reduction import reduce_scenarios
+from solver import clear_warm_start
+from sparse_model import build_model_template, update_model_template, prune_model, model_size, solve_sparse_model
+
+# 基准测试：在全村与按倍数放大的合成村庄上逐年求解混合整数规划，检查每年能否在时间预算内求到最优；
+# 并比较多次实验逐年求解时冷启动与（实验内跨年份）热启动的单纯形迭代次数和用时，以及情景引擎一次生成 10^5 个情景的用时；
+# 情景削减：不同代表情景数下 SAA 的求解用时与方案在全部情景上的平均利润（与全集 SAA 最优值比较）；
+# 方差缩减：各抽样方式下总利润均值估计的方差（相同求解次数），固定方案在各抽样方式下的方差，
+# 以及比较两个方案时公共随机数与独立情景的差值估计方差；滚动时域：不同前瞻窗口年数下每个窗口的求解用时与总利润；
+# 规划时域长度：7 至 30 年时域下逐年求解的用时、多次实验的用时与情景引擎的用时；
+# 提前停止：进程池中关闭实验迭代器后剩余的块不再运行
+# 用法: python benchmark.py [流程名，默认 Q_1_2] [每年时间预算/秒，默认 10]
+
+scales = [1, 10]    # 村庄规模倍数，1 为原始全村
+num_scenarios = 100000  # 情景引擎一次生成的情景数
+reduction_scenarios = 1000  # 情景削减前的情景数
+reduced_sizes = [10, 25, 50, 100]   # 代表情景数
+sampling_experiments = 32   # 抽样方式比较：每次重复的实验数（每次实验逐年求解 7 次）
+sampling_replications = 8   # 抽样方式比较：每种方式重复的次数（基础种子不同）
+plan_replications = 500     # 固定方案的抽样方式比较与公共随机数比较的重复次数（不求解，只评估方案）
+horizon_windows = [1, 2, 3, 4, 7]    # 滚动时域的窗口年数（1 为逐年求解，7 为完整联合模型），不重叠
+horizon_time_limit = 60     # 滚动时域每个窗口的时间上限/秒
+horizon_lengths = [7, 15, 30]   # 规划年数（起始年均为2024年）
+horizon_experiments = 10   # 每个规划年数下运行的实验数
+horizon_scenarios = 10000  # 每个规划年数下情景引擎一次生成的情景数
+early_stop_experiments = 400   # 提前停止检查：实验次数上限
+early_stop_chunk_size = 20     # 提前停止检查：每块实验数
+
+
+# 合成村庄：每个地块复制 scale 份，大棚保持标准面积，其余地块面积随机扰动 ±20%，
+# 预期销售量按倍数放大，2023年种植情况随地块一起复制
+def synthetic_village(enc, params, planting_2023, scale, seed=0):
+    if scale == 1:
+        return enc, params, planting_2023
+    rng = np.random.default_rng(seed)
+    village = dict(enc)
+    village['plots'] = [f"{name}_{k}" for k in range(scale) for name in enc['plots']]
+    village['plot_index'] = {name: i for i, name in enumerate(village['plots'])}
+    village['plot_type'] = np.tile(enc['plot_type'], scale)
+    greenhouse = np.isin(village['plot_type'], [enc['field_type_index'][name] for name in ['普通大棚', '智慧大棚']])
+    village['plot_area'] = np.tile(enc['plot_area'], scale)
+    village['plot_area'][~greenhouse] = np.round(
+        village['plot_area'][~greenhouse] * rng.uniform(0.8, 1.2, (~greenhouse).sum()), 1)
+    village['plots_of_type'] = [np.flatnonzero(village['plot_type'] == f).tolist() for f in range(len(enc['field_types']))]
+    village_params = dict(params)
+    village_params['expected_sales'] = params['expected_sales'] * scale
+    return village, village_params, np.tile(planting_2023, (scale, 1, 1))
+
+
+# 逐年求解，返回 (年份, 模型规模, 更新耗时/秒, 求解耗时/秒, 年利润) 列表
+def run_benchmark(module_name, scale, time_budget, symmetry=True):
+    module = importlib.import_module(module_name)
+    enc, params, planting_2023 = synthetic_village(*module.load_inputs(), scale)
+    template = build_model_template(enc)
+    solved_decision_vars = {}
+    rows = []
+    for year in planning_years():
+        coef = module.get_year_coefficients(params, enc, year)
+        start = time.perf_counter()
+        model = update_model_template(template, enc, coef, solved_decision_vars, planting_2023, year)
+        if not symmetry:
+            for _, _, row in model['symmetry_rows']:
+                model['b_ub'][row] = np.inf
+        update_time = time.perf_counter() - start
+        start = time.perf_counter()
+        solution, objective_value = solve_sparse_model(model, enc, warm_start=False, time_limit=time_budget)
+        solve_time = time.perf_counter() - start
+        rows.append((year, model_size(prune_model(model)), update_time, solve_time, objective_value))
+        solved_decision_vars[year] = solution
+    return rows
+
+
+# 连续进行 num_experiments 次规划时域内的逐年求解（与 Q_3_优化版 的实验循环相同），返回每次求解的日志；
+# 与 experiment_runner.run_experiment 一样在每次实验开始时清空热启动状态，只衡量实验内跨年份的热启动
+def run_warm_start_benchmark(module_name, num_experiments, warm_start, seed=0):
+    module = importlib.import_module(module_name)
+    enc, params, planting_2023 = module.load_inputs()
+    template = build_model_template(enc)
+    # 各流程的随机系数取自每次实验的随机数流，冷、热启动两轮使用相同的随机数
+    for experiment in range(num_experiments):
+        set_stream(seed, experiment_stream, experiment)
+        clear_warm_start(template['warm_start'])
+        solved_decision_vars = {}
+        for year in planning_years():
+            coef = module.get_year_coefficients(params, enc, year)
+            model = update_model_template(template, enc, coef, solved_decision_vars, planting_2023, year)
+            solved_decision_vars[year], _ = solve_sparse_model(model, enc, warm_start=warm_start)
+    return template['warm_start']['log']
+
+
+# 情景引擎一次生成 num_scenarios 个规划时域内情景的用时/秒（作物类型取自 Q_3_优化版）
+def run_scenario_benchmark(num_scenarios, seed=0):
+    module = importlib.import_module('Q_3_优化版')
+    enc, _, _ = module.load_inputs()
+    crop_types = [module.get_crop_type(crop_name) for crop_name in enc['crops']]
+    start = time.perf_counter()
+    draw_scenarios(enc, crop_types, num_scenarios, np.random.default_rng(seed))
+    return time.perf_counter() - start
+
+
+# 起始年 SAA：全集求解一次作为参照，再对每个代表情景数削减、求解并在全集上评估
+# 返回 [(代表情景数, 削减用时/秒, 求解用时/秒, 最优值, 全集平均利润)]，代表情景数为 None 的一行为全集求解
+def run_reduction_benchmark(num_scenarios, sizes, seed=0, year=None):
+    year = planning_years()[0] if year is None else year
+    module = importlib.import_module('Q_3_优化版')
+    enc, params, planting_2023 = module.load_inputs()
+    scenarios = module.draw_market_scenarios(enc, num_scenarios, np.random.default_rng(seed))
+    template = build_model_template(enc)
+    full_coefs = [module.get_scenario_coefficients(params, enc, scenarios, k, year) for k in range(num_scenarios)]
+    full_arrays = scenario_arrays(template, full_coefs)
+    rows = []
+    for size in [None] + sizes:
+        start = time.perf_counter()
+        reduced = scenarios if size is None else reduce_scenarios(scenarios, size)
+        reduce_time = time.perf_counter() - start
+        coefs = full_coefs if size is None else \
+            [module.get_scenario_coefficients(params, enc, reduced, k, year) for k in range(size)]
+        model = build_saa_model(template, enc, coefs, {}, planting_2023, year, reduced.get('weights'))
+        solution, objective_value, _, info = solve_saa_model(model, enc)
+        full_value = evaluate_first_stage(template, enc, full_arrays, solution).mean()
+        rows.append((size, reduce_time, info['time'], objective_value, full_value))
+    return rows
+
+
+# 抽样方式的方差缩减：每种方式用不同的基础种子重复 replications 次、每次运行 num_experiments 次实验（逐年求解），
+# 返回 [(抽样方式, 总利润均值, 均值估计的方差, 求解次数, 用时/秒)]
+def run_sampling_benchmark(num_experiments, replications, module_name='Q_3_优化版'):
+    rows = []
+    for sampling in sampling_schemes:
+        start = time.perf_counter()
+        means = [run_experiments(module_name, num_experiments, base_seed, workers=1, sampling=sampling).sum(axis=1).mean()
+                 for base_seed in range(replications)]
+        rows.append((sampling, np.mean(means), np.var(means, ddof=1), replications * num_experiments * len(planning_years()),
+                     time.perf_counter() - start))
+    return rows
+
+
+# 不求解的比较：实验 1、2 的方案在 num_scenarios 个情景上的平均总利润，重复 replications 次
+# 返回 ({抽样方式: 方案 1 平均总利润估计的方差}, 两方案之差用公共随机数的方差, 用独立情景的方差)
+def run_plan_sampling_benchmark(num_scenarios, replications, module_name='Q_3_优化版'):
+    module = importlib.import_module(module_name)
+    plans = [plan_from_solutions(resolve_experiment(module_name, experiment)[1]) for experiment in range(2)]
+    enc, params = worker_state['enc'], worker_state['params']
+    beyond_price_ratio = module.get_year_coefficients(params, enc, planning_years()[0])['beyond_price_ratio']
+    rng = np.random.default_rng(0)
+
+    def mean_profit(plan, scenarios):
+        return evaluate_plan(plan, params, enc, scenarios, beyond_price_ratio).sum(axis=1).mean()
+
+    variances = {sampling: np.var([mean_profit(plans[0], module.draw_market_scenarios(enc, num_scenarios, rng, sampling))
+                                   for _ in range(replications)], ddof=1)
+                 for sampling in sampling_schemes}
+    common, independent = [], []
+    for _ in range(replications):
+        first, second = (module.draw_market_scenarios(enc, num_scenarios, rng) for _ in range(2))
+        common.append(mean_profit(plans[0], first) - mean_profit(plans[1], first))
+        independent.append(mean_profit(plans[0], first) - mean_profit(plans[1], second))
+    return variances, np.var(common, ddof=1), np.var(independent, ddof=1)
+
+
+# 滚动时域：每个窗口年数下求解规划时域内各年，返回 (窗口年数, 总利润, 每个窗口的记录)；
+# 窗口记录中的求解状态不是 'Optimal' 时（超出 time_limit）该窗口只有最好的可行解
+def run_horizon_benchmark(module_name, windows, overlap=0, time_limit=None):
+    module = importlib.import_module(module_name)
+    enc, params, planting_2023 = module.load_inputs()
+    template = build_model_template(enc)
+    rows = []
+    for window in windows:
+        _, profits, log = rolling_horizon(module, template, enc, params, planting_2023, window, min(overlap, window - 1),
+                                          time_limit=time_limit)
+        rows.append((window, sum(profits.values()), log))
+    return rows
+
+
+# 提前停止：用 workers 个进程运行 Q_3_优化版 的实验，取到第一块后关闭迭代器（与自适应停止相同），
+# 返回 (第一块用时/秒, 关闭迭代器并等工作进程退出的用时/秒)；剩余的块不再运行时后者只是正在运行的块完成当前实验的时间
+def run_early_stop_benchmark(num_experiments, chunk_size, workers=2):
+    experiment_chunks = iter_experiments('Q_3_优化版', num_experiments, workers=workers, chunk_size=chunk_size)
+    start = time.perf_counter()
+    next(experiment_chunks)
+    first_chunk_time = time.perf_counter() - start
+    start = time.perf_counter()
+    experiment_chunks.close()
+    for process in multiprocessing.active_children():
+        process.join()
+    return first_chunk_time, time.perf_counter() - start
+
+
+# 规划时域长度：依次设定自2024年起 num_years 年的时域，用 module_name 逐年求解（冷启动），
+# 再运行 num_experiments 次 Q_3_优化版 的蒙特卡洛实验（每次实验重新生成情景；确定性流程的实验除第一次外都命中求解缓存），
+# 返回 [(年数, 每年求解用时/秒, 总利润, 实验用时/秒, 情景引擎用时/秒)]；结束后恢复默认时域
+def run_horizon_length_benchmark(module_name, lengths, num_experiments, num_scenarios):
+    module = importlib.import_module(module_name)
+    rows = []
+    for num_years in lengths:
+        set_horizon(num_years=num_years)
+        enc, params, planting_2023 = module.load_inputs()
+        template = build_model_template(enc)
+        solved_decision_vars, solve_times, total = {}, [], 0.0
+        for year in planning_years():
+            coef = module.get_year_coefficients(params, enc, year)
+            model = update_model_template(template, enc, coef, solved_decision_vars, planting_2023, year)
+            start = time.perf_counter()
+            solved_decision_vars[year], objective_value = solve_sparse_model(model, enc, warm_start=False)
+            solve_times.append(time.perf_counter() - start)
+            total += objective_value
+        start = time.perf_counter()
+        run_experiments('Q_3_优化版', num_experiments, workers=1)
+        experiment_time = time.perf_counter() - start
+        rows.append((num_years, solve_times, total, experiment_time, run_scenario_benchmark(num_scenarios)))
+    set_horizon()
+    return rows
+
+
+def main():
+    module_name = sys.argv[1] if len(sys.argv) > 1 else 'Q_1_2'
+    time_budget = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    all_within_budget = True
+    for scale in scales:
+        for symmetry in [True, False]:
+            print(f"{module_name} {scale}倍村庄  对称性约束: {'开' if symmetry else '关'}  时间预算: {time_budget}秒/年")
+            for year, size, update_time, solve_time, objective_value in run_benchmark(module_name, scale, time_budget, symmetry):
+                within_budget = solve_time < time_budget
+                all_within_budget &= within_budget
+                print(f"  {year}年  {size['variables']} 变量（{size['binaries']} 个 0-1）/ {size['constraints']} 约束"
+                      f"  更新 {update_time * 1e3:.1f} ms  求解 {solve_time:.3f} s  利润 {objective_value:.2f}"
+                      f"  {'预算内' if within_budget else '超出预算'}")
+    for warm_start in [False, True]:
+        log = run_warm_start_benchmark(module_name, 10, warm_start)
+        iterations = [stats['iterations'] for stats in log if stats['iterations'] is not None]
+        print(f"{module_name} 10次实验 {'热启动' if warm_start else '冷启动'}: 共 {len(log)} 次求解，"
+              f"平均单纯形迭代 {np.mean(iterations) if iterations else float('nan'):.1f} 次，"
+              f"平均用时 {np.mean([stats['time'] for stats in log]) * 1e3:.2f} ms")
+    scenario_time = run_scenario_benchmark(num_scenarios)
+    print(f"情景引擎: 生成 {num_scenarios} 个情景用时 {scenario_time:.3f} s")
+    reference = None
+    for size, reduce_time, solve_time, objective_value, full_value in run_reduction_benchmark(reduction_scenarios, reduced_sizes):
+        reference = full_value if size is None else reference
+        print(f"情景削减 {reduction_scenarios} -> {size or reduction_scenarios}: 削减 {reduce_time:.2f} s  求解 {solve_time:.2f} s"
+              f"  最优值 {objective_value:.2f}  全集平均利润 {full_value:.2f}"
+              f"（比全集 SAA 低 {(reference - full_value) / abs(reference):.3%}）")
+    rows = run_sampling_benchmark(sampling_experiments, sampling_replications)
+    for sampling, mean, variance, solves, elapsed in rows:
+        print(f"抽样方式 {sampling}: {sampling_replications} 次重复 × {sampling_experiments} 次实验（共 {solves} 次求解，"
+              f"{elapsed:.1f} s）  总利润均值 {mean:.2f}  均值估计的方差 {variance:.4g}"
+              f"（方差缩减 {rows[0][2] / variance:.2f} 倍，每次求解的方差 {variance * solves:.4g}）")
+    variances, common, independent = run_plan_sampling_benchmark(sampling_experiments, plan_replications)
+    for sampling, variance in variances.items():
+        print(f"固定方案 {sampling}: {sampling_experiments} 个情景的平均总利润估计方差 {variance:.4g}"
+              f"（方差缩减 {variances['random'] / variance:.2f} 倍）")
+    print(f"公共随机数: 两方案平均总利润之差的估计方差 {common:.4g}，独立情景 {independent:.4g}"
+          f"（方差缩减 {independent / common:.2f} 倍）")
+    for window, total, log in run_horizon_benchmark(module_name, horizon_windows, time_limit=horizon_time_limit):
+        unproven = sum(entry['status'] != 'Optimal' for entry in log)
+        print(f"滚动时域 {window} 年窗口: 总利润 {total:.2f}，{len(log)} 个窗口，"
+              f"求解共 {sum(entry['solve_time'] for entry in log):.2f} s"
+              f"{f'（{unproven} 个窗口在时间上限内未证明最优，总利润为最好的可行解）' if unproven else ''}")
+        for entry in log:
+            print(f"  {format_window_log(entry)}")
+    for num_years, solve_times, total, experiment_time, scenario_time in run_horizon_length_benchmark(
+            module_name, horizon_lengths, horizon_experiments, horizon_scenarios):
+        print(f"{num_years} 年时域: 逐年求解共 {sum(solve_times):.2f} s（每年平均 {np.mean(solve_times) * 1e3:.1f} ms，"
+              f"最长 {max(solve_times) * 1e3:.1f} ms）  总利润 {total:.2f}  Q_3_优化版 {horizon_experiments} 次实验 {experiment_time:.2f} s"
+              f"  情景引擎生成 {horizon_scenarios} 个情景 {scenario_time:.3f} s")
+    first_chunk_time, close_time = run_early_stop_benchmark(early_stop_experiments, early_stop_chunk_size)
+    stopped = close_time < first_chunk_time / 2
+    all_within_budget &= stopped
+    print(f"提前停止: 第一块（{early_stop_chunk_size} 次实验）{first_chunk_time:.2f} s，关闭迭代器至工作进程退出 {close_time:.2f} s"
+          f"  {'剩余的块未运行' if stopped else '剩余的块仍在运行'}")
+    sys.exit(0 if all_within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+# 附件解析缓存：按工作簿内容哈希保存列式二进制文件（.npz），附件内容变化时自动重建
+cache_dir = os.path.join('datas', '.cache')
+memory_cache = {}   # 进程内缓存，键为 (路径, sheet, 修改时间, 文件大小)
+stale_tmp_seconds = 3600   # 超过该时长未修改的临时文件视为写入中途退出的进程留下的，可以删除
+cache_state = {'tmp_checked': False}   # 本进程是否已清理过遗留的临时文件
+
+# 元素类型编码（用于还原 object 列）
+KIND_NAN = 0
+KIND_STR = 1
+KIND_INT = 2
+KIND_FLOAT = 3
+
+
+# 计算文件内容哈希
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# 缓存文件名：前缀区分 (工作簿, sheet)，后缀为内容哈希
+def cache_file_prefix(path, sheet_name):
+    key = f"{os.path.abspath(path)}|{sheet_name}".encode('utf-8')
+    return hashlib.sha1(key).hexdigest()[:16]
+
+
+# DataFrame -> 列式数组
+def encode_frame(df):
+    arrays = {'columns': np.array([str(col) for col in df.columns])}
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            arrays[f'c{i}_num'] = values.to_numpy()
+            continue
+        kinds = np.empty(len(values), dtype=np.int8)
+        texts = []
+        for j, value in enumerate(values.tolist()):
+            if value is None or (isinstance(value, float) and np.isnan(value)):
+                kinds[j] = KIND_NAN
+                texts.append('')
+            elif isinstance(value, (bool, np.bool_)):
+                kinds[j] = KIND_INT
+                texts.append(str(int(value)))
+            elif isinstance(value, (int, np.integer)):
+                kinds[j] = KIND_INT
+                texts.append(str(value))
+            elif isinstance(value, (float, np.floating)):
+                kinds[j] = KIND_FLOAT
+                texts.append(repr(float(value)))
+            else:
+                kinds[j] = KIND_STR
+                texts.append(str(value))
+        arrays[f'c{i}_kind'] = kinds
+        arrays[f'c{i}_text'] = np.array(texts, dtype=str)
+    return arrays
+
+
+# 列式数组 -> DataFrame
+def decode_frame(arrays):
+    data = {}
+    for i, col in enumerate(arrays['columns'].tolist()):
+        if f'c{i}_num' in arrays:
+            data[col] = arrays[f'c{i}_num']
+            continue
+        kinds = arrays[f'c{i}_kind']
+        texts = arrays[f'c{i}_text'].tolist()
+        values = np.empty(len(kinds), dtype=object)
+        for j, kind in enumerate(kinds):
+            if kind == KIND_NAN:
+                values[j] = np.nan
+            elif kind == KIND_INT:
+                values[j] = int(texts[j])
+            elif kind == KIND_FLOAT:
+                values[j] = float(texts[j])
+            else:
+                values[j] = texts[j]
+        data[col] = values
+    return pd.DataFrame(data)
+
+
+# 删除缓存目录中写入中途退出的进程留下的临时文件（超过 stale_tmp_seconds 未修改），正在写的临时文件不动
+def remove_stale_tmp_files():
+    if not os.path.isdir(cache_dir):
+        return
+    now = time.time()
+    for name in os.listdir(cache_dir):
+        if not name.endswith('.tmp.npz'):
+            continue
+        try:
+            if now - os.path.getmtime(os.path.join(cache_dir, name)) > stale_tmp_seconds:
+                os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+
+
+# 带缓存的 read_excel：热启动时跳过 xlsx 解析
+def read_excel_cached(path, sheet_name=0):
+    if not cache_state['tmp_checked']:
+        remove_stale_tmp_files()
+        cache_state['tmp_checked'] = True
+    stat = os.stat(path)
+    memory_key = (os.path.abspath(path), sheet_name, stat.st_mtime_ns, stat.st_size)
+    if memory_key in memory_cache:
+        return memory_cache[memory_key].copy()
+
+    prefix = cache_file_prefix(path, sheet_name)
+    cache_file = os.path.join(cache_dir, f"{prefix}_{file_hash(path)[:32]}.npz")
+    if os.path.exists(cache_file):
+        with np.load(cache_file, allow_pickle=False) as npz:
+            df = decode_frame({key: npz[key] for key in npz.files})
+    else:
+        df = pd.read_excel(path, sheet_name=sheet_name)
+        os.makedirs(cache_dir, exist_ok=True)
+        # 清理同一 sheet 的旧缓存（附件内容已变化）；临时文件由 remove_stale_tmp_files 处理，已被其他进程删除的跳过
+        for name in os.listdir(cache_dir):
+            if name.startswith(prefix + '_') and not name.endswith('.tmp.npz') \
+                    and os.path.join(cache_dir, name) != cache_file:
+                try:
+                    os.remove(os.path.join(cache_dir, name))
+                except FileNotFoundError:
+                    pass
+        # 临时文件名带进程号，多个工作进程同时建缓存时互不干扰，os.replace 保证读到的缓存文件完整
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_file, **encode_frame(df))
+        os.replace(tmp_file, cache_file)
+
+    memory_cache[memory_key] = df
+    return df.copy()
@@ -0,0 +1,80 @@
+import numpy as np
+
+# 编码层：地块、作物、地块类型、季次统一映射为稠密整数编码，
+# 建模与结果传递全部使用编码，只在输出 Excel 时解码为名称
+
+
+# 按出现顺序去重
+def unique_in_order(values):
+    return list(dict.fromkeys(values))
+
+
+# 构建编码
+def build_encoding(sheet_fields_name_and_area, fields):
+    plots = list(sheet_fields_name_and_area['地块名称'])
+    field_types = unique_in_order(list(fields['地块类型']) + list(sheet_fields_name_and_area['地块类型']))
+    crops = unique_in_order(fields['作物名称'])
+    seasons = unique_in_order(fields['种植季次'])
+
+    plot_index = {name: i for i, name in enumerate(plots)}
+    field_type_index = {name: i for i, name in enumerate(field_types)}
+    crop_index = {name: i for i, name in enumerate(crops)}
+    season_index = {name: i for i, name in enumerate(seasons)}
+
+    plot_type = sheet_fields_name_and_area['地块类型'].map(field_type_index).to_numpy(dtype=int)
+    plot_area = sheet_fields_name_and_area['地块面积/亩'].to_numpy(dtype=float)
+    plots_of_type = [np.flatnonzero(plot_type == f).tolist() for f in range(len(field_types))]
+
+    # fields 的每一行编码为 (地块类型, 作物, 季次)，保持原顺序
+    field_rows = list(zip(fields['地块类型'].map(field_type_index).tolist(),
+                          fields['作物名称'].map(crop_index).tolist(),
+                          fields['种植季次'].map(season_index).tolist()))
+    crops_of_type = [unique_in_order(c for f2, c, _ in field_rows if f2 == f) for f in range(len(field_types))]
+    crop_seasons = [unique_in_order(s for _, c2, s in field_rows if c2 == c) for c in range(len(crops))]
+    crop_season_pairs = [(c, s) for c in range(len(crops)) for s in crop_seasons[c]]
+
+    return {
+        'plots': plots,
+        'field_types': field_types,
+        'crops': crops,
+        'seasons': seasons,
+        'plot_index': plot_index,
+        'field_type_index': field_type_index,
+        'crop_index': crop_index,
+        'season_index': season_index,
+        'plot_type': plot_type,
+        'plot_area': plot_area,
+        'plots_of_type': plots_of_type,
+        'field_rows': field_rows,
+        'crops_of_type': crops_of_type,
+        'crop_seasons': crop_seasons,
+        'crop_season_pairs': crop_season_pairs,
+    }
+
+
+# 空的 [地块, 作物, 季次] 面积数组
+def empty_area_array(enc):
+    return np.zeros((len(enc['plots']), len(enc['crops']), len(enc['seasons'])))
+
+
+# 2023年种植情况编码为 [地块, 作物, 季次] 面积数组
+def encode_planting(enc, sheet_crop_planting_2023):
+    planting = empty_area_array(enc)
+    for field_num, crop_name, season, area in zip(sheet_crop_planting_2023['种植地块'],
+                                                  sheet_crop_planting_2023['作物名称'],
+                                                  sheet_crop_planting_2023['种植季次'],
+                                                  sheet_crop_planting_2023['种植面积/亩']):
+        p = enc['plot_index'].get(field_num)
+        c = enc['crop_index'].get(crop_name)
+        s = enc['season_index'].get(season)
+        if p is not None and c is not None and s is not None:
+            planting[p, c, s] += area
+    return planting
+
+
+# 决策变量 {(地块, 作物, 季次): 变量} 的求解结果整理为面积数组
+def solution_to_array(enc, decision_vars):
+    solution = empty_area_array(enc)
+    for (p, c, s), var in decision_vars.items():
+        solution[p, c, s] = var.varValue or 0
+    return solution
@@ -0,0 +1,217 @@
+import importlib
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from horizon import current_horizon, set_horizon, planning_years
+from online_stats import (new_aggregator, aggregator_update, mean_half_width, quantile_half_width,
+                          digest_quantile)
+from random_streams import (set_stream, current_rng, stream_rng, inputs_stream, experiment_stream,
+                            design_stream)
+from result_stream import sparse_plan_rows
+from solve_cache import solve_key, new_solve_cache, cache_get, cache_put
+from solver import clear_warm_start
+from sparse_model import build_model_template
+
+# 蒙特卡洛实验运行器：实验分块交给进程池，每个工作进程只读取、编码一次输入数据并建一次模型模板，
+# 每次实验使用由 (基础种子, 实验编号) 确定的随机数流（random_streams）重新生成情景，
+# 只把每年利润数组（及可选的稀疏种植方案）传回主进程。
+# 实验之间不共享热启动状态，因此结果与实验在哪个进程、按什么顺序运行无关，与串行运行一致；
+# (情景, 年份, 种植历史) 完全相同的求解由进程内的求解缓存直接返回
+
+worker_state = {}   # 工作进程内的输入数据与模型模板
+# 非独立抽样时每个设计块联合抽样的实验数：对偶抽样两两成对，拉丁超立方与 Sobol 每 32 次实验一块
+design_block_sizes = {'antithetic': 2, 'lhs': 32, 'sobol': 32}
+
+
+# 实验的随机数生成器：基础种子下第 experiment 次实验的随机数流（见 random_streams）
+def experiment_rng(base_seed, experiment):
+    return stream_rng(base_seed, experiment_stream, experiment)
+
+
+# 读取输入并建模型模板（工作进程启动时调用一次，串行运行时在主进程调用）
+# 读取前把当前随机数流设为基础种子下的输入流，使各进程读取时生成的波动率相同；sampling 为情景抽样方式
+# horizon 为主进程的规划时域（见 horizon），工作进程据此设定当前时域；stop_event 为主进程提前停止时置位的事件
+def init_worker(module_name, base_seed, backend, solver_options, sampling='random', horizon=None, stop_event=None):
+    module = importlib.import_module(module_name)
+    if horizon is not None:
+        set_horizon(**horizon)
+    set_stream(base_seed, inputs_stream)
+    enc, params, planting_2023 = module.load_inputs()
+    worker_state.update({
+        'module': module, 'enc': enc, 'params': params, 'planting_2023': planting_2023,
+        'template': build_model_template(enc), 'base_seed': base_seed, 'backend': backend,
+        'solver_options': solver_options, 'solve_cache': new_solve_cache(), 'sampling': sampling, 'design': {},
+        'horizon': dict(current_horizon), 'stop_event': stop_event,
+    })
+
+
+# 非独立抽样时实验 experiment 的情景：实验按 design_block_sizes 分块，每块由 (基础种子, 块号) 对应的随机数流
+# 用 draw_market_scenarios 联合抽样，返回 (本块情景, 实验在块中的位置)；进程内缓存最近一块
+def experiment_design(module, enc, experiment, base_seed, sampling):
+    block, row = divmod(experiment, design_block_sizes[sampling])
+    design = worker_state.setdefault('design', {})
+    key = (module.__name__, base_seed, sampling, block)
+    if design.get('key') != key:
+        design.update(key=key, drawn=module.draw_market_scenarios(
+            enc, design_block_sizes[sampling], stream_rng(base_seed, design_stream, block), sampling))
+    return design['drawn'], row
+
+
+# 运行一次实验（规划年份逐年求解），返回每年利润与各年种植面积 {年份: [地块, 作物, 季次]}
+# 当前随机数流设为本实验的流（流程按年份从其子流抽样），流程提供 draw_scenario(enc, rng) 时先用它重新生成情景；
+# 非独立抽样时改为取本实验所在设计块中的情景（流程需提供 draw_market_scenarios 与 set_scenario）
+def run_experiment(experiment, base_seed):
+    module, enc, template = worker_state['module'], worker_state['enc'], worker_state['template']
+    planting_2023, cache = worker_state['planting_2023'], worker_state['solve_cache']
+    set_stream(base_seed, experiment_stream, experiment)
+    if worker_state['sampling'] != 'random':
+        module.set_scenario(*experiment_design(module, enc, experiment, base_seed, worker_state['sampling']))
+    elif hasattr(module, 'draw_scenario'):
+        module.draw_scenario(enc, current_rng())
+    clear_warm_start(template['warm_start'])
+    solved_decision_vars = {}
+    area_keys = None
+    profits = []
+    for year in planning_years():
+        coef = module.get_year_coefficients(worker_state['params'], enc, year)
+        key = solve_key(coef, year, solved_decision_vars, planting_2023)
+        entry = cache_get(cache, key)
+        if entry is None:
+            solution, area_keys, objective_value = module.solve_year(
+                solved_decision_vars, planting_2023, enc, coef, year,
+                worker_state['backend'], template, **worker_state['solver_options'])
+            warm_point = template['warm_start']['solutions'].get(year)
+            cache_put(cache, key, (solution, area_keys, objective_value, warm_point))
+        else:
+            # 命中缓存时同时恢复该年的热启动点，使后续年份的求解与未命中时相同
+            solution, area_keys, objective_value, warm_point = entry
+            if warm_point is not None:
+                template['warm_start']['solutions'][year] = warm_point
+                template['warm_start']['last_year'] = year
+        solved_decision_vars[year] = solution
+        profits.append(objective_value)
+    return np.array(profits), solved_decision_vars, area_keys
+
+
+# 每年利润与总利润的在线统计列名
+def profit_stat_columns():
+    return [f"{year}年利润" for year in planning_years()] + ['总利润']
+
+
+# 一块实验利润 [实验, 年份] 的在线统计汇总（各年与总利润）
+def profit_aggregator(profits):
+    return aggregator_update(new_aggregator(profit_stat_columns()),
+                             np.column_stack([profits, profits.sum(axis=1)]))
+
+
+# 工作进程中运行一块实验，返回每年利润 [实验, 年份]、稀疏种植方案行（keep_plans 为真时，否则为 None）、
+# 本块利润的在线统计汇总与本块的缓存命中、未命中次数；主进程已提前停止时不再运行，返回 None
+def run_chunk(experiments, base_seed, keep_plans=False):
+    cache = worker_state['solve_cache']
+    hits, misses = cache['hits'], cache['misses']
+    profits, plan_rows = [], []
+    years = planning_years()
+    for experiment in experiments:
+        if worker_state['stop_event'] is not None and worker_state['stop_event'].is_set():
+            return None
+        experiment_profits, solved_decision_vars, _ = run_experiment(experiment, base_seed)
+        profits.append(experiment_profits)
+        if keep_plans:
+            plan_rows.append(sparse_plan_rows(experiment + 1, solved_decision_vars, years))
+    if keep_plans:
+        plan_rows = {name: np.concatenate([rows[name] for rows in plan_rows]) for name in plan_rows[0]}
+    profits = np.array(profits).reshape(len(experiments), len(years))
+    return profits, plan_rows or None, profit_aggregator(profits), cache['hits'] - hits, cache['misses'] - misses
+
+
+# 按实验编号顺序逐块运行 num_experiments 次实验，每块返回
+# (实验编号, 每年利润 [实验, 年份], 稀疏种植方案行或 None, 本块利润的在线统计汇总，可用 merge_aggregators 合并)
+# workers 为进程数（默认 CPU 核数，1 为在主进程中串行运行），chunk_size 为每次派给工作进程的实验数；
+# 同时在途的块不超过 2 * workers 个，调用方逐块写出结果时内存占用与实验次数无关；
+# 调用方可在任一块之后停止迭代（自适应停止），已用的实验总是编号最小的若干块
+def iter_experiments(module_name, num_experiments, base_seed=0, workers=None, chunk_size=None,
+                     backend='template', keep_plans=False, sampling='random', **solver_options):
+    workers = workers or os.cpu_count() or 1
+    chunk_size = chunk_size or max(1, min(num_experiments // (workers * 4), 200))
+    chunks = [range(start, min(start + chunk_size, num_experiments)) for start in range(0, num_experiments, chunk_size)]
+    hits = misses = 0
+    # 调用方提前停止（关闭生成器）时照常报告缓存命中情况
+    try:
+        if workers == 1:
+            init_worker(module_name, base_seed, backend, solver_options, sampling, dict(current_horizon))
+            for chunk in chunks:
+                profits, plan_rows, stats, chunk_hits, chunk_misses = run_chunk(chunk, base_seed, keep_plans)
+                hits, misses = hits + chunk_hits, misses + chunk_misses
+                yield chunk, profits, plan_rows, stats
+        else:
+            stop_event = multiprocessing.Event()
+            with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                     initargs=(module_name, base_seed, backend, solver_options, sampling,
+                                               dict(current_horizon), stop_event)) as executor:
+                pending = deque()
+                try:
+                    for k, chunk in enumerate(chunks):
+                        pending.append((chunk, executor.submit(run_chunk, chunk, base_seed, keep_plans)))
+                        while pending and (len(pending) >= 2 * workers or k == len(chunks) - 1):
+                            done, future = pending.popleft()
+                            profits, plan_rows, stats, chunk_hits, chunk_misses = future.result()
+                            hits, misses = hits + chunk_hits, misses + chunk_misses
+                            yield done, profits, plan_rows, stats
+                except BaseException:
+                    # 提前停止（GeneratorExit）或出错时在离开 with（等待全部块完成）之前停止剩余的块：
+                    # 已送入进程池调用队列的块无法取消，由 stop_event 使它们直接返回，正在运行的块在当前实验后返回
+                    stop_event.set()
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+    finally:
+        print(f"求解缓存: 命中 {hits} 次，实际求解 {misses} 次")
+
+
+# 自适应停止判据：总利润均值（及可选的 stop_quantile 分位数）的 95% 置信区间半宽与估计值之比不超过给定容差，
+# 或按已完成块的平均用时预计下一块会超出时间预算（秒）时返回停止原因，否则返回 None；
+# 实验数少于 min_experiments 时不按置信区间停止
+def adaptive_stop_reason(stats, elapsed, chunks_done, ci_tolerance=None, stop_quantile=None, quantile_tolerance=None,
+                         time_budget=None, min_experiments=30):
+    count = stats['moments']['count']
+    total = len(stats['columns']) - 1
+    if time_budget is not None and elapsed * (chunks_done + 1) / chunks_done > time_budget:
+        return f"时间预算 {time_budget:.0f} s 用尽（已用 {elapsed:.0f} s）"
+    if count < min_experiments or (ci_tolerance is None and quantile_tolerance is None):
+        return None
+    mean = stats['moments']['mean'][total]
+    reasons = []
+    if ci_tolerance is not None:
+        half_width = mean_half_width(stats)[total]
+        if half_width > ci_tolerance * abs(mean):
+            return None
+        reasons.append(f"均值置信区间半宽 {half_width:.2f}（{half_width / abs(mean):.3%}）")
+    if quantile_tolerance is not None:
+        value = digest_quantile(stats['digests'][total], stop_quantile, stats['moments']['min'][total],
+                                stats['moments']['max'][total])
+        half_width = quantile_half_width(stats, total, stop_quantile)
+        if half_width > quantile_tolerance * abs(value):
+            return None
+        reasons.append(f"{stop_quantile:.0%} 分位数置信区间半宽 {half_width:.2f}（{half_width / abs(value):.3%}）")
+    return '，'.join(reasons) + " 达到容差"
+
+
+# 运行 num_experiments 次实验，返回 [实验, 年份] 利润数组
+def run_experiments(module_name, num_experiments, base_seed=0, workers=None, chunk_size=None,
+                    backend='template', sampling='random', **solver_options):
+    chunk_profits = [profits for _, profits, _, _ in iter_experiments(module_name, num_experiments, base_seed, workers,
+                                                                   chunk_size, backend, sampling=sampling,
+                                                                   **solver_options)]
+    return np.concatenate(chunk_profits).reshape(num_experiments, len(planning_years()))
+
+
+# 在主进程中按同一种子重新求解某次实验，得到完整的种植方案
+def resolve_experiment(module_name, experiment, base_seed=0, backend='template', sampling='random', **solver_options):
+    if worker_state.get('module') is not importlib.import_module(module_name) or worker_state['base_seed'] != base_seed \
+            or worker_state['backend'] != backend or worker_state['solver_options'] != solver_options \
+            or worker_state['sampling'] != sampling or worker_state['horizon'] != current_horizon:
+        init_worker(module_name, base_seed, backend, solver_options, sampling, dict(current_horizon))
+    return run_experiment(experiment, base_seed)
@@ -0,0 +1,20 @@
+# 规划时域：基准年（已知种植情况与统计数据的年份，即附件中的2023年，各年的变化率都相对基准年计算）、
+# 起始年（第一个规划年份）与规划年数；起始年之前的年份没有求解结果，种植历史一律取基准年的种植情况
+# 当前时域由各流程的主函数设定（多进程实验由实验运行器在工作进程启动时设定），各流程从这里取规划年份
+
+current_horizon = {'base_year': 2023, 'start_year': 2024, 'num_years': 7}
+
+
+# 设定当前时域，start_year 默认为基准年的下一年
+def set_horizon(base_year=2023, start_year=None, num_years=7):
+    start_year = base_year + 1 if start_year is None else start_year
+    if start_year <= base_year or num_years < 1:
+        raise ValueError(f"起始年应晚于基准年且规划年数至少为 1，实际为 base_year={base_year}，"
+                         f"start_year={start_year}，num_years={num_years}")
+    current_horizon.update(base_year=base_year, start_year=start_year, num_years=num_years)
+    return dict(current_horizon)
+
+
+# 当前时域的规划年份
+def planning_years():
+    return list(range(current_horizon['start_year'], current_horizon['start_year'] + current_horizon['num_years']))
@@ -0,0 +1,43 @@
+import importlib
+import sys
+
+from horizon import planning_years
+from parity_check import pipelines
+from sparse_model import build_model_template, update_model_template, prune_model, model_size
+
+# 模型规模报告：逐年输出剪枝前后稀疏模型、以及剪枝后 PuLP 模型的变量数与约束数
+# 剪枝前即旧写法的变量全集（固定为 0 的组合以上界 0 表示）
+
+
+# 逐年统计模型规模，下一年的种植历史取模型模板的解
+def size_report(module_name):
+    module = importlib.import_module(module_name)
+    enc, params, planting_2023 = module.load_inputs()
+    template = build_model_template(enc)
+    solved_decision_vars = {}
+    rows = []
+    for year in planning_years():
+        coef = module.get_year_coefficients(params, enc, year)
+        model = update_model_template(template, enc, coef, solved_decision_vars, planting_2023, year)
+        before = model_size(model)
+        after = model_size(prune_model(model))
+        pulp_model, _ = module.define_model(solved_decision_vars, planting_2023, enc, coef, year)
+        pulp_size = {'variables': len(pulp_model.variables()), 'constraints': len(pulp_model.constraints)}
+        rows.append((year, before, after, pulp_size))
+        solution, _, _ = module.solve_year(solved_decision_vars, planting_2023, enc, coef, year, 'template', template)
+        solved_decision_vars[year] = solution
+    return rows
+
+
+def main():
+    names = sys.argv[1:] or pipelines
+    for name in names:
+        for year, before, after, pulp_size in size_report(name):
+            print(f"{name} {year}年  剪枝前: {before['variables']} 变量（{before['binaries']} 个 0-1）/ {before['constraints']} 约束"
+                  f" / {before['nonzeros']} 非零  剪枝后: {after['variables']} 变量（{after['binaries']} 个 0-1）"
+                  f"/ {after['constraints']} 约束 / {after['nonzeros']} 非零"
+                  f"  PuLP: {pulp_size['variables']} 变量 / {pulp_size['constraints']} 约束")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import numpy as np
+
+# 蒙特卡洛利润的在线统计：逐块更新、可合并的汇总量，内存占用与样本数无关
+# 均值、方差用 Welford 算法（按块更新与合并用 Chan 等人的并行公式），分位数用 t-digest：
+# 样本压缩为至多约 compression / 2 个质心（均值, 权重），靠近两端的质心更小，尾部分位数更准；
+# 工作进程各自汇总一块实验，主进程合并各块的汇总量
+
+summary_quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+
+# 空的均值、方差汇总（各列独立）
+def new_moments(num_columns):
+    return {'count': 0, 'mean': np.zeros(num_columns), 'm2': np.zeros(num_columns),
+            'min': np.full(num_columns, np.inf), 'max': np.full(num_columns, -np.inf)}
+
+
+# 合并两个均值、方差汇总，返回新的汇总
+def merge_moments(a, b):
+    count = a['count'] + b['count']
+    if a['count'] == 0 or b['count'] == 0:
+        return dict(b if a['count'] == 0 else a)
+    delta = b['mean'] - a['mean']
+    return {'count': count, 'mean': a['mean'] + delta * b['count'] / count,
+            'm2': a['m2'] + b['m2'] + delta ** 2 * a['count'] * b['count'] / count,
+            'min': np.minimum(a['min'], b['min']), 'max': np.maximum(a['max'], b['max'])}
+
+
+# 一批样本 [样本, 列] 的均值、方差汇总
+def batch_moments(values):
+    values = np.asarray(values, dtype=float)
+    mean = values.mean(axis=0)
+    return {'count': len(values), 'mean': mean, 'm2': ((values - mean) ** 2).sum(axis=0),
+            'min': values.min(axis=0), 'max': values.max(axis=0)}
+
+
+# 空的 t-digest
+def new_digest(compression=200):
+    return {'compression': compression, 'means': np.zeros(0), 'weights': np.zeros(0)}
+
+
+# t-digest 的 k1 尺度函数：q 处相邻质心允许的宽度与 sqrt(q (1 - q)) 成正比
+def digest_scale(q, compression):
+    return compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+
+# 把一组质心（可以是权重为 1 的样本）压缩为 t-digest：按均值排序后，累计权重左端点落在同一 k 单位内的质心合并
+def compress_digest(means, weights, compression):
+    order = np.argsort(means, kind='stable')
+    means, weights = means[order], weights[order]
+    total = weights.sum()
+    left = (np.cumsum(weights) - weights) / total
+    _, bucket = np.unique(np.floor(digest_scale(left, compression)), return_inverse=True)
+    merged_weights = np.bincount(bucket, weights=weights)
+    return {'compression': compression, 'means': np.bincount(bucket, weights=means * weights) / merged_weights,
+            'weights': merged_weights}
+
+
+# 把一批样本加入 t-digest，返回新的 digest
+def digest_update(digest, values):
+    values = np.asarray(values, dtype=float).ravel()
+    if len(values) == 0:
+        return digest
+    return compress_digest(np.concatenate([digest['means'], values]),
+                           np.concatenate([digest['weights'], np.ones(len(values))]), digest['compression'])
+
+
+# 合并两个 t-digest
+def merge_digests(a, b):
+    if len(a['weights']) == 0 or len(b['weights']) == 0:
+        return b if len(a['weights']) == 0 else a
+    return compress_digest(np.concatenate([a['means'], b['means']]), np.concatenate([a['weights'], b['weights']]),
+                           a['compression'])
+
+
+# t-digest 的分位数：在质心中心（累计权重）之间线性插值，两端插值到最小、最大值
+def digest_quantile(digest, q, minimum, maximum):
+    centers = np.cumsum(digest['weights']) - digest['weights'] / 2
+    total = digest['weights'].sum()
+    return np.interp(np.asarray(q) * total, np.concatenate([[0], centers, [total]]),
+                     np.concatenate([[minimum], digest['means'], [maximum]]))
+
+
+# 空的利润汇总：columns 为列名（如各年与总利润），每列一个 t-digest
+def new_aggregator(columns, compression=200):
+    return {'columns': list(columns), 'moments': new_moments(len(columns)),
+            'digests': [new_digest(compression) for _ in columns]}
+
+
+# 把一批样本 [样本, 列] 加入汇总，返回新的汇总
+def aggregator_update(aggregator, values):
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return aggregator
+    return {'columns': aggregator['columns'], 'moments': merge_moments(aggregator['moments'], batch_moments(values)),
+            'digests': [digest_update(digest, values[:, j]) for j, digest in enumerate(aggregator['digests'])]}
+
+
+# 合并两个汇总（例如两个工作进程各自汇总的实验块）
+def merge_aggregators(a, b):
+    return {'columns': a['columns'], 'moments': merge_moments(a['moments'], b['moments']),
+            'digests': [merge_digests(x, y) for x, y in zip(a['digests'], b['digests'])]}
+
+
+# 均值的 95% 置信区间半宽（各列）
+def mean_half_width(aggregator, z=1.96):
+    moments = aggregator['moments']
+    if moments['count'] < 2:
+        return np.full(len(aggregator['columns']), np.inf)
+    return z * np.sqrt(moments['m2'] / (moments['count'] - 1) / moments['count'])
+
+
+# 第 column 列 q 分位数的置信区间半宽：不依赖分布的次序统计量区间
+# [Q(q - z sqrt(q (1 - q) / n)), Q(q + z sqrt(q (1 - q) / n))]，两端的分位数由 t-digest 估计
+def quantile_half_width(aggregator, column, q, z=1.96):
+    moments = aggregator['moments']
+    count = moments['count']
+    if count < 2:
+        return np.inf
+    spread = z * np.sqrt(q * (1 - q) / count)
+    lower, upper = digest_quantile(aggregator['digests'][column], [max(q - spread, 0), min(q + spread, 1)],
+                                   moments['min'][column], moments['max'][column])
+    return (upper - lower) / 2
+
+
+# 每列的统计量：样本数、均值、标准差、均值的 95% 置信区间半宽、最小、各分位数、最大
+def aggregator_summary(aggregator, quantiles=summary_quantiles):
+    moments = aggregator['moments']
+    count = moments['count']
+    half_width = mean_half_width(aggregator)
+    std = np.sqrt(moments['m2'] / (count - 1)) if count > 1 else np.zeros(len(aggregator['columns']))
+    rows = []
+    for j, column in enumerate(aggregator['columns']):
+        row = {'列': column, '样本数': count, '均值': moments['mean'][j], '标准差': std[j],
+               '95%置信区间半宽': half_width[j], '最小': moments['min'][j]}
+        if count > 0:
+            values = digest_quantile(aggregator['digests'][j], quantiles, moments['min'][j], moments['max'][j])
+            row.update({f"{q:.0%}分位": value for q, value in zip(quantiles, values)})
+        row['最大'] = moments['max'][j]
+        rows.append(row)
+    return rows
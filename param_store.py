@@ -0,0 +1,53 @@
+import numpy as np
+
+# 参数仓库：把 fields 中的亩产量、成本、单价一次性整理成 [地块类型, 作物, 季次] 的稠密数组，
+# 建模时用编码下标取系数，代替逐个系数的 DataFrame 布尔筛选
+
+
+# 构建参数仓库（下标来自 encoding.build_encoding）
+def build_param_store(enc, fields, expected_sales_volume=None):
+    shape = (len(enc['field_types']), len(enc['crops']), len(enc['seasons']))
+    yield_array = np.full(shape, np.nan)
+    cost_array = np.full(shape, np.nan)
+    price_array = np.full(shape, np.nan)
+    valid = np.zeros(shape, dtype=bool)
+    # 某作物某季次的销售单价：与原模型一致，取 fields 中该 (作物, 季次) 的第一行
+    sale_price = np.full(shape[1:], np.nan)
+    # (作物, 季次) 在 fields 中出现的行数，原模型的销售收益按行累加
+    row_count = np.zeros(shape[1:], dtype=int)
+
+    yields = fields['亩产量/斤'].to_numpy(dtype=float)
+    costs = fields['种植成本/(元/亩)'].to_numpy(dtype=float)
+    prices = fields['销售单价/(元/斤)'].to_numpy(dtype=float)
+    # 逆序写入，使重复的 (地块类型, 作物, 季次) 取第一行，与 .values[0] 一致
+    for i in range(len(enc['field_rows']) - 1, -1, -1):
+        f, c, s = enc['field_rows'][i]
+        yield_array[f, c, s] = yields[i]
+        cost_array[f, c, s] = costs[i]
+        price_array[f, c, s] = prices[i]
+        valid[f, c, s] = True
+        sale_price[c, s] = prices[i]
+        row_count[c, s] += 1
+
+    params = {
+        'yield': yield_array,
+        'cost': cost_array,
+        'price': price_array,
+        'valid': valid,
+        'sale_price': sale_price,
+        'row_count': row_count,
+    }
+
+    # 预期销售量 [作物, 季次]
+    if expected_sales_volume is not None:
+        expected_sales = np.full(shape[1:], np.nan)
+        for season, crop_name, volume in zip(expected_sales_volume['种植季次'],
+                                             expected_sales_volume['作物名称'],
+                                             expected_sales_volume['当季预期销售量']):
+            c = enc['crop_index'].get(crop_name)
+            s = enc['season_index'].get(season)
+            if c is not None and s is not None and np.isnan(expected_sales[c, s]):
+                expected_sales[c, s] = volume
+        params['expected_sales'] = expected_sales
+
+    return params
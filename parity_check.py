@@ -0,0 +1,45 @@
+import importlib
+import sys
+
+from horizon import planning_years
+from sparse_model import build_model_template
+
+# 一致性检查：同一年、同一组系数、同一种植历史下，
+# PuLP 参考模型、稀疏矩阵模型与跨年复用的模型模板的最优目标值应相同
+
+pipelines = ['Q_1_1', 'Q_1_2', 'Q_2', 'Q_3', 'Q_3_优化版']
+
+
+# 逐年比较两种建模方式的目标值，下一年的种植历史统一取 PuLP 的解
+def check_parity(module_name, rtol=1e-6):
+    module = importlib.import_module(module_name)
+    enc, params, planting_2023 = module.load_inputs()
+    template = build_model_template(enc)
+    solved_decision_vars = {}
+    rows = []
+    for year in planning_years():
+        coef = module.get_year_coefficients(params, enc, year)
+        solution, _, pulp_objective = module.solve_year(solved_decision_vars, planting_2023, enc, coef, year, 'pulp')
+        _, _, sparse_objective = module.solve_year(solved_decision_vars, planting_2023, enc, coef, year, 'sparse')
+        _, _, template_objective = module.solve_year(solved_decision_vars, planting_2023, enc, coef, year,
+                                                     'template', template)
+        ok = all(abs(pulp_objective - objective) <= rtol * max(1.0, abs(pulp_objective))
+                 for objective in (sparse_objective, template_objective))
+        rows.append((year, pulp_objective, sparse_objective, template_objective, ok))
+        solved_decision_vars[year] = solution
+    return rows
+
+
+def main():
+    names = sys.argv[1:] or pipelines
+    all_ok = True
+    for name in names:
+        for year, pulp_objective, sparse_objective, template_objective, ok in check_parity(name):
+            print(f"{name} {year}年  PuLP: {pulp_objective:.6f}  稀疏矩阵: {sparse_objective:.6f}  "
+                  f"模型模板: {template_objective:.6f}  {'一致' if ok else '不一致'}")
+            all_ok &= ok
+    sys.exit(0 if all_ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import importlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from horizon import planning_years
+from scenario_engine import draw_scenarios
+
+# 方案评估器：不调用求解器，用 NumPy 计算给定种植方案在一批情景下每年的利润
+# 方案为 [年份, 地块, 作物, 季次] 面积张量；情景为相对基准年的变化率张量（与 scenario_engine 相同）：
+#   'sales'、'yield'、'price' 为 [情景, 年份, 作物季次对]，'cost' 为 [年份] 或 [情景, 年份]
+# 销售逻辑与 define_model 相同：每个作物季次的总产量中不超过预期销售量的部分按原价售出，
+# 超出部分按 beyond_price_ratio 倍价格售出（Q_1_1 为 0，即滞销浪费；其余流程为 0.5）
+# years 默认为当前规划时域的年份（见 horizon）
+# 用法: python plan_evaluator.py 方案文件 流程名 [情景数，默认 10000]
+
+# 各流程的情景类型：确定（系数不变）、独立波动（Q_2）、含市场效应的波动（Q_3）
+scenario_types = {'Q_1_1': 'deterministic', 'Q_1_2': 'deterministic', 'Q_2': 'independent',
+                  'Q_3': 'market', 'Q_3_优化版': 'market'}
+
+
+# 读取 save_results 输出的方案文件（my_result*.xlsx、best_result_Q3.xlsx 等）为 [年份, 地块, 作物, 季次] 面积张量
+def read_plan(path, enc, years=None):
+    df = pd.read_excel(path)
+    years = planning_years() if years is None else list(years)
+    plan = np.zeros((len(years), len(enc['plots']), len(enc['crops']), len(enc['seasons'])))
+    y = df['年份'].astype(int).map({year: i for i, year in enumerate(years)})
+    p = df['地块名称'].map(enc['plot_index'])
+    c = df['作物名称'].str.strip().map(enc['crop_index'])
+    s = df['季次'].map(enc['season_index'])
+    known = y.notna() & p.notna() & c.notna() & s.notna()
+    np.add.at(plan, (y[known].astype(int), p[known].astype(int), c[known].astype(int), s[known].astype(int)),
+              df['种植面积'][known].fillna(0).to_numpy(dtype=float))
+    return plan
+
+
+# 各年求解结果 {年份: [地块, 作物, 季次]} 堆叠为方案张量
+def plan_from_solutions(solved_decision_vars, years=None):
+    return np.stack([solved_decision_vars[year] for year in (planning_years() if years is None else years)])
+
+
+# 确定情景：所有变化率为 1
+def deterministic_scenarios(enc, years=None):
+    years = planning_years() if years is None else years
+    shape = (1, len(years), len(enc['crop_season_pairs']))
+    return {'years': list(years), 'sales': np.ones(shape), 'yield': np.ones(shape), 'price': np.ones(shape),
+            'cost': np.ones(len(years))}
+
+
+# 方案在各情景下每年的利润 [情景, 年份]
+def evaluate_plan(plan, params, enc, scenarios, beyond_price_ratio):
+    pair_c, pair_s = np.array(enc['crop_season_pairs']).T
+    area = plan[:, :, pair_c, pair_s]   # [年份, 地块, 作物季次对]
+    # 基准年系数下每年各作物季次的产量与总种植成本（地块类型不能种的组合面积为 0）
+    base_yield = np.nan_to_num(params['yield'][enc['plot_type']][:, pair_c, pair_s])
+    base_production = np.einsum('ypk,pk->yk', area, base_yield)
+    base_cost = np.einsum('ypcs,pcs->y', plan, np.nan_to_num(params['cost'][enc['plot_type']]))
+
+    production = scenarios['yield'] * base_production
+    expected_sales = scenarios['sales'] * params['expected_sales'][pair_c, pair_s]
+    unit_revenue = scenarios['price'] * (params['sale_price'] * params['row_count'])[pair_c, pair_s]
+    under = np.minimum(production, expected_sales)
+    revenue = (unit_revenue * (under + beyond_price_ratio * (production - under))).sum(axis=2)
+    return revenue - np.asarray(scenarios['cost']) * base_cost
+
+
+# 按流程的不确定性生成 num_scenarios 个情景
+def pipeline_scenarios(module_name, enc, num_scenarios, rng):
+    scenario_type = scenario_types.get(module_name, 'deterministic')
+    if scenario_type == 'deterministic':
+        return deterministic_scenarios(enc)
+    market = importlib.import_module('Q_3_优化版')
+    if scenario_type == 'market':
+        return market.draw_market_scenarios(enc, num_scenarios, rng)
+    crop_types, _ = market.get_market_effects(enc)
+    return draw_scenarios(enc, crop_types, num_scenarios, rng, dtype=np.float64)
+
+
+def main():
+    path = sys.argv[1]
+    module_name = sys.argv[2]
+    num_scenarios = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    module = importlib.import_module(module_name)
+    enc, params, _ = module.load_inputs()
+    beyond_price_ratio = module.get_year_coefficients(params, enc, planning_years()[0])['beyond_price_ratio']
+    plan = read_plan(path, enc)
+    scenarios = pipeline_scenarios(module_name, enc, num_scenarios, np.random.default_rng(0))
+    start = time.perf_counter()
+    profits = evaluate_plan(plan, params, enc, scenarios, beyond_price_ratio)
+    elapsed = time.perf_counter() - start
+    print(f"{path}（{module_name}）: {len(profits)} 个情景，评估用时 {elapsed:.3f} s")
+    for y, year in enumerate(scenarios['years']):
+        yearly = profits[:, y]
+        print(f"  {year}年  平均利润 {yearly.mean():.2f}  标准差 {yearly.std():.2f}"
+              f"  5% 分位 {np.quantile(yearly, 0.05):.2f}  95% 分位 {np.quantile(yearly, 0.95):.2f}")
+    total = profits.sum(axis=1)
+    print(f"  总利润  平均 {total.mean():.2f}  标准差 {total.std():.2f}  最低 {total.min():.2f}  最高 {total.max():.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import numpy as np
+
+# 随机数流：由一个主种子经 numpy SeedSequence 派生互相独立、可复现的随机数流，代替全局 np.random 状态
+# 流以整数路径标识：路径 (k1, k2, ...) 即 SeedSequence(主种子).spawn 逐层派生出的第 k1 个子序列的第 k2 个子序列……
+# （spawn_key），因此任一流都可以直接构造，与派生顺序、由哪个工作进程使用、进程数多少都无关
+# 路径第一项为用途：
+inputs_stream = 0       # 读取输入时生成的波动率：(0, 年份)
+experiment_stream = 1   # 多次实验：(1, 实验编号) 为一次实验的情景，(1, 实验编号, 年份) 为该实验某年的抽样
+design_stream = 2       # 非独立抽样（对偶、拉丁超立方、Sobol）的设计块：(2, 块号)
+scenario_set_stream = 3  # SAA、风险权重扫描等一次抽取的情景集：(3,)
+search_stream = 4       # 启发式搜索（模拟退火）的随机步：(4,)
+
+# 当前流：各流程的 generate_* 从当前流（或其下按年份派生的子流）抽样，由主流程或实验运行器设定
+current_stream = {'master_seed': 0, 'path': (inputs_stream,)}
+
+
+# 路径对应的 SeedSequence
+def seed_sequence(master_seed, *path):
+    return np.random.SeedSequence(master_seed, spawn_key=tuple(int(key) for key in path))
+
+
+# 路径对应的随机数生成器
+def stream_rng(master_seed, *path):
+    return np.random.default_rng(seed_sequence(master_seed, *path))
+
+
+# 设定当前流
+def set_stream(master_seed, *path):
+    current_stream.update(master_seed=master_seed, path=tuple(path))
+
+
+# 当前流（subpath 非空时为其下的子流，如按年份派生）的随机数生成器；相同的当前流与子路径总是给出相同的随机数
+def current_rng(*subpath):
+    return stream_rng(current_stream['master_seed'], *current_stream['path'], *subpath)
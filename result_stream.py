@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# 实验结果流式写入：结果按块追加到只增不改的列式文件（装了 pyarrow 时为 Parquet，每块一个行组；否则为 CSV），
+# 内存中只保留未写出的一块，运行结束后再按块读回生成汇总，内存占用与实验次数无关
+
+# 稀疏种植方案（只保留面积非零的行，地块、作物、季次为编码）的列类型
+plan_columns = {'实验编号': np.int64, '年份': np.int64, '地块编号': np.int64, '作物编号': np.int64,
+                '季次编号': np.int64, '种植面积': np.float64}
+
+
+# 实验利润的列类型：实验编号、每年利润、总利润
+def profit_columns(years):
+    return {'实验编号': np.int64, **{f"{year}年利润": np.float64 for year in years}, '总利润': np.float64}
+
+
+# 打开结果流；path 不含扩展名，按是否装了 pyarrow 加 .parquet 或 .csv，已有的同名文件被覆盖
+def open_stream(path, columns, chunk_rows=100000):
+    path = path + ('.parquet' if pyarrow is not None else '.csv')
+    if os.path.exists(path):
+        os.remove(path)
+    return {'path': path, 'columns': columns, 'chunk_rows': chunk_rows, 'buffer': [], 'rows': 0,
+            'writer': None, 'total_rows': 0}
+
+
+# 追加一批行（列名 -> 数组或标量）；缓冲的行数达到 chunk_rows 时写出
+def stream_write(stream, rows):
+    frame = pd.DataFrame(rows).astype(stream['columns'])[list(stream['columns'])]
+    stream['buffer'].append(frame)
+    stream['rows'] += len(frame)
+    if stream['rows'] >= stream['chunk_rows']:
+        flush_stream(stream)
+
+
+# 把缓冲的行作为一块追加到文件
+def flush_stream(stream):
+    if not stream['buffer']:
+        return
+    frame = pd.concat(stream['buffer'], ignore_index=True)
+    if pyarrow is not None:
+        table = pyarrow.Table.from_pandas(frame, preserve_index=False)
+        if stream['writer'] is None:
+            stream['writer'] = pyarrow.parquet.ParquetWriter(stream['path'], table.schema)
+        stream['writer'].write_table(table)
+    else:
+        frame.to_csv(stream['path'], mode='a', header=stream['total_rows'] == 0, index=False)
+    stream['total_rows'] += len(frame)
+    stream['buffer'], stream['rows'] = [], 0
+
+
+# 写出剩余的行并关闭文件，返回文件路径
+def close_stream(stream):
+    flush_stream(stream)
+    if stream['writer'] is not None:
+        stream['writer'].close()
+        stream['writer'] = None
+    return stream['path']
+
+
+# 按块读回结果文件，逐块返回 DataFrame
+def read_stream(path, chunk_rows=100000):
+    if not os.path.exists(path):
+        return
+    if path.endswith('.parquet'):
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_rows, float_precision='round_trip')
+
+
+# 一次实验的稀疏种植方案行：{年份: [地块, 作物, 季次]} 中面积非零的项
+def sparse_plan_rows(experiment_number, solved_decision_vars, years):
+    plan = np.stack([solved_decision_vars[year] for year in years])
+    y, p, c, s = np.nonzero(plan)
+    return {'实验编号': np.full(len(y), experiment_number), '年份': np.asarray(years)[y], '地块编号': p,
+            '作物编号': c, '季次编号': s, '种植面积': plan[y, p, c, s]}
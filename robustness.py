@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from experiment_runner import experiment_rng, experiment_design
+from plan_evaluator import evaluate_plan
+
+# 样本外稳健性评估：把若干候选方案放到每次实验的情景下评估，得到 [方案, 情景] 总利润矩阵，
+# 按各方案的平均值、分位数、最差情况等准则挑选方案。情景分块交给进程池并行评估
+
+quantile_levels = [0.05, 0.25, 0.5]
+# 选择准则：名称 -> 由 summarize_plans 的一行统计量得到的得分（越大越好）
+criteria = {
+    'mean': lambda stats: stats['mean'],
+    'worst': lambda stats: stats['worst'],
+    'q05': lambda stats: stats['q05'],
+    'median': lambda stats: stats['q50'],
+    'cvar05': lambda stats: stats['cvar05'],
+}
+
+
+# 按实验编号重新生成各次实验的情景（与 experiment_runner 中实验使用的情景相同，包括抽样方式），拼成一批情景
+def experiment_scenarios(module, enc, experiments, base_seed, sampling='random'):
+    if sampling == 'random':
+        drawn = [(module.draw_market_scenarios(enc, 1, experiment_rng(base_seed, experiment)), 0)
+                 for experiment in experiments]
+    else:
+        drawn = [experiment_design(module, enc, experiment, base_seed, sampling) for experiment in experiments]
+    scenarios = {'years': drawn[0][0]['years'], 'cost': drawn[0][0]['cost']}
+    for name in ['sales', 'yield', 'price']:
+        scenarios[name] = np.stack([d[name][row] for d, row in drawn])
+    return scenarios
+
+
+# 一块情景上所有方案的总利润 [方案, 情景]
+def evaluate_chunk(plans, params, enc, scenarios, beyond_price_ratio):
+    return np.array([evaluate_plan(plan, params, enc, scenarios, beyond_price_ratio).sum(axis=1) for plan in plans])
+
+
+# 候选方案 × 情景的总利润矩阵 [方案, 情景]；workers 为进程数（默认 CPU 核数，1 为在主进程中计算）
+def robustness_matrix(plans, params, enc, scenarios, beyond_price_ratio, workers=None):
+    workers = workers or os.cpu_count() or 1
+    num_scenarios = len(scenarios['sales'])
+    if workers == 1:
+        return evaluate_chunk(plans, params, enc, scenarios, beyond_price_ratio)
+    bounds = np.linspace(0, num_scenarios, workers + 1).astype(int)
+    chunks = [{**scenarios, **{name: scenarios[name][start:stop] for name in ['sales', 'yield', 'price']}}
+              for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        blocks = list(executor.map(evaluate_chunk, [plans] * len(chunks), [params] * len(chunks), [enc] * len(chunks),
+                                   chunks, [beyond_price_ratio] * len(chunks)))
+    return np.concatenate(blocks, axis=1)
+
+
+# 候选方案 × 全部实验情景的总利润矩阵 [方案, 实验]；情景按 block_size 次实验一块重新生成并评估，
+# 内存中只保留一块情景
+def experiment_robustness_matrix(module, plans, params, enc, num_experiments, base_seed, beyond_price_ratio,
+                                 workers=None, block_size=10000, sampling='random'):
+    blocks = [robustness_matrix(plans, params, enc,
+                                experiment_scenarios(module, enc, range(start, min(start + block_size, num_experiments)),
+                                                     base_seed, sampling),
+                                beyond_price_ratio, workers)
+              for start in range(0, num_experiments, block_size)]
+    return np.concatenate(blocks, axis=1)
+
+
+# 每个方案的统计量：平均值、标准差、各分位数、最差情况、最差 5% 情景的平均值（CVaR）
+def summarize_plans(matrix):
+    stats = []
+    for row in matrix:
+        worst_tail = np.sort(row)[:max(1, int(np.ceil(0.05 * len(row))))]
+        plan_stats = {'mean': row.mean(), 'std': row.std(), 'worst': row.min(), 'cvar05': worst_tail.mean()}
+        for level in quantile_levels:
+            plan_stats[f"q{int(level * 100):02d}"] = np.quantile(row, level)
+        stats.append(plan_stats)
+    return stats
+
+
+# 按准则选出方案，返回在候选列表中的位置
+def select_plan(stats, criterion='mean'):
+    return int(np.argmax([criteria[criterion](plan_stats) for plan_stats in stats]))
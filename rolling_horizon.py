@@ -0,0 +1,202 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from horizon import planning_years
+from solver import solve_highs, clear_warm_start
+from sparse_model import (area_variable_layout, bean_crops, rotation_field_types, min_bean_area,
+                          set_template_coefficients, update_model_template, prune_model, model_size)
+
+# 滚动时域（rolling horizon）的多年联合模型：前瞻窗口内的若干年一起求解，窗口内跨年的轮作（规则1.2、1.3）
+# 与三年豆类（规则2）约束是模型中的真实约束，而不是由上一年已求出的方案固定；窗口之前已确定的年份仍作为已知历史
+# 每个窗口求解后确定前 window - overlap 年，窗口向后滚动同样的年数（窗口到达最后一年时确定窗口内全部年份）；
+# window = 1 即逐年贪心求解（与 solve_year 相同：单年窗口沿用模板的热启动状态），window 等于规划年数时为整个规划时域的
+# 完整联合模型；窗口模型超出时间上限时取当前最好的可行解，求解状态记在窗口记录中
+# 列排列：各年面积变量，各年未超出 / 超出部分，各年规则1.1、5的 0-1 变量，最后为跨年轮作的 0-1 变量
+# 跨年轮作：0-1 变量 y 表示第 k 年种了某单季作物（智慧大棚为第二季种了某作物），x_k <= A*y，x_{k+1} <= A*(1-y)
+# 跨年豆类：窗口内每年与前两年的豆类面积之和不小于 min_bean_area，窗口之前的年份为已知历史，其中种过豆类时不需要
+
+
+# 跨年轮作约束涉及的面积变量对 (第 k 年的列, 第 k+1 年的列, 地块面积)
+# 1.2 轮作地块类型的单季作物：同一列；1.3 智慧大棚：第 k 年第二季与第 k+1 年第一季
+def rotation_links(enc, coef):
+    var_index = area_variable_layout(enc)[2]
+    single, first, second = (enc['season_index'][name] for name in ['单季', '第一季', '第二季'])
+    links = []
+    for f in [enc['field_type_index'][name] for name in rotation_field_types]:
+        crops = [c for c in enc['crops_of_type'][f] if coef['valid'][f, c, single]]
+        for p in enc['plots_of_type'][f]:
+            links.extend((var_index[p, c, single], var_index[p, c, single], enc['plot_area'][p]) for c in crops)
+    smart_greenhouse = enc['field_type_index']['智慧大棚']
+    for p in enc['plots_of_type'][smart_greenhouse]:
+        links.extend((var_index[p, c, second], var_index[p, c, first], enc['plot_area'][p])
+                     for c in enc['crops_of_type'][smart_greenhouse])
+    return [(j, k, area) for j, k, area in links if j >= 0 and k >= 0]
+
+
+# 把各年的同结构矩阵按年份上下排列，年份 k 的第 j 列放到联合模型的 col_map[k, j] 列
+def place_blocks(matrices, col_map, n_cols):
+    blocks = [m.tocoo() for m in matrices]
+    n_rows = blocks[0].shape[0]
+    rows = np.concatenate([m.row + k * n_rows for k, m in enumerate(blocks)])
+    cols = np.concatenate([col_map[k][m.col] for k, m in enumerate(blocks)])
+    return sp.csr_matrix((np.concatenate([m.data for m in blocks]), (rows, cols)), shape=(n_rows * len(blocks), n_cols))
+
+
+# 建立窗口 years 的多年联合模型；coefs 为各年的模型系数（与 get_year_coefficients 的返回值相同），
+# solved_decision_vars 中为窗口之前已确定的年份。第一年的历史约束与单年模型相同（由模板按历史更新）
+def build_window_model(template, enc, coefs, solved_decision_vars, planting_2023, years):
+    n_years, n_area, n_pairs = len(years), template['n_area'], template['n_pairs']
+    n_vars = len(template['obj'])
+    blocks = []
+    for k, (year, coef) in enumerate(zip(years, coefs)):
+        if k == 0:
+            update_model_template(template, enc, coef, solved_decision_vars, planting_2023, year)
+        else:
+            # 之后各年的历史是模型变量：面积变量不按历史固定，单年的豆类约束与对称性约束不生效（由跨年约束代替）
+            set_template_coefficients(template, coef)
+            template['ub'][:n_area] = np.inf
+            for row in template['bean_rows'].values():
+                template['b_ub'][row] = 0
+            for _, _, row in template['symmetry_rows']:
+                template['b_ub'][row] = np.inf
+        blocks.append({key: template[key].copy() for key in ['obj', 'b_ub', 'ub', 'A_eq']})
+
+    # 豆类历史：窗口前一年种过豆类的地块，第二年的跨年豆类约束不需要
+    bean_codes = [enc['crop_index'][name] for name in bean_crops if name in enc['crop_index']]
+    previous = solved_decision_vars.get(years[0] - 1, planting_2023)   # 起始年之前为基准年的种植情况
+    beans_last_year = {p for p in template['bean_rows'] if previous[p, bean_codes].sum() > 0}
+    if n_years > 1:
+        # 交换两块地在窗口内全部年份的方案仍可行时对称性约束才有效，还要求两块地前一年的豆类历史相同
+        for p, q, row in template['symmetry_rows']:
+            if (p in beans_last_year) != (q in beans_last_year):
+                blocks[0]['b_ub'][row] = np.inf
+
+    # 列号：面积变量、销售部分、0-1 变量三组，每组内按年份排列
+    groups = [np.arange(n_area), n_area + np.arange(2 * n_pairs), np.arange(n_area + 2 * n_pairs, n_vars)]
+    col_map = np.empty((n_years, n_vars), dtype=int)
+    start = 0
+    for group in groups:
+        col_map[:, group] = start + np.arange(n_years)[:, None] * len(group) + np.arange(len(group))
+        start += n_years * len(group)
+
+    link_rows, link_cols, link_vals, link_rhs = [], [], [], []
+
+    # 逐行添加跨年约束 sum(vals * x[cols]) <= rhs
+    def add_row(cols, vals, rhs):
+        link_rows.append(np.full(len(cols), len(link_rhs)))
+        link_cols.append(np.asarray(cols, dtype=int))
+        link_vals.append(np.asarray(vals, dtype=float))
+        link_rhs.append(rhs)
+
+    # 跨年轮作：每对相邻年份、每个变量对一个 0-1 变量
+    binary_col = n_years * n_vars
+    links = rotation_links(enc, coefs[0])
+    for k in range(n_years - 1):
+        for j_from, j_to, area in links:
+            add_row([col_map[k, j_from], binary_col], [1, -area], 0.0)
+            add_row([col_map[k + 1, j_to], binary_col], [1, area], area)
+            binary_col += 1
+    # 跨年豆类：第 k 年（k >= 1）与前两年的豆类面积之和，前两年中的窗口前一年种过豆类时不需要
+    var_index = area_variable_layout(enc)[2]
+    for p in template['bean_rows']:
+        cols = var_index[p, bean_codes].ravel()
+        cols = cols[cols >= 0]
+        for k in range(1, n_years):
+            if k == 1 and p in beans_last_year:
+                continue
+            window_cols = np.concatenate([col_map[kk, cols] for kk in range(max(k - 2, 0), k + 1)])
+            add_row(window_cols, -np.ones(len(window_cols)), -min_bean_area)
+
+    n_total = binary_col
+    n_links = n_total - n_years * n_vars
+    link_matrix = sp.csr_matrix((np.concatenate(link_vals), (np.concatenate(link_rows), np.concatenate(link_cols))),
+                                shape=(len(link_rhs), n_total)) if link_rhs else sp.csr_matrix((0, n_total))
+    A_ub = sp.vstack([place_blocks([template['A_ub']] * n_years, col_map, n_total), link_matrix], format='csr')
+    A_eq = place_blocks([block['A_eq'] for block in blocks], col_map, n_total)
+
+    obj, ub, integrality = np.zeros(n_total), np.ones(n_total), np.ones(n_total)
+    for k, block in enumerate(blocks):
+        obj[col_map[k]] = block['obj']
+        ub[col_map[k]] = block['ub']
+        integrality[col_map[k]] = template['integrality']
+
+    return {
+        'obj': obj, 'A_ub': A_ub, 'b_ub': np.concatenate([block['b_ub'] for block in blocks] + [link_rhs]),
+        'A_eq': A_eq, 'b_eq': np.zeros(A_eq.shape[0]), 'lb': np.zeros(n_total), 'ub': ub, 'integrality': integrality,
+        'area_keys': [key for _ in years for key in template['area_keys']], 'n_area': n_years * n_area,
+        'year': years[0], 'years': list(years), 'col_map': col_map, 'n_links': n_links,
+    }
+
+
+# 求解窗口模型（默认先剪枝），返回各年 [地块, 作物, 季次] 面积数组、各年利润与求解信息（模型规模、用时、状态）
+# 单年窗口与单年模型的行列相同，与 solve_sparse_model 一样用模板中的热启动状态求解，结果与逐年求解完全一致；
+# 多年窗口冷启动，面积小于 tol 的取 0：跨年轮作的 0-1 变量为 0 时面积可能留有求解器容差内的残差，
+# 而下一个窗口与规则检查按面积 > 0 判断上一年是否种过
+def solve_window_model(model, enc, template, prune=True, tol=1e-6, **solver_options):
+    solve_model = prune_model(model) if prune else model
+    single_year = len(model['years']) == 1
+    result = solve_highs(solve_model, warm_start=template['warm_start'] if single_year else None,
+                         use_warm_start=single_year, **solver_options)
+    if result['x'] is None:
+        raise RuntimeError(f"{model['years'][0]}-{model['years'][-1]}年窗口模型求解失败: {result['status']}")
+    x = np.zeros(len(model['obj']))
+    x[solve_model.get('col_ids', np.arange(len(x)))] = result['x']
+    if not single_year:
+        area_cols = x[:model['n_area']]
+        area_cols[area_cols < tol] = 0
+    keys = np.array(template['area_keys'], dtype=int).reshape(-1, 3)
+    solutions, profits = [], []
+    for columns in model['col_map']:
+        solution = np.zeros((len(enc['plots']), len(enc['crops']), len(enc['seasons'])))
+        solution[keys[:, 0], keys[:, 1], keys[:, 2]] = x[columns[:template['n_area']]]
+        solutions.append(solution)
+        profits.append(float(model['obj'][columns] @ x[columns]))
+    if single_year:
+        profits = [result['objective']]   # 与逐年求解的目标值按相同的顺序求和
+    info = {'size': model_size(solve_model), 'time': result['stats']['time'], 'status': result['status'],
+            'objective': result['objective']}
+    return solutions, profits, info
+
+
+# 滚动时域求解 years（默认为当前时域的规划年份）：每个窗口取 window 年联合求解，确定前 window - overlap 年后向后滚动
+# 各年系数取自 module.get_year_coefficients（同一年只取一次，重叠的窗口使用相同的系数），solver_options 传给 solve_highs
+# 返回 {年份: [地块, 作物, 季次] 面积数组}、{年份: 年利润} 与每个窗口的记录（年份、确定的年份、模型规模、建模与求解用时）
+def rolling_horizon(module, template, enc, params, planting_2023, window=1, overlap=0, years=None, **solver_options):
+    if not 0 <= overlap < window:
+        raise ValueError(f"重叠年数应满足 0 <= overlap < window，实际为 window={window}，overlap={overlap}")
+    years = planning_years() if years is None else list(years)
+    step = window - overlap
+    clear_warm_start(template['warm_start'])   # 与一次实验相同，从没有热启动点开始
+    coefs, solved_decision_vars, profits, log = {}, {}, {}, []
+    first = 0
+    while first < len(years):
+        window_years = years[first:first + window]
+        for year in window_years:
+            if year not in coefs:
+                coefs[year] = module.get_year_coefficients(params, enc, year)
+        start = time.perf_counter()
+        model = build_window_model(template, enc, [coefs[year] for year in window_years], solved_decision_vars,
+                                   planting_2023, window_years)
+        build_time = time.perf_counter() - start
+        solutions, year_profits, info = solve_window_model(model, enc, template, **solver_options)
+        committed = window_years if window_years[-1] == years[-1] else window_years[:step]
+        for k, year in enumerate(committed):
+            solved_decision_vars[year] = solutions[k]
+            profits[year] = year_profits[k]
+        log.append({'years': window_years, 'committed': committed, 'size': info['size'], 'links': model['n_links'],
+                    'build_time': build_time, 'solve_time': info['time'], 'objective': info['objective'],
+                    'status': info['status']})
+        first += len(committed)
+    return solved_decision_vars, profits, log
+
+
+# 一个窗口的求解记录（一行）；超出时间上限等未证明最优的窗口注明求解状态
+def format_window_log(entry):
+    size = entry['size']
+    status = '' if entry['status'] == 'Optimal' else f"（未证明最优: {entry['status']}）"
+    return (f"窗口 {entry['years'][0]}-{entry['years'][-1]}年（确定 {entry['committed'][0]}-{entry['committed'][-1]}年）: "
+            f"{size['variables']} 变量（{size['binaries']} 个 0-1）/ "
+            f"{size['constraints']} 约束（剪枝前跨年轮作 0-1 变量 {entry['links']} 个），建模 {entry['build_time']:.2f} s，求解 {entry['solve_time']:.2f} s，"
+            f"窗口目标值 {entry['objective']:.2f}{status}")
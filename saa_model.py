@@ -0,0 +1,187 @@
+import time
+
+import numpy as np
+import scipy.sparse as sp
+
+from solver import new_warm_start, solve_highs
+from sparse_model import update_model_template, prune_model, model_size
+
+# 两阶段随机规划（样本均值近似，SAA）的扩展形式：
+# 第一阶段为本年种植方案（面积变量与规则1.1、5的 0-1 变量），N 个情景共用，结构约束与单情景模型相同；
+# 第二阶段为每个情景各自的销售分配（未超出 / 超出预期销售量部分），每个情景一组产量平衡等式；
+# 目标为 N 个情景利润的（按情景概率加权）平均值。约束矩阵按情景分块，非零元个数随情景数线性增长
+# 列排列：面积变量，0-1 变量，情景 0 的未超出部分、超出部分，情景 1 的……
+# 风险规避模式（add_cvar）在最后追加 CVaR 的辅助变量 η 与各情景的缺口 u，
+# 目标为 (1 - λ) × 期望利润 + λ × CVaR_α（最差 α 比例情景的平均利润），λ 为风险权重
+
+
+# 各情景的系数：[情景, 面积变量] 的种植成本、亩产量与 [情景, 作物季次对] 的销售额系数、预期销售量
+def scenario_arrays(template, coefs):
+    area_f, area_c, area_s = template['area_f'], template['area_c'], template['area_s']
+    pair_c, pair_s = template['pair_c'], template['pair_s']
+    return {
+        'cost': np.array([coef['cost'][area_f, area_c, area_s] for coef in coefs]),
+        'yields': np.array([coef['yield'][area_f, area_c, area_s] for coef in coefs]),
+        'revenue': np.array([coef['sale_price'][pair_c, pair_s] * coef['row_count'][pair_c, pair_s] for coef in coefs]),
+        'ratio': np.array([coef['beyond_price_ratio'] for coef in coefs])[:, None],
+        'expected_sales': np.array([coef['expected_sales'][pair_c, pair_s] for coef in coefs]),
+    }
+
+
+# 面积变量所属的作物季次对
+def area_pairs(template, enc):
+    pair_index = np.full((len(enc['crops']), len(enc['seasons'])), -1)
+    pair_index[template['pair_c'], template['pair_s']] = np.arange(template['n_pairs'])
+    return pair_index[template['area_c'], template['area_s']]
+
+
+# 建立本年的 SAA 扩展形式；coefs 为各情景的模型系数（与 get_year_coefficients 的返回值相同）
+# weights 为各情景的概率（默认等概率，情景削减后为代表情景的权重）
+def build_saa_model(template, enc, coefs, solved_decision_vars, planting_2023, year, weights=None):
+    model = update_model_template(template, enc, coefs[0], solved_decision_vars, planting_2023, year)
+    n_area, n_pairs, n_scenarios = template['n_area'], template['n_pairs'], len(coefs)
+    n_continuous = n_area + 2 * n_pairs
+    first_stage = np.concatenate([np.arange(n_area), np.arange(n_continuous, len(model['obj']))])
+    n_first = len(first_stage)
+    n_vars = n_first + 2 * n_pairs * n_scenarios
+    weights = np.full(n_scenarios, 1 / n_scenarios) if weights is None else np.asarray(weights, dtype=float)
+    arrays = scenario_arrays(template, coefs)
+    revenue, ratio = arrays['revenue'], arrays['ratio']
+
+    # 目标函数：按情景概率加权的销售额 - 种植成本
+    obj = np.zeros(n_vars)
+    obj[:n_area] = -weights @ arrays['cost']
+    second_stage = obj[n_first:].reshape(n_scenarios, 2, n_pairs)
+    second_stage[:, 0] = revenue * weights[:, None]
+    second_stage[:, 1] = revenue * ratio * weights[:, None]
+
+    # 等式约束：每个情景 未超出 + 超出 - 总产量 = 0
+    scenario_rows = (np.arange(n_scenarios) * n_pairs)[:, None]
+    scenario_cols = n_first + (np.arange(n_scenarios) * 2 * n_pairs)[:, None]
+    rows = np.concatenate([(scenario_rows + area_pairs(template, enc)).ravel(),
+                           (scenario_rows + np.arange(n_pairs)).ravel(),
+                           (scenario_rows + np.arange(n_pairs)).ravel()])
+    cols = np.concatenate([np.tile(np.arange(n_area), n_scenarios),
+                           (scenario_cols + np.arange(n_pairs)).ravel(),
+                           (scenario_cols + n_pairs + np.arange(n_pairs)).ravel()])
+    vals = np.concatenate([-arrays['yields'].ravel(), np.ones(2 * n_pairs * n_scenarios)])
+    A_eq = sp.csr_matrix((vals, (rows, cols)), shape=(n_scenarios * n_pairs, n_vars))
+
+    # 不等式约束只涉及第一阶段变量，沿用模板（面积、豆类、互斥、对称性约束）
+    A_ub = sp.hstack([model['A_ub'][:, first_stage],
+                      sp.csr_matrix((model['A_ub'].shape[0], n_vars - n_first))], format='csr')
+
+    ub = np.full(n_vars, np.inf)
+    ub[:n_first] = model['ub'][first_stage]
+    ub[n_first:].reshape(n_scenarios, 2, n_pairs)[:, 0] = arrays['expected_sales']
+    integrality = np.zeros(n_vars)
+    integrality[:n_first] = model['integrality'][first_stage]
+
+    return {
+        'obj': obj, 'A_ub': A_ub, 'b_ub': model['b_ub'].copy(), 'A_eq': A_eq, 'b_eq': np.zeros(n_scenarios * n_pairs),
+        'lb': np.zeros(n_vars), 'ub': ub, 'integrality': integrality,
+        'area_keys': model['area_keys'], 'n_area': n_area, 'n_first': n_first, 'n_pairs': n_pairs,
+        'n_scenarios': n_scenarios, 'year': year, 'weights': weights,
+        'revenue': revenue, 'ratio': ratio, 'cost': arrays['cost'],
+        'warm_start': new_warm_start(n_vars, A_ub.shape[0] + A_eq.shape[0]),
+    }
+
+
+# 加入 CVaR 的线性化（Rockafellar-Uryasev）：CVaR_α = max η - (1/α) Σ p_k u_k，u_k >= η - 情景 k 的利润，u_k >= 0
+# 每个情景一行 η - 利润_k - u_k <= 0；加入后用 set_risk_weight 设定目标，改变风险权重不需要重建模型
+def add_cvar(model, alpha=0.1):
+    n_vars, n_scenarios, n_pairs, n_first = len(model['obj']), model['n_scenarios'], model['n_pairs'], model['n_first']
+    n_area = model['n_area']
+    # 情景 k 的利润 = 销售额系数 · (未超出 + 折扣 × 超出) - 种植成本 · 面积
+    sales_cols = n_first + np.arange(2 * n_pairs * n_scenarios).reshape(n_scenarios, 2, n_pairs)
+    rows = np.concatenate([np.repeat(np.arange(n_scenarios), n_area), np.repeat(np.arange(n_scenarios), 2 * n_pairs),
+                           np.arange(n_scenarios), np.arange(n_scenarios)])
+    cols = np.concatenate([np.tile(np.arange(n_area), n_scenarios), sales_cols.ravel(),
+                           np.full(n_scenarios, n_vars), n_vars + 1 + np.arange(n_scenarios)])
+    vals = np.concatenate([model['cost'].ravel(),
+                           -np.stack([model['revenue'], model['revenue'] * model['ratio']], axis=1).ravel(),
+                           np.ones(n_scenarios), -np.ones(n_scenarios)])
+    n_total = n_vars + 1 + n_scenarios
+    cvar_rows = sp.csr_matrix((vals, (rows, cols)), shape=(n_scenarios, n_total))
+    extra = n_total - n_vars
+    cvar_model = dict(model)
+    cvar_model.update({
+        'A_ub': sp.vstack([sp.hstack([model['A_ub'], sp.csr_matrix((model['A_ub'].shape[0], extra))]), cvar_rows],
+                          format='csr'),
+        'b_ub': np.concatenate([model['b_ub'], np.zeros(n_scenarios)]),
+        'A_eq': sp.hstack([model['A_eq'], sp.csr_matrix((model['A_eq'].shape[0], extra))], format='csr'),
+        'lb': np.concatenate([model['lb'], [-np.inf], np.zeros(n_scenarios)]),
+        'ub': np.concatenate([model['ub'], np.full(extra, np.inf)]),
+        'integrality': np.concatenate([model['integrality'], np.zeros(extra)]),
+        'mean_obj': np.concatenate([model['obj'], np.zeros(extra)]),
+        'cvar_obj': np.concatenate([np.zeros(n_vars), [1], -model['weights'] / alpha]),
+        'alpha': alpha, 'obj': np.zeros(n_total),
+        'warm_start': new_warm_start(n_total, len(model['b_ub']) + n_scenarios + model['A_eq'].shape[0]),
+    })
+    return set_risk_weight(cvar_model, 0.0)
+
+
+# 设定风险权重 λ（原地修改目标函数）：0 为期望利润，1 为只看 CVaR
+def set_risk_weight(model, risk_weight):
+    model['obj'][:] = (1 - risk_weight) * model['mean_obj'] + risk_weight * model['cvar_obj']
+    model['risk_weight'] = risk_weight
+    return model
+
+
+# 按概率加权的 CVaR_α：最差 α 概率质量情景的平均利润
+def weighted_cvar(values, weights, alpha):
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    taken = np.clip(alpha - (cumulative - weights[order]), 0, weights[order])
+    return float(values[order] @ taken / alpha)
+
+
+# 风险权重扫描：同一个 CVaR 模型依次改目标函数求解，每次以上一个权重的解与基热启动
+# 返回 [(风险权重, 面积数组, 期望利润, CVaR, 求解信息)]
+def risk_sweep(model, enc, risk_weights, warm_start=True, **solver_options):
+    results = []
+    for risk_weight in risk_weights:
+        set_risk_weight(model, risk_weight)
+        solution, _, scenario_profits, info = solve_saa_model(model, enc, warm_start=warm_start, **solver_options)
+        results.append((risk_weight, solution, float(model['weights'] @ scenario_profits),
+                        weighted_cvar(scenario_profits, model['weights'], model['alpha']), info))
+    return results
+
+
+# 求解 SAA 扩展形式（默认先剪枝），返回 [地块, 作物, 季次] 面积数组、加权平均利润、[情景] 各情景利润与求解信息
+# solver_options 传给 solver.solve_highs：time_limit、mip_gap、threads、verbose、engine
+# warm_start 为真时用模型中保存的上一次解与基热启动（风险权重扫描中同一模型反复求解）
+def solve_saa_model(model, enc, prune=True, warm_start=False, **solver_options):
+    size = model_size(model)
+    pruned = prune_model(model) if prune else model
+    start = time.perf_counter()
+    result = solve_highs(pruned, warm_start=model['warm_start'], use_warm_start=warm_start, **solver_options)
+    solve_time = time.perf_counter() - start
+    if result['x'] is None:
+        raise RuntimeError(f"{model['year']}年 SAA 模型求解失败: {result['status']}")
+    x = np.zeros(len(model['obj']))
+    x[pruned.get('col_ids', np.arange(len(model['obj'])))] = result['x']
+
+    solution = np.zeros((len(enc['plots']), len(enc['crops']), len(enc['seasons'])))
+    keys = np.array(model['area_keys'], dtype=int).reshape(-1, 3)
+    solution[keys[:, 0], keys[:, 1], keys[:, 2]] = x[:model['n_area']]
+    # 各情景利润：该情景的销售额 - 种植成本
+    n_sales = 2 * model['n_pairs'] * model['n_scenarios']
+    sales = x[model['n_first']:model['n_first'] + n_sales].reshape(model['n_scenarios'], 2, model['n_pairs'])
+    scenario_profits = ((model['revenue'] * (sales[:, 0] + model['ratio'] * sales[:, 1])).sum(axis=1)
+                        - model['cost'] @ x[:model['n_area']])
+    info = {'scenarios': model['n_scenarios'], 'size': size, 'time': solve_time, 'status': result['status'],
+            'stats': result['stats']}
+    return solution, result['objective'], scenario_profits, info
+
+
+# 固定第一阶段种植方案后各情景的利润 [情景]：第二阶段有闭式解，
+# 每个作物季次的总产量中不超过预期销售量的部分按原价售出，其余按折扣价售出
+def evaluate_first_stage(template, enc, arrays, solution):
+    area = solution[template['area_p'], template['area_c'], template['area_s']]
+    to_pairs = sp.csr_matrix((np.ones(template['n_area']), (np.arange(template['n_area']), area_pairs(template, enc))),
+                             shape=(template['n_area'], template['n_pairs']))
+    production = (arrays['yields'] * area) @ to_pairs
+    under = np.minimum(production, arrays['expected_sales'])
+    revenue = (arrays['revenue'] * (under + arrays['ratio'] * (production - under))).sum(axis=1)
+    return revenue - arrays['cost'] @ area
@@ -0,0 +1,178 @@
+import warnings
+
+import numpy as np
+from scipy.stats import qmc
+
+from horizon import current_horizon, planning_years
+
+# 情景引擎：用 np.random.Generator 一次向量化生成 [实验, 年份, 作物季次对] 的销售量、亩产量、价格变化率张量，
+# 以及 [年份] 的成本变化率，分布与逐个作物抽样时相同（均相对基准年，见 horizon）：
+#   销售量：玉米、小麦每年增长 5%~10%，其余作物每年变化 -5%~5%
+#   亩产量：每年变化 -10%~10%
+#   成本：每年增长 5%（1 + 0.05 * 年数）
+#   价格：蔬菜每年上涨 5%，羊肚菌每年下降 5%，其余食用菌每年下降 1%~5%，粮食不变
+# 距基准年 k 年的变化率为 k 个独立抽样的每年变化率之积，每个年份分别抽样，各年份之间互相独立
+# 最后一维为 enc['crop_season_pairs'] 中的作物季次对，即 [实验, 年份, 作物, 季次] 张量中有效的部分，
+# 需要完整张量时用 expand_pairs 展开（无效位置取 1）
+# 需求弹性、同类作物替代性与豆类互补性表示为作物季次对之间的矩阵，由 apply_market_effects 批量施加
+# 抽样方式（sampling）：'random' 为独立均匀抽样；'antithetic' 为对偶抽样（第 2j、2j+1 个情景用 u 与 1 - u）；
+# 'lhs' 为拉丁超立方抽样，'sobol' 为加扰 Sobol 序列（随机拟蒙特卡洛），后两者在 [连乘因子, 作物季次对, 销售量/亩产量/价格]
+# 所有随机因素构成的单位超立方体上联合抽样，每个因素的边缘分布仍为原来的均匀分布
+
+grain_growth_crops = ['玉米', '小麦']   # 销售量逐年增长的作物
+vegetable_types = ['蔬菜', '蔬菜（豆类）']
+mushroom_type = '食用菌'
+falling_price_mushroom = '羊肚菌'   # 价格每年固定下降 5% 的食用菌
+sampling_schemes = ['random', 'antithetic', 'lhs', 'sobol']
+
+
+# 各作物季次对每年变化率的均匀分布区间 (low, high)，low == high 为确定的变化率
+def yearly_rate_bounds(enc, crop_types):
+    crops = np.array([enc['crops'][c] for c, _ in enc['crop_season_pairs']])
+    types = np.array([crop_types[c] for c, _ in enc['crop_season_pairs']])
+    grain = np.isin(crops, grain_growth_crops)
+    sales = (np.where(grain, 1.05, 0.95), np.where(grain, 1.1, 1.05))
+    yield_rate = (np.full(len(crops), 0.9), np.full(len(crops), 1.1))
+    price_low, price_high = np.ones(len(crops)), np.ones(len(crops))
+    vegetable = np.isin(types, vegetable_types)
+    price_low[vegetable] = price_high[vegetable] = 1.05
+    falling = crops == falling_price_mushroom
+    price_low[falling] = price_high[falling] = 0.95
+    mushroom = (types == mushroom_type) & ~falling
+    price_low[mushroom], price_high[mushroom] = 0.95, 0.99
+    return {'sales': sales, 'yield': yield_rate, 'price': (price_low, price_high)}
+
+
+# 单位超立方体 (0, 1)^num_dims 上按抽样方式生成 num_samples 个点 [样本, 维]
+def uniform_samples(rng, num_samples, num_dims, sampling='random'):
+    if sampling == 'random':
+        return rng.random((num_samples, num_dims))
+    if sampling == 'antithetic':
+        half = rng.random(((num_samples + 1) // 2, num_dims))
+        return np.stack([half, 1 - half], axis=1).reshape(-1, num_dims)[:num_samples]
+    if sampling == 'lhs':
+        return qmc.LatinHypercube(num_dims, seed=rng).random(num_samples)
+    if sampling == 'sobol':
+        if num_dims > qmc.Sobol.MAXDIM:
+            raise ValueError(f"Sobol 序列最多 {qmc.Sobol.MAXDIM} 维，实际为 {num_dims}（规划年数较多时改用 'lhs'）")
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)   # 样本数不是 2 的幂时 scipy 提示平衡性变差
+            return qmc.Sobol(num_dims, scramble=True, seed=rng).random(num_samples)
+    raise ValueError(f"未知的抽样方式: {sampling}（可选 {sampling_schemes}）")
+
+
+# 各年份的变化率，返回 [实验, 年份, 作物季次对]；powers 为各年份距基准年的年数，第 k 年的变化率是 k 个独立抽样的
+# 每年变化率之积，每个年份都重新抽样（与逐个作物抽样时相同，不同年份之间互相独立，而不是同一条路径上的累乘）
+# 区间退化（确定变化率）的作物季次对直接取 low 的幂，只对其余作物季次对抽样；
+# 给定 uniforms（[实验, sum(powers), 随机的作物季次对] 的 (0, 1) 样本）时按年份依次取用，代替 rng 的独立抽样
+def compound_rates(rng, num_experiments, powers, low, high, dtype, uniforms=None):
+    rates = np.empty((num_experiments, len(powers), len(low)), dtype=dtype)
+    random = low != high
+    if random.all():
+        width, low = (high - low).astype(dtype), low.astype(dtype)
+        factor = np.empty((num_experiments, len(low)), dtype=dtype)
+        offset = 0
+        for i, power in enumerate(powers):
+            rates[:, i] = 1
+            for _ in range(power):
+                if uniforms is None:
+                    rng.random(out=factor, dtype=dtype)
+                else:
+                    factor[:] = uniforms[:, offset]
+                offset += 1
+                factor *= width
+                factor += low
+                rates[:, i] *= factor
+        return rates
+    rates[:] = (low ** np.asarray(powers)[:, None]).astype(dtype)
+    if random.any():
+        rates[:, :, random] = compound_rates(rng, num_experiments, powers, low[random], high[random], dtype, uniforms)
+    return rates
+
+
+# 生成 num_experiments 个情景；crop_types 为按作物编码排列的作物类型，sampling 为抽样方式（见文件开头）
+# years 默认为当前时域的规划年份，变化率相对当前时域的基准年
+# 返回 {'years', 'pairs', 'sales', 'yield', 'price': [实验, 年份, 作物季次对] 张量, 'cost': [年份] 向量}
+def draw_scenarios(enc, crop_types, num_experiments, rng, years=None, dtype=np.float32, sampling='random'):
+    years = planning_years() if years is None else years
+    powers = [year - current_horizon['base_year'] for year in years]
+    scenarios = {'years': list(years), 'pairs': enc['crop_season_pairs'],
+                 'cost': (1 + 0.05 * np.asarray(powers)).astype(dtype)}
+    bounds = yearly_rate_bounds(enc, crop_types)
+    uniforms = dict.fromkeys(bounds)
+    if sampling != 'random':
+        # 所有随机因素一起抽样，再按变化率类型切分为 [实验, 连乘因子, 随机的作物季次对]
+        widths = [int((low != high).sum()) for low, high in bounds.values()]
+        samples = uniform_samples(rng, num_experiments, sum(powers) * sum(widths), sampling)
+        samples = samples.reshape(num_experiments, sum(powers), sum(widths))
+        for name, part in zip(bounds, np.split(samples, np.cumsum(widths)[:-1], axis=2)):
+            uniforms[name] = part
+    for name, (low, high) in bounds.items():
+        scenarios[name] = compound_rates(rng, num_experiments, powers, low, high, dtype, uniforms[name])
+    return scenarios
+
+
+# [..., 作物季次对] 展开为 [..., 作物, 季次]，无效的作物季次取 1
+def expand_pairs(rates, enc):
+    full = np.ones(rates.shape[:-1] + (len(enc['crops']), len(enc['seasons'])), dtype=rates.dtype)
+    crops, seasons = np.array(enc['crop_season_pairs']).T
+    full[..., crops, seasons] = rates
+    return full
+
+
+# 市场效应矩阵（作物季次对 × 作物季次对），只依赖作物类型，每个流程建一次：
+#   elasticity：本作物价格对销售量的需求弹性系数 [作物季次对]
+#   substitution：同季次、同类型的其他作物记 1（替代性），substitutability 为其价格影响系数 [作物季次对]
+#   complementarity：[(互补性系数, 矩阵)]，矩阵中该类型作物与同季次的豆类作物记 1
+def market_effect_matrices(enc, crop_types, elasticity, substitutability, complementarity, bean_crops):
+    pairs = enc['crop_season_pairs']
+    crops = np.array([c for c, _ in pairs])
+    seasons = np.array([s for _, s in pairs])
+    types = np.array([crop_types[c] for c in crops])
+    same_season = seasons[:, None] == seasons[None, :]
+    substitution = same_season & (types[:, None] == types[None, :]) & (crops[:, None] != crops[None, :])
+    bean = np.isin([enc['crops'][c] for c in crops], bean_crops)
+    return {
+        'elasticity': np.array([elasticity[t] for t in types]),
+        'substitutability': np.array([substitutability[t] for t in types]),
+        'substitution': substitution.astype(float),
+        'complementarity': [(coefficient, (same_season & (types == crop_type)[:, None] & bean[None, :]).astype(float))
+                            for crop_type, coefficient in complementarity.items()],
+    }
+
+
+# 对 [..., 作物季次对] 的变化率张量施加市场效应，返回 (销售量变化率, 亩产量变化率)：
+#   销售量 × (1 + 弹性系数 × 本作物价格变化率) × ∏ 同类其他作物 (1 + 替代性系数 × 价格变化率)
+#   亩产量 × ∏ 同季次豆类 (1 + 互补性系数 × 豆类亩产量变化率)
+# 连乘取对数后为一次批量矩阵乘
+def apply_market_effects(effects, sales, yield_rate, price):
+    sales = sales * (1 + effects['elasticity'] * price) \
+        * np.exp(np.log1p(effects['substitutability'] * price) @ effects['substitution'].T)
+    log_complement = sum(np.log1p(coefficient * yield_rate) @ matrix.T
+                         for coefficient, matrix in effects['complementarity'])
+    return sales, yield_rate * np.exp(log_complement)
+
+
+# [作物, 季次] 到作物季次对编号的查找表，无效的作物季次为 -1
+def pair_index_array(enc):
+    index = np.full((len(enc['crops']), len(enc['seasons'])), -1)
+    crops, seasons = np.array(enc['crop_season_pairs']).T
+    index[crops, seasons] = np.arange(len(crops))
+    return index
+
+
+# 按作物季次对的变化率得到某年的模型系数（亩产量、成本、预期销售量、销售价格）
+# sales、yield_rate、price 为 [作物季次对]，cost 为成本变化率
+def apply_year_rates(params, enc, sales, yield_rate, price, cost):
+    index = pair_index_array(enc)
+    crops, seasons = np.array(enc['crop_season_pairs']).T
+    f, c, s = np.array(enc['field_rows']).T
+    coef = dict(params)
+    coef['yield'] = params['yield'].copy()
+    coef['yield'][f, c, s] = params['yield'][f, c, s] * yield_rate[index[c, s]]
+    coef['cost'] = params['cost'] * cost
+    coef['expected_sales'] = params['expected_sales'].copy()
+    coef['expected_sales'][crops, seasons] = params['expected_sales'][crops, seasons] * sales
+    coef['sale_price'] = params['sale_price'].copy()
+    coef['sale_price'][crops, seasons] = params['sale_price'][crops, seasons] * price
+    return coef
@@ -0,0 +1,52 @@
+import numpy as np
+
+# 情景削减：把大量抽样情景压缩为少量带权重的代表情景，供多情景（SAA）模型使用
+# 情景之间的距离取各年销售量、亩产量、价格变化率（[年份, 作物季次对] 张量）取对数、按列标准化后的欧氏距离；
+# 用快速前向选择（fast forward selection）逐个挑选使 Kantorovich 距离下降最多的情景，
+# 未选中的情景把概率并入距离最近的代表情景
+
+
+# 情景特征 [情景, 特征]：三个变化率张量取对数后展平，每列除以其标准差（确定的列不参与距离）
+def scenario_features(scenarios):
+    features = np.concatenate([np.log(scenarios[name]).reshape(len(scenarios[name]), -1)
+                               for name in ['sales', 'yield', 'price']], axis=1)
+    std = features.std(axis=0)
+    random = std > 0
+    return (features[:, random] - features[:, random].mean(axis=0)) / std[random]
+
+
+# 两两距离矩阵 [情景, 情景]
+def pairwise_distances(features):
+    squared = (features ** 2).sum(axis=1)
+    return np.sqrt(np.maximum(squared[:, None] + squared[None, :] - 2 * features @ features.T, 0))
+
+
+# 快速前向选择：返回选中的情景编号、各代表情景的概率与每个情景归入的代表情景（在选中列表中的位置）
+# probabilities 为原情景概率（默认等概率）；每步选使 sum_i p_i * min(到已选情景的距离) 最小的情景
+def fast_forward_selection(distances, num_selected, probabilities=None):
+    n = len(distances)
+    probabilities = np.full(n, 1 / n) if probabilities is None else np.asarray(probabilities, dtype=float)
+    nearest = np.full(n, np.inf)   # 每个情景到已选情景的最近距离
+    selected = []
+    for _ in range(min(num_selected, n)):
+        cost = probabilities @ np.minimum(nearest[:, None], distances)
+        cost[selected] = np.inf
+        u = int(np.argmin(cost))
+        selected.append(u)
+        nearest = np.minimum(nearest, distances[:, u])
+    assignment = np.argmin(distances[:, selected], axis=1)
+    weights = np.bincount(assignment, weights=probabilities, minlength=len(selected))
+    return np.array(selected), weights, assignment
+
+
+# 把 draw_market_scenarios 生成的情景削减为 num_selected 个代表情景
+# 返回与输入格式相同、只含代表情景的情景字典，另加 'weights'（概率）、'selected'（原编号）与 'distance'（Kantorovich 距离）
+def reduce_scenarios(scenarios, num_selected):
+    distances = pairwise_distances(scenario_features(scenarios))
+    selected, weights, assignment = fast_forward_selection(distances, num_selected)
+    reduced = dict(scenarios)
+    for name in ['sales', 'yield', 'price']:
+        reduced[name] = scenarios[name][selected]
+    reduced.update({'weights': weights, 'selected': selected,
+                    'distance': float(distances[np.arange(len(distances)), selected[assignment]].mean())})
+    return reduced
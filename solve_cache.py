@@ -0,0 +1,46 @@
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+
+# 求解缓存：以本年模型系数、年份与种植历史的内容哈希为键，
+# 完全相同的 (情景, 年份, 历史) 直接返回之前的解，不再求解
+
+coefficient_names = ['yield', 'cost', 'valid', 'sale_price', 'row_count', 'expected_sales']  # 参与建模的系数
+
+
+# 求解的内容哈希：系数数组、年份、前两年的种植面积（起始年之前的年份用基准年种植情况）
+def solve_key(coef, year, solved_decision_vars, planting_2023):
+    h = hashlib.sha1()
+    h.update(f"{year}|{coef['beyond_price_ratio']!r}".encode())
+    for name in coefficient_names:
+        array = np.ascontiguousarray(coef[name])
+        h.update(f"{name}{array.dtype}{array.shape}".encode())
+        h.update(array.tobytes())
+    for history_year in [year - 1, year - 2]:
+        h.update(np.ascontiguousarray(solved_decision_vars.get(history_year, planting_2023)).tobytes())
+    return h.hexdigest()
+
+
+# 新建缓存，最多保留 max_entries 个解（按最近使用淘汰）
+def new_solve_cache(max_entries=512):
+    return {'entries': OrderedDict(), 'max_entries': max_entries, 'hits': 0, 'misses': 0}
+
+
+# 查缓存，未命中返回 None
+def cache_get(cache, key):
+    entry = cache['entries'].get(key)
+    if entry is None:
+        cache['misses'] += 1
+        return None
+    cache['entries'].move_to_end(key)
+    cache['hits'] += 1
+    return entry
+
+
+# 写缓存
+def cache_put(cache, key, entry):
+    cache['entries'][key] = entry
+    cache['entries'].move_to_end(key)
+    while len(cache['entries']) > cache['max_entries']:
+        cache['entries'].popitem(last=False)
@@ -0,0 +1,189 @@
+import time
+
+import numpy as np
+import pulp
+import scipy.sparse as sp
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+# 求解器层：PuLP 模型交给 CBC（子进程 + 临时文件），稀疏矩阵模型交给进程内的 HiGHS
+# 装了 highspy 时直接调用 highspy，否则用 scipy 自带的 HiGHS（scipy.optimize.milp）
+# 每次调用都可指定 time_limit（秒）、mip_gap（相对间隙）、threads（线程数）、verbose（是否输出日志）
+# highspy 支持热启动：线性松弛用上一次的基做单纯形热启动，MIP 用上一次的解作初始可行解
+
+default_mip_gap = 1e-6  # HiGHS 默认 1e-4 偏松，与 CBC 的目标值会差到 1e-5 量级
+
+
+# 用 CBC 求解 PuLP 模型，返回状态与目标值
+def solve_pulp(model, time_limit=None, mip_gap=None, threads=None, verbose=False):
+    model.solve(pulp.PULP_CBC_CMD(msg=verbose, timeLimit=time_limit, gapRel=mip_gap, threads=threads))
+    return {'status': pulp.LpStatus[model.status], 'objective': pulp.value(model.objective)}
+
+
+# 热启动状态：按全局列号、行号保存每个年份最近一次求解的解与基，优先取同一年份（同一模型重复求解时），
+# 否则取最近一次（逐年求解时即上一年）；实验运行器在每次实验开始时清空（clear_warm_start）
+# 剪枝后模型的列、行通过 col_ids、row_ids 对应到全局编号；log 记录每次求解的迭代次数、分支节点数与用时
+def new_warm_start(n_cols, n_rows):
+    return {'n_cols': n_cols, 'n_rows': n_rows, 'solutions': {}, 'last_year': None, 'log': []}
+
+
+# 取本次求解可用的热启动点 (col_value, col_status, row_status)，没有则返回 None
+def warm_start_point(warm_start, year):
+    if warm_start is None:
+        return None
+    solutions = warm_start['solutions']
+    return solutions.get(year, solutions.get(warm_start['last_year']))
+
+
+# 由松弛解的面积确定 0-1 变量：先全取 0，被违反的行中系数为负的 0-1 变量改取 1
+# 改完后满足全部约束则该松弛解就是 MIP 的最优解（0-1 变量目标系数为 0），否则返回 None
+def round_binaries(model, x, tol=1e-7):
+    binary = model['integrality'] == 1
+    x = x.copy()
+    x[binary] = 0
+    violated = model['A_ub'] @ x - model['b_ub'] > tol
+    needs_one = (model['A_ub'][violated][:, binary] < 0).toarray().any(axis=0)
+    x[np.flatnonzero(binary)[needs_one]] = 1
+    if (model['A_ub'] @ x - model['b_ub'] <= tol).all():
+        return x
+    return None
+
+
+# 用 highspy 求解：约束 A_ub x <= b_ub 与 A_eq x = b_eq 合并成按行存储的一个矩阵
+# 先用上一次的基热启动求解线性松弛（对偶单纯形只需少量迭代），松弛解可取整时直接返回，
+# 否则再解 MIP，并以上一次的解作初始可行解
+def solve_with_highspy(model, time_limit=None, mip_gap=default_mip_gap, threads=None, verbose=False,
+                       warm_start=None, use_warm_start=True):
+    A = sp.vstack([model['A_ub'], model['A_eq']], format='csr')
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = A.shape[1], A.shape[0]
+    lp.sense_ = highspy.ObjSense.kMaximize
+    lp.col_cost_ = model['obj']
+    lp.col_lower_ = model['lb']
+    lp.col_upper_ = model['ub']
+    lp.row_lower_ = np.concatenate([np.full(len(model['b_ub']), -np.inf), model['b_eq']])
+    lp.row_upper_ = np.concatenate([model['b_ub'], model['b_eq']])
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.start_ = A.indptr
+    lp.a_matrix_.index_ = A.indices
+    lp.a_matrix_.value_ = A.data
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', bool(verbose))
+    h.setOptionValue('mip_rel_gap', mip_gap)
+    if time_limit is not None:
+        h.setOptionValue('time_limit', float(time_limit))
+    if threads is not None:
+        h.setOptionValue('threads', int(threads))
+
+    # 热启动点：全局编号下的上一次解与基，取到本模型的列、行上
+    col_ids = model.get('col_ids', np.arange(A.shape[1]))
+    row_ids = model.get('row_ids', np.arange(A.shape[0]))
+    is_mip = bool(model['integrality'].any())
+    point = warm_start_point(warm_start, model.get('year')) if use_warm_start else None
+
+    start = time.perf_counter()
+    h.passModel(lp)
+    if point is not None:
+        basis = highspy.HighsBasis()
+        basis.col_status = [highspy.HighsBasisStatus(v) for v in point[1][col_ids]]
+        basis.row_status = [highspy.HighsBasisStatus(v) for v in point[2][row_ids]]
+        basis.alien = True  # 剪枝后的行列与上一次不同，由 HiGHS 修正为合法的基
+        h.setBasis(basis)
+    h.run()
+    info = h.getInfo()
+    iterations, nodes = info.simplex_iteration_count, 0
+    status = h.modelStatusToString(h.getModelStatus())
+    x, lp_basis = None, None
+    if info.primal_solution_status == 2:    # 2 为可行解
+        x = np.array(h.getSolution().col_value)
+        lp_basis = h.getBasis()
+    relaxation_integral = False
+    if is_mip and x is not None:
+        x = round_binaries(model, x)
+        relaxation_integral = x is not None
+
+    if is_mip and lp_basis is not None and not relaxation_integral:
+        lp.integrality_ = [highspy.HighsVarType.kInteger if flag else highspy.HighsVarType.kContinuous
+                           for flag in model['integrality']]
+        h.passModel(lp)
+        if point is not None:
+            start_solution = highspy.HighsSolution()
+            start_solution.col_value = point[0][col_ids]
+            h.setSolution(start_solution)
+        h.run()
+        info = h.getInfo()
+        iterations += info.simplex_iteration_count
+        nodes = info.mip_node_count
+        status = h.modelStatusToString(h.getModelStatus())
+        x = np.array(h.getSolution().col_value) if info.primal_solution_status == 2 else None
+
+    stats = {'iterations': iterations, 'nodes': nodes, 'time': time.perf_counter() - start,
+             'warm': point is not None, 'relaxation_integral': relaxation_integral}
+    if warm_start is not None:
+        warm_start['log'].append(stats)
+    if x is None:
+        return {'status': status, 'x': None, 'objective': None, 'stats': stats}
+
+    # 保存本次的解与线性松弛的基；剪掉的列取 0（处于下界），剪掉的行松弛变量在基中
+    if warm_start is not None:
+        col_value = np.zeros(warm_start['n_cols'])
+        col_value[col_ids] = x
+        col_status = np.full(warm_start['n_cols'], int(highspy.HighsBasisStatus.kLower))
+        row_status = np.full(warm_start['n_rows'], int(highspy.HighsBasisStatus.kBasic))
+        if lp_basis is not None and lp_basis.valid:
+            col_status[col_ids] = [int(v) for v in lp_basis.col_status]
+            row_status[row_ids] = [int(v) for v in lp_basis.row_status]
+        warm_start['solutions'][model.get('year')] = (col_value, col_status, row_status)
+        warm_start['last_year'] = model.get('year')
+    return {'status': status, 'x': x, 'objective': float(model['obj'] @ x), 'stats': stats}
+
+
+# 用 scipy 自带的 HiGHS 求解（scipy 不提供线程数设置与热启动，threads、warm_start 只用于记录日志）
+def solve_with_scipy(model, time_limit=None, mip_gap=default_mip_gap, threads=None, verbose=False,
+                     warm_start=None, use_warm_start=True):
+    options = {'mip_rel_gap': mip_gap, 'disp': bool(verbose)}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    start = time.perf_counter()
+    res = milp(-model['obj'],
+               constraints=[LinearConstraint(model['A_ub'], -np.inf, model['b_ub']),
+                            LinearConstraint(model['A_eq'], model['b_eq'], model['b_eq'])],
+               integrality=model['integrality'], bounds=Bounds(model['lb'], model['ub']), options=options)
+    stats = {'iterations': None, 'nodes': getattr(res, 'mip_node_count', None),
+             'time': time.perf_counter() - start, 'warm': False, 'relaxation_integral': False}
+    if warm_start is not None:
+        warm_start['log'].append(stats)
+    if res.x is None:
+        return {'status': res.message, 'x': None, 'objective': None, 'stats': stats}
+    return {'status': res.message, 'x': res.x, 'objective': float(model['obj'] @ res.x), 'stats': stats}
+
+
+# 用进程内 HiGHS 求解稀疏模型（目标为最大化），engine 为 'highspy'、'scipy' 或 None（自动选择）
+# warm_start 为 new_warm_start 创建的热启动状态，求解后原地更新；use_warm_start 为假时冷启动，只保存解与日志
+def solve_highs(model, time_limit=None, mip_gap=default_mip_gap, threads=None, verbose=False, engine=None,
+                warm_start=None, use_warm_start=True):
+    if engine is None:
+        engine = 'highspy' if highspy is not None else 'scipy'
+    if engine == 'highspy':
+        if highspy is None:
+            raise ImportError("未安装 highspy，请使用 engine='scipy'")
+        return solve_with_highspy(model, time_limit, mip_gap, threads, verbose, warm_start, use_warm_start)
+    return solve_with_scipy(model, time_limit, mip_gap, threads, verbose, warm_start, use_warm_start)
+
+
+# 单次求解日志：迭代次数、分支节点数、用时、是否热启动
+def format_solve_stats(stats):
+    iterations = '-' if stats['iterations'] is None else stats['iterations']
+    return (f"单纯形迭代 {iterations} 次，分支节点 {stats['nodes']} 个，用时 {stats['time'] * 1e3:.1f} ms"
+            f"{'，热启动' if stats['warm'] else ''}{'，松弛解即最优' if stats['relaxation_integral'] else ''}")
+
+
+# 清空热启动状态中保存的解与基（保留日志），使一次实验的结果与之前求解过什么无关
+def clear_warm_start(warm_start):
+    warm_start['solutions'].clear()
+    warm_start['last_year'] = None
@@ -0,0 +1,298 @@
+import numpy as np
+import scipy.sparse as sp
+
+from solver import new_warm_start, solve_highs
+
+# 稀疏矩阵建模：与各 Q_* 脚本中 define_model 的目标函数和约束一致，
+# 直接生成 scipy.sparse CSR 约束矩阵与上下界向量，交给 solver.py 中的进程内 HiGHS 求解
+# 规则1.1与5为互斥种植，用 0-1 变量建成混合整数规划，big-M 取地块面积
+
+bean_crops = ['黄豆', '黑豆', '红豆', '绿豆', '爬豆', '豇豆', '刀豆', '芸豆']  # 豆类作物名称
+rotation_field_types = ['平旱地', '梯田', '山坡地', '水浇地']   # 规则1.2涉及的地块类型
+bean_field_types = ['平旱地', '梯田', '山坡地', '水浇地', '普通大棚', '智慧大棚']   # 规则2涉及的地块类型
+min_bean_area = 0.06    # 规则2：三年内豆类种植面积下限
+
+
+# 面积变量的排列：与 define_model 创建决策变量的顺序相同
+def area_variable_layout(enc):
+    area_keys = [(p, c, s) for f, c, s in enc['field_rows'] for p in enc['plots_of_type'][f]]
+    var_index = np.full((len(enc['plots']), len(enc['crops']), len(enc['seasons'])), -1)
+    for j, key in enumerate(area_keys):
+        var_index[key] = j
+    keys = np.array(area_keys, dtype=int).reshape(-1, 3)
+    return area_keys, keys, var_index
+
+
+# 由种植历史得到本年必须为 0 的面积变量（规则1.2、1.3）
+# 上一年没有求解结果（本年为起始年）时以基准年的种植情况 planting_2023 为历史
+def fixed_zero_mask(enc, coef, solved_decision_vars, planting_2023, year):
+    field_type_index = enc['field_type_index']
+    single, first, second = (enc['season_index'][name] for name in ['单季', '第一季', '第二季'])
+    smart_greenhouse = field_type_index['智慧大棚']
+    fixed = np.zeros((len(enc['plots']), len(enc['crops']), len(enc['seasons'])), dtype=bool)
+    smart_plots = enc['plots_of_type'][smart_greenhouse]
+    smart_crops = enc['crops_of_type'][smart_greenhouse]
+
+    # 1.2 单季作物不能连续两年种植
+    for f in [field_type_index[name] for name in rotation_field_types]:
+        crops = [c for c in enc['crops_of_type'][f] if coef['valid'][f, c, single]]
+        plots = enc['plots_of_type'][f]
+        if year - 1 not in solved_decision_vars:
+            planted = planting_2023[np.ix_(plots, crops)].any(axis=2)
+        else:
+            planted = solved_decision_vars[year - 1][np.ix_(plots, crops, [single])][:, :, 0] > 0
+        fixed[np.ix_(plots, crops, [single])] |= planted[:, :, None]
+    # 1.3 上一年第二季与本年第一季
+    if year - 1 not in solved_decision_vars:
+        planted = planting_2023[np.ix_(smart_plots, smart_crops)].any(axis=2)
+    else:
+        planted = solved_decision_vars[year - 1][np.ix_(smart_plots, smart_crops, [second])][:, :, 0] > 0
+    fixed[np.ix_(smart_plots, smart_crops, [first])] |= planted[:, :, None]
+    return fixed
+
+
+# 需要添加豆类约束的地块（前两年未种豆类）；起始年只知道一年历史，不添加，起始年之后第一年的前两年为基准年
+def plots_needing_beans(enc, solved_decision_vars, planting_2023, year):
+    if year - 1 not in solved_decision_vars:
+        return []
+    bean_codes = [enc['crop_index'][name] for name in bean_crops if name in enc['crop_index']]
+    field_types = [enc['field_type_index'][name] for name in bean_field_types]
+    plots = [p for f in field_types for p in enc['plots_of_type'][f]]
+    history = solved_decision_vars.get(year - 2, planting_2023)
+    volume = (solved_decision_vars[year - 1][np.ix_(plots, bean_codes)].sum(axis=(1, 2))
+              + history[np.ix_(plots, bean_codes)].sum(axis=(1, 2)))
+    return [p for p, v in zip(plots, volume) if v == 0]
+
+
+# 规则1.1与5中的互斥关系，每项对应一个 0-1 变量
+# 1.1：智慧大棚地块上两季都可种的作物，z=1 时只能种第一季，z=0 时只能种第二季
+# 5：水浇地地块，w=1 时只能种单季水稻，w=0 时只能种双季作物
+def exclusive_binaries(enc):
+    valid_rows = set(enc['field_rows'])
+    single, first, second = (enc['season_index'][name] for name in ['单季', '第一季', '第二季'])
+    smart_greenhouse = enc['field_type_index']['智慧大棚']
+    irrigated = enc['field_type_index']['水浇地']
+    rice = enc['crop_index']['水稻']
+    smart_pairs = [(p, c) for p in enc['plots_of_type'][smart_greenhouse]
+                   for c in enc['crops_of_type'][smart_greenhouse]
+                   if (smart_greenhouse, c, first) in valid_rows and (smart_greenhouse, c, second) in valid_rows]
+    irrigated_plots = []
+    if (irrigated, rice, single) in valid_rows:
+        irrigated_plots = list(enc['plots_of_type'][irrigated])
+    return smart_pairs, irrigated_plots
+
+
+# 可互换的地块：同类型、同面积，按地块顺序相邻的两块（只考虑含 0-1 变量的智慧大棚与水浇地）
+def interchangeable_plot_pairs(enc):
+    pairs = []
+    for name in ['智慧大棚', '水浇地']:
+        plots = enc['plots_of_type'][enc['field_type_index'][name]]
+        for area in np.unique(enc['plot_area'][plots]):
+            group = [p for p in plots if enc['plot_area'][p] == area]
+            pairs.extend(zip(group[:-1], group[1:]))
+    return pairs
+
+
+# 构建模型模板：变量与结构约束只建一次，之后每年（每次实验）只更新系数、上下界与右端项
+def build_model_template(enc):
+    area_keys, keys, var_index = area_variable_layout(enc)
+    n_area = len(area_keys)
+    pairs = enc['crop_season_pairs']
+    n_pairs = len(pairs)
+    pair_index = np.full(var_index.shape[1:], -1)
+    for k, (c, s) in enumerate(pairs):
+        pair_index[c, s] = k
+    smart_pairs, irrigated_plots = exclusive_binaries(enc)
+    n_binaries = len(smart_pairs) + len(irrigated_plots)
+    n_continuous = n_area + 2 * n_pairs   # 面积 + 未超出预期销售量部分 + 超出部分
+    n_vars = n_continuous + n_binaries    # 0-1 变量排在最后
+    area_p, area_c, area_s = keys[:, 0], keys[:, 1], keys[:, 2]
+    single, first, second = (enc['season_index'][name] for name in ['单季', '第一季', '第二季'])
+
+    # 等式约束：未超出 + 超出 - 总产量 = 0，产量系数每年更新
+    # 以条目编号建 CSR，记录 CSR 数据位置与条目的对应关系，更新时只改 data
+    eq_rows = np.concatenate([pair_index[area_c, area_s], np.arange(n_pairs), np.arange(n_pairs)])
+    eq_cols = np.concatenate([np.arange(n_area), n_area + np.arange(n_pairs), n_area + n_pairs + np.arange(n_pairs)])
+    A_eq = sp.csr_matrix((np.arange(1, len(eq_rows) + 1, dtype=float), (eq_rows, eq_cols)), shape=(n_pairs, n_vars))
+    eq_order = A_eq.data.astype(int) - 1
+
+    ub_rows, ub_cols, ub_vals, b_ub = [], [], [], []
+
+    # 逐行添加不等式约束 sum(vals * x[cols]) <= rhs
+    def add_row(cols, vals, rhs):
+        ub_rows.append(np.full(len(cols), len(b_ub)))
+        ub_cols.append(np.asarray(cols, dtype=int))
+        ub_vals.append(np.asarray(vals, dtype=float))
+        b_ub.append(rhs)
+
+    # 不等式约束 4：某地块某季节的种植总面积不超过地块面积
+    n_seasons = len(enc['seasons'])
+    cap_keys, cap_rows = np.unique(area_p * n_seasons + area_s, return_inverse=True)
+    ub_rows.append(cap_rows)
+    ub_cols.append(np.arange(n_area))
+    ub_vals.append(np.ones(n_area))
+    b_ub.extend(enc['plot_area'][cap_keys // n_seasons])
+
+    # 不等式约束 2：每个地块一行豆类约束，右端项每年更新（不需要时为 0，恒成立）
+    bean_codes = [enc['crop_index'][name] for name in bean_crops if name in enc['crop_index']]
+    bean_rows = {}
+    for f in [enc['field_type_index'][name] for name in bean_field_types]:
+        for p in enc['plots_of_type'][f]:
+            cols = var_index[p, bean_codes].ravel()
+            cols = cols[cols >= 0]
+            bean_rows[p] = len(b_ub)
+            add_row(cols, -np.ones(len(cols)), 0.0)
+
+    # 1.1 智慧大棚同一作物两季互斥：x第一季 <= A*z，x第二季 <= A*(1-z)
+    binary_col = n_continuous
+    binaries_of_plot = {}
+    for p, c in smart_pairs:
+        area = enc['plot_area'][p]
+        add_row([var_index[p, c, first], binary_col], [1, -area], 0.0)
+        add_row([var_index[p, c, second], binary_col], [1, area], area)
+        binaries_of_plot.setdefault(p, []).append(binary_col)
+        binary_col += 1
+    # 5. 水浇地单季水稻与双季作物互斥：x水稻 <= A*w，各季双季作物总面积 <= A*(1-w)
+    rice = enc['crop_index']['水稻']
+    for p in irrigated_plots:
+        area = enc['plot_area'][p]
+        add_row([var_index[p, rice, single], binary_col], [1, -area], 0.0)
+        for s in [first, second]:
+            cols = var_index[p, :, s]
+            cols = cols[cols >= 0]
+            if len(cols):
+                add_row(np.append(cols, binary_col), np.append(np.ones(len(cols)), area), area)
+        binaries_of_plot.setdefault(p, []).append(binary_col)
+        binary_col += 1
+
+    # 对称性：可互换地块的 0-1 变量之和按地块顺序不增，右端项每年更新（历史不同时为 inf，不生效）
+    symmetry_rows = []
+    for p, q in interchangeable_plot_pairs(enc):
+        if p not in binaries_of_plot or q not in binaries_of_plot:
+            continue
+        add_row(binaries_of_plot[q] + binaries_of_plot[p],
+                [1] * len(binaries_of_plot[q]) + [-1] * len(binaries_of_plot[p]), np.inf)
+        symmetry_rows.append((p, q, len(b_ub) - 1))
+
+    A_ub = sp.csr_matrix((np.concatenate(ub_vals), (np.concatenate(ub_rows), np.concatenate(ub_cols))),
+                         shape=(len(b_ub), n_vars))
+    integrality = np.zeros(n_vars)
+    integrality[n_continuous:] = 1
+    ub = np.full(n_vars, np.inf)
+    ub[n_continuous:] = 1
+
+    return {
+        'obj': np.zeros(n_vars), 'A_ub': A_ub, 'b_ub': np.array(b_ub, dtype=float),
+        'A_eq': A_eq, 'b_eq': np.zeros(n_pairs),
+        'lb': np.zeros(n_vars), 'ub': ub, 'integrality': integrality,
+        'area_keys': area_keys, 'n_area': n_area, 'n_pairs': n_pairs, 'year': None,
+        'area_f': enc['plot_type'][area_p], 'area_p': area_p, 'area_c': area_c, 'area_s': area_s,
+        'pair_c': np.array([c for c, _ in pairs], dtype=int), 'pair_s': np.array([s for _, s in pairs], dtype=int),
+        'eq_order': eq_order, 'bean_rows': bean_rows, 'symmetry_rows': symmetry_rows,
+        'warm_start': new_warm_start(n_vars, len(b_ub) + n_pairs),   # 跨年份复用的热启动状态（每次实验开始时清空）
+    }
+
+
+# 用本年系数更新模板的目标函数、产量系数与销售量上界（原地修改，与种植历史无关）
+def set_template_coefficients(template, coef):
+    area_f, area_c, area_s = template['area_f'], template['area_c'], template['area_s']
+    pair_c, pair_s = template['pair_c'], template['pair_s']
+    n_area, n_pairs = template['n_area'], template['n_pairs']
+
+    # 目标函数：销售额 - 种植成本
+    revenue = coef['sale_price'][pair_c, pair_s] * coef['row_count'][pair_c, pair_s]
+    obj = template['obj']
+    obj[:n_area] = -coef['cost'][area_f, area_c, area_s]
+    obj[n_area:n_area + n_pairs] = revenue
+    obj[n_area + n_pairs:n_area + 2 * n_pairs] = revenue * coef['beyond_price_ratio']
+
+    # 产量系数
+    eq_values = np.concatenate([-coef['yield'][area_f, area_c, area_s], np.ones(2 * n_pairs)])
+    template['A_eq'].data[:] = eq_values[template['eq_order']]
+
+    # 未超出部分上界为预期销售量
+    ub = template['ub']
+    ub[n_area:n_area + n_pairs] = coef['expected_sales'][pair_c, pair_s]
+    ub[n_area + n_pairs:n_area + 2 * n_pairs] = np.inf
+    return template
+
+
+# 用本年系数与种植历史更新模板（原地修改）
+def update_model_template(template, enc, coef, solved_decision_vars, planting_2023, year):
+    area_p, area_c, area_s = template['area_p'], template['area_c'], template['area_s']
+    set_template_coefficients(template, coef)
+
+    # 豆类约束右端项
+    b_ub = template['b_ub']
+    needs_beans = set(plots_needing_beans(enc, solved_decision_vars, planting_2023, year))
+    for p, row in template['bean_rows'].items():
+        b_ub[row] = -min_bean_area if p in needs_beans else 0
+
+    # 上界：轮作规则固定为 0 的面积变量上界为 0
+    fixed = fixed_zero_mask(enc, coef, solved_decision_vars, planting_2023, year)
+    template['ub'][:template['n_area']] = np.where(fixed[area_p, area_c, area_s], 0, np.inf)
+
+    # 对称性约束只在两块地本年的可种范围与豆类要求都相同时生效
+    for p, q, row in template['symmetry_rows']:
+        same = (fixed[p] == fixed[q]).all() and ((p in needs_beans) == (q in needs_beans))
+        b_ub[row] = 0 if same else np.inf
+    template['year'] = year
+    return template
+
+
+# 构建单年稀疏模型（目标为最大化）
+def build_sparse_model(enc, coef, solved_decision_vars, planting_2023, year):
+    return update_model_template(build_model_template(enc), enc, coef, solved_decision_vars, planting_2023, year)
+
+
+# 剪枝：去掉上界为 0 的面积变量（轮作历史固定为 0 的组合）与恒成立的约束行
+# 地块类型不能种植的作物本来就不在 fields 中，不会产生变量
+def prune_model(model):
+    n_area = model['n_area']
+    keep_cols = np.flatnonzero((model['ub'] > 0) | (np.arange(len(model['ub'])) >= n_area))
+    A_ub = model['A_ub'][:, keep_cols]
+    # 系数全部非正且右端项非负的行恒成立（不需要的豆类约束、变量全被剪掉的面积约束），右端项为 inf 的行不生效
+    redundant = ((A_ub.max(axis=1).toarray().ravel() <= 0) & (model['b_ub'] >= 0)) | np.isinf(model['b_ub'])
+    keep_rows = np.flatnonzero(~redundant)
+    A_ub = A_ub[keep_rows]
+    # 只以非负系数出现在 <= 约束中、目标系数为 0 的 0-1 变量取 0 不会更差（如第一季面积被剪掉后的 z），一并去掉
+    dominated = ((model['integrality'][keep_cols] == 1) & (model['obj'][keep_cols] == 0)
+                 & (A_ub.min(axis=0).toarray().ravel() >= 0))
+    A_ub = A_ub[:, ~dominated]
+    keep_cols = keep_cols[~dominated]
+    kept_area = keep_cols[keep_cols < n_area]
+    pruned = dict(model)
+    pruned.update({
+        'obj': model['obj'][keep_cols], 'A_ub': A_ub, 'b_ub': model['b_ub'][keep_rows],
+        'A_eq': model['A_eq'][:, keep_cols], 'lb': model['lb'][keep_cols], 'ub': model['ub'][keep_cols],
+        'integrality': model['integrality'][keep_cols],
+        'area_keys': [model['area_keys'][j] for j in kept_area], 'n_area': len(kept_area),
+        'col_ids': keep_cols, 'row_ids': np.concatenate([keep_rows, len(model['b_ub']) + np.arange(len(model['b_eq']))]),
+    })
+    return pruned
+
+
+# 模型规模：变量数（其中 0-1 变量数）、约束行数、非零系数个数
+def model_size(model):
+    return {
+        'variables': model['A_eq'].shape[1],
+        'binaries': int(model['integrality'].sum()),
+        'constraints': model['A_ub'].shape[0] + model['A_eq'].shape[0],
+        'nonzeros': model['A_ub'].nnz + model['A_eq'].nnz,
+    }
+
+
+# 求解稀疏模型（默认先剪枝），返回 [地块, 作物, 季次] 面积数组与目标值
+# solver_options 传给 solver.solve_highs：time_limit、mip_gap、threads、verbose、engine
+# warm_start 为真时使用模型模板中保存的上一次解与基热启动，每次求解的迭代次数与用时记在 model['warm_start']['log']
+# 超时则返回当前最好的可行解
+def solve_sparse_model(model, enc, prune=True, warm_start=True, **solver_options):
+    if prune:
+        model = prune_model(model)
+    result = solve_highs(model, warm_start=model.get('warm_start'), use_warm_start=warm_start, **solver_options)
+    if result['x'] is None:
+        raise RuntimeError(f"{model['year']}年稀疏模型求解失败: {result['status']}")
+    solution = np.zeros((len(enc['plots']), len(enc['crops']), len(enc['seasons'])))
+    keys = np.array(model['area_keys'], dtype=int).reshape(-1, 3)
+    solution[keys[:, 0], keys[:, 1], keys[:, 2]] = result['x'][:model['n_area']]
+    return solution, result['objective']